@@ -88,6 +88,25 @@ DATABASES = {
 }
 
 
+# Cache
+# Compartilhado entre os processos (web e cron) quando há Redis; as versões
+# da tabela de equipe do painel dependem disso para valer em todos eles.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -14,8 +14,14 @@ from .models import (
     BancoDeHoras,
     SolicitacaoHorario,
     Feriado,
+    JornadaDiaria,
+    ExecucaoProcessamento,
 )
+from .execucoes import ORCAMENTO_SEGUNDOS
+from django.db.models import Avg, Count, Max
+from django.db.models.functions import TruncDate
 from django.utils import timezone
+from datetime import timedelta
 
 
 # --- INLINE PARA ESCALAS DO FUNCIONÁRIO ---
@@ -50,7 +56,7 @@ class FuncionarioAdmin(admin.ModelAdmin):
             {"fields": ("contato_emergencia_nome", "contato_emergencia_telefone")},
         ),
         ("Datas de Contrato", {"fields": ("data_contratacao", "data_demissao")}),
-        ("Documentos", {"fields": ("cpf", "rg")}),
+        ("Documentos", {"fields": ("cpf", "rg", "pis")}),
         (
             "Endereço",
             {
@@ -191,11 +197,37 @@ class BancoDeHorasAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(JornadaDiaria)
+class JornadaDiariaAdmin(admin.ModelAdmin):
+    list_display = (
+        "funcionario",
+        "data",
+        "primeira_entrada",
+        "ultima_saida",
+        "minutos_trabalhados",
+        "minutos_esperados",
+        "dia_de_trabalho",
+        "feriado",
+        "abonado",
+    )
+    list_filter = ("data", "dia_de_trabalho", "feriado", "abonado")
+    search_fields = ("funcionario__nome_completo",)
+    list_select_related = ("funcionario",)
+
+    # Gerada pelo processamento de pontos, assim como o Banco de Horas
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(SolicitacaoHorario)
 class SolicitacaoHorarioAdmin(admin.ModelAdmin):
     list_display = (
         "funcionario",
         "data_hora_ponto",
+        "tipo_ponto",
         "status",
         "analisado_por",
         "data_analise",
@@ -205,6 +237,7 @@ class SolicitacaoHorarioAdmin(admin.ModelAdmin):
     readonly_fields = (
         "funcionario",
         "data_hora_ponto",
+        "tipo_ponto",
         "motivo",
         "analisado_por",
         "data_analise",
@@ -218,3 +251,62 @@ class FeriadoAdmin(admin.ModelAdmin):
     list_filter = ("recorrente",)
     search_fields = ("nome",)
 
+
+@admin.register(ExecucaoProcessamento)
+class ExecucaoProcessamentoAdmin(admin.ModelAdmin):
+    list_display = (
+        "iniciado_em",
+        "modo",
+        "status",
+        "data_inicial",
+        "data_final",
+        "funcionarios_verificados",
+        "saldos_gravados",
+        "saldos_removidos",
+        "segundos_carga",
+        "segundos_calculo",
+        "segundos_gravacao",
+        "segundos_total",
+        "consumo_orcamento",
+    )
+    list_filter = ("modo", "status")
+    date_hierarchy = "iniciado_em"
+    readonly_fields = [field.name for field in ExecucaoProcessamento._meta.fields]
+
+    # Gerado pelo processar_pontos; o admin serve só para acompanhamento
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="% do cron", ordering="segundos_total")
+    def consumo_orcamento(self, obj):
+        return f"{obj.segundos_total * 100 / ORCAMENTO_SEGUNDOS:.0f}%"
+
+    def changelist_view(self, request, extra_context=None):
+        # Tendência diária dos últimos 30 dias, para ver o tempo crescer com o quadro.
+        tendencia = (
+            ExecucaoProcessamento.objects.filter(
+                status="CONCLUIDO",
+                iniciado_em__gte=timezone.now() - timedelta(days=30),
+            )
+            .annotate(dia=TruncDate("iniciado_em"))
+            .values("dia")
+            .annotate(
+                execucoes=Count("id"),
+                media_segundos=Avg("segundos_total"),
+                max_segundos=Max("segundos_total"),
+                media_funcionarios=Avg("funcionarios_verificados"),
+                media_carga=Avg("segundos_carga"),
+                media_calculo=Avg("segundos_calculo"),
+                media_gravacao=Avg("segundos_gravacao"),
+            )
+            .order_by("-dia")
+        )
+        for linha in tendencia:
+            linha["consumo_max"] = linha["max_segundos"] * 100 / ORCAMENTO_SEGUNDOS
+        extra_context = extra_context or {}
+        extra_context["tendencia"] = tendencia
+        extra_context["orcamento_segundos"] = ORCAMENTO_SEGUNDOS
+        return super().changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,56 @@
+# funcionarios/afd.py
+"""
+Leitura de AFD (Arquivo Fonte de Dados) de relógios de ponto.
+
+O arquivo é lido linha a linha e só as marcações viram tuplas
+`(nsr, campo, documento, timestamp)`, onde `campo` é "pis" ou "cpf". Os
+outros registros (cabeçalho, empresa, ajustes, trailer) são ignorados.
+
+- Portaria 1510: marcação tipo "3" com 34 posições, com data e hora locais
+  (DDMMAAAA HHMM) e o PIS do funcionário.
+- Portaria 671: marcação tipo "3" (REP-C, 50 posições) ou "7" (REP-P, 137
+  posições), com data e hora ISO com fuso (AAAA-MM-DDThh:mm:00-0300) e CPF.
+
+O AFD não diz o tipo da marcação: cabe a quem importa decidir.
+"""
+from datetime import datetime
+
+from django.utils import timezone
+
+
+def ler_afd(linhas, ao_invalidar=None):
+    """
+    Gera as marcações das `linhas` do arquivo, sem guardá-las. Marcações
+    malformadas são puladas, com `ao_invalidar(numero_da_linha)`.
+    """
+    for numero, linha in enumerate(linhas, start=1):
+        linha = linha.rstrip("\r\n")
+        if len(linha) < 10 or linha[9] not in "37":
+            continue
+        try:
+            yield _marcacao(linha)
+        except ValueError:
+            if ao_invalidar:
+                ao_invalidar(numero)
+
+
+def _marcacao(linha):
+    nsr = int(linha[:9])
+    if linha[9] == "3" and len(linha) == 34:
+        momento = datetime.strptime(linha[10:22], "%d%m%Y%H%M")
+        return nsr, "pis", _documento(linha[22:34]), timezone.make_aware(momento)
+    if len(linha) >= 46:
+        momento = datetime.strptime(linha[10:34], "%Y-%m-%dT%H:%M:%S%z")
+        return nsr, "cpf", _documento(linha[34:46]), momento
+    raise ValueError(linha)
+
+
+def _documento(valor):
+    if not valor.isdigit():
+        raise ValueError(valor)
+    # Os campos têm 12 posições, com zero à esquerda; PIS e CPF têm 11 dígitos.
+    return valor[-11:]
+
+
+def somente_digitos(valor):
+    return "".join(caractere for caractere in valor or "" if caractere.isdigit())
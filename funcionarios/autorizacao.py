@@ -0,0 +1,100 @@
+# funcionarios/autorizacao.py
+"""
+Papel do usuário e ids da sua equipe, resolvidos uma vez por requisição.
+
+O resultado fica guardado na requisição e na sessão, junto com a versão de
+autorização vigente quando foi calculado. A versão (no cache) muda quando um
+funcionário troca de supervisor ou de usuário e quando os grupos de um usuário
+mudam; na requisição seguinte, cada sessão recalcula o seu. Com a versão em
+dia, a autorização custa uma leitura do cache e nenhuma query.
+"""
+import time
+from dataclasses import dataclass
+
+from django.core.cache import cache
+
+from .models import Funcionario
+
+CHAVE_VERSAO = "autorizacao:versao"
+
+CHAVE_SESSAO = "autorizacao"
+
+GRUPO_ANALISTA_RH = "Analista de RH"
+
+
+@dataclass(frozen=True)
+class Autorizacao:
+    funcionario_id: int = None
+    analista_rh: bool = False
+    subordinados: frozenset = frozenset()
+
+    @property
+    def supervisor(self):
+        return bool(self.subordinados)
+
+    def pode_gerir(self, funcionario_id):
+        """Pode aprovar solicitações do funcionário (RH ou supervisor direto)."""
+        return self.analista_rh or funcionario_id in self.subordinados
+
+    def pode_ver(self, funcionario_id):
+        """Pode ver o relatório do funcionário (inclusive o próprio)."""
+        return self.pode_gerir(funcionario_id) or funcionario_id == self.funcionario_id
+
+
+def _versao():
+    # Um valor inédito quando a chave falta invalida todas as sessões.
+    return cache.get_or_set(CHAVE_VERSAO, time.time_ns, timeout=None)
+
+
+def _calcular(user):
+    funcionario_id = (
+        Funcionario.objects.filter(user=user).values_list("pk", flat=True).first()
+    )
+    subordinados = frozenset()
+    if funcionario_id:
+        subordinados = frozenset(
+            Funcionario.objects.filter(supervisor_id=funcionario_id).values_list("pk", flat=True)
+        )
+    return Autorizacao(
+        funcionario_id=funcionario_id,
+        analista_rh=user.groups.filter(name=GRUPO_ANALISTA_RH).exists(),
+        subordinados=subordinados,
+    )
+
+
+def autorizacao(request):
+    """Autorização do usuário da requisição."""
+    if hasattr(request, "_autorizacao"):
+        return request._autorizacao
+    user = request.user
+    if not user.is_authenticated:
+        request._autorizacao = Autorizacao()
+        return request._autorizacao
+
+    versao = _versao()
+    guardada = request.session.get(CHAVE_SESSAO)
+    if guardada and guardada["versao"] == versao and guardada["user_id"] == user.pk:
+        resultado = Autorizacao(
+            funcionario_id=guardada["funcionario_id"],
+            analista_rh=guardada["analista_rh"],
+            subordinados=frozenset(guardada["subordinados"]),
+        )
+    else:
+        resultado = _calcular(user)
+        request.session[CHAVE_SESSAO] = {
+            "versao": versao,
+            "user_id": user.pk,
+            "funcionario_id": resultado.funcionario_id,
+            "analista_rh": resultado.analista_rh,
+            "subordinados": sorted(resultado.subordinados),
+        }
+    request._autorizacao = resultado
+    return resultado
+
+
+def invalidar_autorizacoes():
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        # Sem versão no cache, a próxima leitura já cria uma nova.
+        pass
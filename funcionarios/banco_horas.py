@@ -0,0 +1,156 @@
+# funcionarios/banco_horas.py
+"""
+Saldo do banco de horas com checkpoints periódicos (SaldoBancoHoras).
+
+O saldo até uma data é o último checkpoint anterior a ela mais a soma dos
+poucos registros de BancoDeHoras posteriores ao checkpoint, em vez de somar
+todo o histórico do funcionário. O processamento cria os checkpoints dos
+períodos já fechados; qualquer alteração em um registro antigo apaga os
+checkpoints a partir da data alterada, que são refeitos na execução seguinte.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import DateField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Funcionario, BancoDeHoras, SaldoBancoHoras
+from .escalas import ids_de
+
+# Tamanho do período de cada checkpoint, em meses (1 = mensal, 3 = trimestral...).
+MESES_POR_CHECKPOINT = getattr(settings, "BANCO_HORAS_MESES_POR_CHECKPOINT", 1)
+
+
+def periodo_de(data):
+    """Retorna (primeiro dia, último dia) do período de checkpoint que contém a data."""
+    primeiro_mes = (data.year * 12 + data.month - 1) // MESES_POR_CHECKPOINT * MESES_POR_CHECKPOINT
+    ultimo_mes = primeiro_mes + MESES_POR_CHECKPOINT - 1
+    ano_inicio, mes_inicio = divmod(primeiro_mes, 12)
+    ano_fim, mes_fim = divmod(ultimo_mes, 12)
+    return (
+        date(ano_inicio, mes_inicio + 1, 1),
+        date(ano_fim, mes_fim + 1, calendar.monthrange(ano_fim, mes_fim + 1)[1]),
+    )
+
+
+def _ultimo_checkpoint(referencia="pk", data=None):
+    checkpoints = SaldoBancoHoras.objects.filter(funcionario=OuterRef(referencia))
+    if data is not None:
+        checkpoints = checkpoints.filter(data_corte__lte=data)
+    return checkpoints.order_by("-data_corte")
+
+
+def _data_corte(checkpoints):
+    # Sem checkpoint, todo o histórico entra na soma.
+    return Coalesce(
+        Subquery(checkpoints.values("data_corte")[:1]),
+        Value(date.min),
+        output_field=DateField(),
+    )
+
+
+def _com_checkpoint(funcionarios, data=None):
+    """Anota em cada funcionário a data de corte e o saldo do último checkpoint."""
+    checkpoints = _ultimo_checkpoint(data=data)
+    return Funcionario.objects.filter(pk__in=ids_de(funcionarios)).annotate(
+        corte=_data_corte(checkpoints),
+        base=Coalesce(Subquery(checkpoints.values("minutos")[:1]), 0),
+    )
+
+
+def saldos_em(funcionarios, data=None):
+    """
+    Saldo de vários funcionários (queryset, instâncias ou ids) até a data,
+    inclusive; sem data, o saldo atual. Uma única query.
+    Retorna {funcionario_id: minutos}.
+    """
+    cauda = BancoDeHoras.objects.filter(
+        funcionario=OuterRef("pk"), data__gt=OuterRef("corte")
+    )
+    if data is not None:
+        cauda = cauda.filter(data__lte=data)
+    cauda = cauda.values("funcionario").annotate(total=Sum("minutos")).values("total")
+
+    linhas = _com_checkpoint(funcionarios, data).annotate(
+        cauda=Coalesce(Subquery(cauda), 0)
+    )
+    return {pk: base + resto for pk, base, resto in linhas.values_list("pk", "base", "cauda")}
+
+
+def saldo_em(funcionario, data=None):
+    """Saldo (em minutos) de um funcionário até a data, inclusive; sem data, o saldo atual."""
+    funcionario_id = getattr(funcionario, "pk", funcionario)
+    return saldos_em([funcionario_id], data).get(funcionario_id, 0)
+
+
+def invalidar_checkpoints(funcionario_ids, a_partir_de):
+    """Apaga os checkpoints que incluem registros alterados a partir da data."""
+    SaldoBancoHoras.objects.filter(
+        funcionario_id__in=funcionario_ids, data_corte__gte=a_partir_de
+    ).delete()
+
+
+def atualizar_checkpoints(ate=None, funcionarios=None):
+    """
+    Cria os checkpoints dos períodos fechados até `ate` (padrão: ontem) que
+    ainda não existem, partindo do último checkpoint de cada funcionário.
+    Retorna quantos checkpoints foram gravados.
+    """
+    if ate is None:
+        ate = timezone.localdate() - timedelta(days=1)
+    inicio_periodo, fim_periodo = periodo_de(ate)
+    corte_maximo = fim_periodo if fim_periodo == ate else inicio_periodo - timedelta(days=1)
+
+    if funcionarios is None:
+        funcionarios = Funcionario.objects.all()
+    funcionarios = ids_de(funcionarios)
+    ultimos = {
+        pk: (corte, base)
+        for pk, corte, base in _com_checkpoint(funcionarios).values_list("pk", "corte", "base")
+    }
+
+    # Somas mensais de tudo o que ainda não está em um checkpoint.
+    por_mes = defaultdict(dict)
+    for funcionario_id, mes, total in (
+        BancoDeHoras.objects.filter(
+            funcionario_id__in=funcionarios,
+            data__gt=_data_corte(_ultimo_checkpoint("funcionario")),
+            data__lte=corte_maximo,
+        )
+        .annotate(mes=TruncMonth("data"))
+        .values_list("funcionario_id", "mes")
+        .annotate(total=Sum("minutos"))
+    ):
+        por_mes[funcionario_id][mes] = total
+
+    novos = []
+    for funcionario_id, meses in por_mes.items():
+        corte, saldo = ultimos[funcionario_id]
+        if corte == date.min:
+            # Primeiro checkpoint: começa no período do registro mais antigo.
+            inicio = periodo_de(min(meses))[0]
+        else:
+            inicio = corte + timedelta(days=1)
+        while inicio <= corte_maximo:
+            primeiro_dia, ultimo_dia = periodo_de(inicio)
+            saldo += sum(
+                total for mes, total in meses.items() if primeiro_dia <= mes <= ultimo_dia
+            )
+            novos.append(
+                SaldoBancoHoras(
+                    funcionario_id=funcionario_id, data_corte=ultimo_dia, minutos=saldo
+                )
+            )
+            inicio = ultimo_dia + timedelta(days=1)
+
+    SaldoBancoHoras.objects.bulk_create(
+        novos,
+        update_conflicts=True,
+        unique_fields=["funcionario", "data_corte"],
+        update_fields=["minutos", "atualizado_em"],
+        batch_size=1000,
+    )
+    return len(novos)
@@ -0,0 +1,660 @@
+# funcionarios/batidas.py
+"""
+Registro de uma batida de ponto, com as validações do dia.
+
+A validação não consulta as marcações: lê o EstadoPontoDia do funcionário na
+data local (entrada e saída feitas, pausas programadas, última marcação e a
+janela da escala), travado com SELECT ... FOR UPDATE na mesma transação que
+grava o RegistroPonto. Batidas simultâneas do mesmo funcionário esperam uma
+pela outra e validam sobre o estado já atualizado. Numa batida comum são
+quatro comandos: travar o estado, atualizar o status operacional do
+funcionário, inserir o registro e atualizar o estado. O funcionário não é
+travado à parte (a trava do estado já põe as batidas dele em fila), e os
+três comandos de escrita vão para tabelas diferentes, então não há como
+juntá-los sem SQL próprio de cada banco.
+
+O estado é montado a partir dos registros na primeira batida do dia, e a
+janela da escala só na primeira ENTRADA/SAIDA. Registros gravados por fora
+(admin, importações) descartam o estado do dia, que é remontado na batida
+seguinte; mudanças de escala descartam só a janela.
+
+Clientes que repetem pedidos (duplo clique, nova tentativa depois de um
+timeout) mandam uma chave de idempotência: a chave é gravada na mesma
+transação que a batida, e a repetição devolve a batida já gravada.
+
+Lotes (relógios de ponto físicos, batidas guardadas pela página sem
+conexão) passam pelas mesmas regras com registrar_lote, em número fixo de
+queries por lote: estados, funcionários, marcações recentes, regras de pausa,
+escalas e solicitações aprovadas são carregados de uma vez, e registros,
+estados e status são gravados em lote. Como o estado só descreve o fim do
+dia, uma batida do lote precisa ser posterior às marcações já gravadas do
+funcionário naquele dia, e a linha do tempo da jornada (desde a véspera)
+confere que cada volta fecha um intervalo aberto do mesmo tipo.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from functools import cached_property
+from operator import attrgetter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .eventos import publicar_batida, topicos_do_funcionario
+from .escalas import resolve_range
+from .models import (
+    ChaveIdempotencia,
+    EstadoPontoDia,
+    Funcionario,
+    RegistroPonto,
+    RegraDePausa,
+    SolicitacaoHorario,
+)
+from .painel import invalidar_tabela_equipe, status_pela_marcacao
+from .ponto_timeline import FECHAMENTOS, montar_timeline
+from .processamento import marcar_dias_pendentes
+
+# Tolerância, antes do início e depois do fim da jornada, para ENTRADA/SAIDA
+# sem solicitação de horário aprovada.
+TOLERANCIA_JORNADA = timedelta(hours=2)
+
+TIPOS_VALIDOS = dict(RegistroPonto.TIPO_REGISTRO_CHOICES)
+
+ROTULOS_STATUS = dict(Funcionario.STATUS_OPERACIONAL_CHOICES)
+
+# Depois disso a chave pode ser reaproveitada (e é apagada pelo
+# limpar_chaves_idempotencia).
+VALIDADE_CHAVE_IDEMPOTENCIA = timedelta(hours=24)
+
+# Diferença aceita entre o relógio de quem envia um lote e o do servidor.
+TOLERANCIA_FUTURO = timedelta(minutes=5)
+
+# O horário de uma batida guardada sem conexão vem do navegador. Até esse
+# atraso ela é gravada direto (marcada como reenviada); mais antiga, vira
+# solicitação para o supervisor aprovar.
+ATRASO_MAXIMO_FILA = timedelta(minutes=15)
+
+CAMPOS_ESTADO = [
+    "tem_entrada",
+    "tem_saida",
+    "pausas",
+    "ultimo_tipo",
+    "escala_resolvida",
+    "dia_de_trabalho",
+    "inicio_jornada",
+    "fim_jornada",
+]
+
+
+class BatidaRecusada(Exception):
+    """A batida não passou na validação; a mensagem vai para o funcionário."""
+
+    def __init__(self, mensagem, fora_do_horario=False):
+        super().__init__(mensagem)
+        self.fora_do_horario = fora_do_horario
+
+
+def registrar_batida(funcionario, tipo, agora=None):
+    """
+    Valida e grava a marcação `tipo` do funcionário em `agora`, atualizando o
+    estado do dia e o status operacional. Depois do commit, a batida é
+    publicada para os painéis. Levanta BatidaRecusada se não for permitida.
+    """
+    agora = agora or timezone.now()
+    if tipo not in TIPOS_VALIDOS:
+        raise BatidaRecusada("Tipo de registro inválido.")
+
+    with transaction.atomic():
+        estado = _estado_travado(funcionario, timezone.localtime(agora).date())
+        resolvida = estado.escala_resolvida
+        try:
+            regra_pausa = _validar(funcionario, estado, tipo, agora)
+        except BatidaRecusada as erro:
+            recusa = erro
+            # O estado montado, e a janela de escala resolvida, ficam para a
+            # próxima tentativa.
+            if estado.escala_resolvida != resolvida:
+                estado.save()
+        else:
+            return _gravar(funcionario, estado, tipo, agora, regra_pausa)
+    raise recusa
+
+
+def registrar_batida_idempotente(funcionario, tipo, chave, agora=None):
+    """
+    Como registrar_batida, mas um pedido repetido com a mesma `chave` devolve
+    a batida já gravada. Retorna (registro, repetida); o registro é None se a
+    chave foi usada por uma batida da fila enviada para aprovação.
+    """
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        try:
+            # Um pedido concorrente com a mesma chave espera aqui, no índice
+            # único, até a transação deste terminar.
+            with transaction.atomic():
+                pedido = ChaveIdempotencia.objects.create(
+                    funcionario=funcionario, chave=chave, criada_em=agora
+                )
+        except IntegrityError:
+            anterior = ChaveIdempotencia.objects.select_related("registro").get(
+                funcionario=funcionario, chave=chave
+            )
+            if anterior.criada_em >= agora - VALIDADE_CHAVE_IDEMPOTENCIA:
+                return anterior.registro, True
+            # Chave vencida ainda não limpa: vale como nova.
+            anterior.delete()
+            pedido = ChaveIdempotencia.objects.create(
+                funcionario=funcionario, chave=chave, criada_em=agora
+            )
+        # Uma recusa desfaz também a chave, e a nova tentativa valida de novo.
+        pedido.registro = registrar_batida(funcionario, tipo, agora)
+        pedido.save(update_fields=["registro"])
+    return pedido.registro, False
+
+
+@dataclass
+class ResultadoLote:
+    situacao: str  # "gravada", "duplicada", "recusada" ou "solicitada"
+    mensagem: str = ""
+    registro: RegistroPonto = None
+
+
+def registrar_lote(batidas, agora=None, origem="RELOGIO"):
+    """
+    Valida e grava um lote de batidas `(funcionario_id, tipo, timestamp)`
+    com as regras de registrar_batida, aplicadas em ordem de horário. Uma
+    batida igual a um registro existente (repetição do envio) é "duplicada".
+    Os registros levam a `origem` e `agora` como horário de recebimento.
+    Retorna um ResultadoLote por batida, na ordem recebida.
+    """
+    agora = agora or timezone.now()
+    resultados = [None] * len(batidas)
+    pendentes = []
+    for indice, (funcionario_id, tipo, momento) in enumerate(batidas):
+        if tipo not in TIPOS_VALIDOS:
+            resultados[indice] = ResultadoLote("recusada", "Tipo de registro inválido.")
+        elif momento > agora + TOLERANCIA_FUTURO:
+            resultados[indice] = ResultadoLote("recusada", "Horário da batida no futuro.")
+        else:
+            pendentes.append((momento, indice, funcionario_id, tipo))
+    if not pendentes:
+        return resultados
+    pendentes.sort(key=lambda pendente: pendente[:2])
+    pares = {
+        (funcionario_id, timezone.localtime(momento).date())
+        for momento, _, funcionario_id, _ in pendentes
+    }
+    ids = {funcionario_id for funcionario_id, _ in pares}
+
+    with transaction.atomic():
+        # Mesma ordem de travas da batida avulsa: estados do dia, depois o
+        # funcionário; dentro de cada tabela, em ordem de chave.
+        estados = _estados_travados(pares)
+        funcionarios = {
+            funcionario.pk: funcionario
+            for funcionario in Funcionario.objects.select_for_update().filter(pk__in=ids).order_by("pk")
+        }
+        status_lidos = {pk: funcionario.status_operacional for pk, funcionario in funcionarios.items()}
+        datas = [data for _, data in pares]
+        # Marcações de cada funcionário nos dias do lote e nas vésperas (para
+        # jornadas que cruzam a meia-noite), em ordem de horário.
+        marcacoes = defaultdict(list)
+        for registro in _registros_dos_dias(pares, vespera=True).only("funcionario", "tipo", "timestamp"):
+            marcacoes[registro.funcionario_id].append(registro)
+        existentes = {
+            (registro.funcionario_id, registro.tipo, registro.timestamp)
+            for registros in marcacoes.values()
+            for registro in registros
+        }
+        consultas = _ConsultasDoLote(funcionarios.values(), min(datas), max(datas))
+
+        hoje = timezone.localdate()
+        novos, ultimas = [], {}
+        for momento, indice, funcionario_id, tipo in pendentes:
+            funcionario = funcionarios.get(funcionario_id)
+            if funcionario is None:
+                resultados[indice] = ResultadoLote("recusada", "Funcionário não encontrado.")
+                continue
+            if (funcionario_id, tipo, momento) in existentes:
+                resultados[indice] = ResultadoLote("duplicada")
+                continue
+            registro = RegistroPonto(
+                funcionario=funcionario, tipo=tipo, timestamp=momento, origem=origem, recebido_em=agora
+            )
+            data = timezone.localtime(momento).date()
+            # Só a véspera e o dia da batida contam: marcações de dias
+            # seguintes não impedem o relógio de enviar um dia atrasado.
+            registros = marcacoes[funcionario_id]
+            anteriores = registros[
+                bisect_left(registros, _meia_noite(data - timedelta(days=1)), key=_horario):
+                bisect_left(registros, _meia_noite(data + timedelta(days=1)), key=_horario)
+            ]
+            estado = estados[(funcionario_id, data)]
+            # O status do funcionário é o de agora. Numa batida de dia
+            # anterior, vale o status em que aquele dia terminou.
+            if data == hoje:
+                status = funcionario.status_operacional
+            else:
+                status = status_pela_marcacao(estado.ultimo_tipo)
+            try:
+                if anteriores and momento <= anteriores[-1].timestamp:
+                    raise BatidaRecusada("Já existe uma marcação posterior a esta.")
+                regra_pausa = _validar(funcionario, estado, tipo, momento, consultas, status)
+                if _fecha_sem_abertura(anteriores, registro):
+                    raise BatidaRecusada("Não há intervalo aberto que esta marcação possa fechar.")
+            except BatidaRecusada as recusa:
+                resultados[indice] = ResultadoLote("recusada", str(recusa))
+                continue
+            _aplicar(estado, tipo)
+            if data == hoje:
+                # Só batidas de hoje mudam o status e os painéis; como toda
+                # batida aceita é posterior às gravadas no dia, esta é a mais
+                # recente.
+                funcionario.status_operacional = status_pela_marcacao(tipo)
+                ultimas[funcionario_id] = (registro, regra_pausa)
+            insort(registros, registro, key=_horario)
+            existentes.add((funcionario_id, tipo, momento))
+            novos.append(registro)
+            resultados[indice] = ResultadoLote("gravada", registro=registro)
+
+        # Nada disso passa pelos signals: estado do dia, status, fila de
+        # reprocessamento e painéis são atualizados aqui.
+        RegistroPonto.objects.bulk_create(novos, batch_size=1000)
+        EstadoPontoDia.objects.bulk_update(estados.values(), CAMPOS_ESTADO, batch_size=1000)
+        Funcionario.objects.bulk_update(
+            [f for pk, f in funcionarios.items() if f.status_operacional != status_lidos[pk]],
+            ["status_operacional"],
+            batch_size=1000,
+        )
+        marcar_dias_pendentes(
+            (registro.funcionario_id, data)
+            for registro in novos
+            if (data := timezone.localtime(registro.timestamp).date()) < hoje
+        )
+        if novos:
+            topicos = {
+                topico
+                for registro in novos
+                for topico in topicos_do_funcionario(registro.funcionario)
+            }
+            transaction.on_commit(lambda: invalidar_tabela_equipe(*topicos))
+        # Para os painéis basta a última batida de cada funcionário.
+        for registro, regra_pausa in ultimas.values():
+            transaction.on_commit(_publicacao(registro, regra_pausa), robust=True)
+    return resultados
+
+
+def registrar_fila(funcionario, batidas, agora=None):
+    """
+    Grava juntas, com registrar_lote, as batidas `(tipo, timestamp, chave)`
+    que a página guardou sem conexão, com o horário original e origem
+    FILA_OFFLINE. Uma chave já usada (o pedido original chegou, a resposta
+    não) devolve a batida dela como "duplicada". Batidas com mais de
+    ATRASO_MAXIMO_FILA viram SolicitacaoHorario pendente ("solicitada").
+    Retorna um ResultadoLote por batida, na ordem recebida.
+    """
+    agora = agora or timezone.now()
+    resultados = [None] * len(batidas)
+    with transaction.atomic():
+        usadas = {
+            pedido.chave: pedido.registro
+            for pedido in ChaveIdempotencia.objects.select_related("registro").filter(
+                funcionario=funcionario,
+                chave__in=[chave for _, _, chave in batidas],
+                criada_em__gte=agora - VALIDADE_CHAVE_IDEMPOTENCIA,
+            )
+        }
+        lote, posicoes, solicitacoes, pedidos = [], [], [], []
+        for indice, (tipo, momento, chave) in enumerate(batidas):
+            if chave in usadas:
+                resultados[indice] = ResultadoLote("duplicada", registro=usadas[chave])
+            elif tipo in TIPOS_VALIDOS and momento < agora - ATRASO_MAXIMO_FILA:
+                usadas[chave] = None
+                local = timezone.localtime(momento)
+                solicitacoes.append(
+                    SolicitacaoHorario(
+                        funcionario=funcionario,
+                        data_hora_ponto=momento,
+                        tipo_ponto=tipo,
+                        motivo=(
+                            f"Batida ({tipo}) feita sem conexão em {local:%d/%m/%Y %H:%M}, "
+                            f"reenviada em {timezone.localtime(agora):%d/%m/%Y %H:%M}."
+                        ),
+                    )
+                )
+                # A chave fica sem registro: o reenvio não duplica a solicitação.
+                pedidos.append(ChaveIdempotencia(funcionario=funcionario, chave=chave, criada_em=agora))
+                resultados[indice] = ResultadoLote(
+                    "solicitada", "Batida antiga enviada ao supervisor para aprovação."
+                )
+            else:
+                usadas[chave] = None  # a mesma chave repetida no envio
+                lote.append((funcionario.pk, tipo, momento))
+                posicoes.append((indice, chave))
+
+        # Salvas uma a uma: os signals mantêm os contadores de pendências.
+        for solicitacao in solicitacoes:
+            solicitacao.save()
+        gravacao = registrar_lote(lote, agora, origem="FILA_OFFLINE")
+        for (indice, chave), resultado in zip(posicoes, gravacao):
+            resultados[indice] = resultado
+            if resultado.registro:
+                pedidos.append(
+                    ChaveIdempotencia(
+                        funcionario=funcionario, chave=chave, registro=resultado.registro, criada_em=agora
+                    )
+                )
+        # Uma chave vencida com o mesmo valor fica como está: não vale mais.
+        ChaveIdempotencia.objects.bulk_create(pedidos, ignore_conflicts=True)
+    return resultados
+
+
+def _fecha_sem_abertura(anteriores, registro):
+    """
+    Pela linha do tempo da jornada (desde a última ENTRADA), a marcação é um
+    fechamento sem abertura do mesmo tipo, como VOLTA_ALMOCO depois de
+    SAIDA_PAUSA.
+    """
+    if registro.tipo not in FECHAMENTOS:
+        return False
+    for inicio in range(len(anteriores) - 1, -1, -1):
+        if anteriores[inicio].tipo == "ENTRADA":
+            timeline = montar_timeline(anteriores[inicio:] + [registro])
+            return any(marcacao is registro for marcacao, _ in timeline.anomalias)
+    # Sem a entrada à vista, ficam valendo só as regras do estado.
+    return False
+
+
+def _publicacao(registro, regra_pausa):
+    prazo = None
+    if regra_pausa:
+        prazo = registro.timestamp + timedelta(minutes=regra_pausa.duracao_minutos)
+    return lambda: publicar_batida(registro.funcionario, registro.tipo, registro.timestamp, prazo)
+
+
+def _aplicar(estado, tipo):
+    estado.tem_entrada |= tipo == "ENTRADA"
+    estado.tem_saida |= tipo == "SAIDA"
+    estado.pausas += tipo == "SAIDA_PAUSA"
+    estado.ultimo_tipo = tipo
+
+
+def _gravar(funcionario, estado, tipo, agora, regra_pausa):
+    # A batida é a única fonte do status operacional. O UPDATE condicional só
+    # muda o status se ele ainda for o validado (o funcionário foi lido antes
+    # da trava) e grava só essa coluna.
+    novo_status = status_pela_marcacao(tipo)
+    if not Funcionario.objects.filter(
+        pk=funcionario.pk, status_operacional=funcionario.status_operacional
+    ).update(status_operacional=novo_status):
+        raise BatidaRecusada("Seu status mudou enquanto o ponto era registrado. Tente novamente.")
+    funcionario.status_operacional = novo_status
+
+    registro = RegistroPonto(funcionario=funcionario, tipo=tipo, timestamp=agora)
+    # O estado do dia já é atualizado aqui; o signal não o descarta.
+    registro._estado_ponto_atualizado = True
+    registro.save()
+
+    _aplicar(estado, tipo)
+    estado.save()
+
+    # robust: uma falha ao avisar os painéis não desfaz nem derruba a batida.
+    transaction.on_commit(_publicacao(registro, regra_pausa), robust=True)
+    return registro
+
+
+class _Consultas:
+    """Consultas da validação de uma batida avulsa, feitas só quando necessárias."""
+
+    def regra_pausa(self, funcionario, ordem):
+        return RegraDePausa.objects.filter(cargo_id=funcionario.cargo_id, ordem=ordem).first()
+
+    def vinculo_escala(self, funcionario, data):
+        return resolve_range([funcionario], data, data).vinculo_em(funcionario, data)
+
+    def horario_aprovado(self, funcionario, data):
+        return SolicitacaoHorario.objects.filter(
+            funcionario=funcionario, status="APROVADO", data_hora_ponto__date=data
+        ).exists()
+
+
+class _ConsultasDoLote(_Consultas):
+    """As mesmas consultas para um lote: uma query de cada, na primeira vez."""
+
+    def __init__(self, funcionarios, inicio, fim):
+        self.funcionarios = list(funcionarios)
+        self.inicio = inicio
+        self.fim = fim
+
+    @cached_property
+    def _regras(self):
+        return {
+            (regra.cargo_id, regra.ordem): regra
+            for regra in RegraDePausa.objects.filter(
+                cargo_id__in={f.cargo_id for f in self.funcionarios if f.cargo_id}
+            )
+        }
+
+    @cached_property
+    def _escalas(self):
+        return resolve_range(self.funcionarios, self.inicio, self.fim)
+
+    @cached_property
+    def _horarios_aprovados(self):
+        return set(
+            SolicitacaoHorario.objects.filter(
+                funcionario__in=self.funcionarios,
+                status="APROVADO",
+                data_hora_ponto__date__range=(self.inicio, self.fim),
+            ).values_list("funcionario_id", "data_hora_ponto__date")
+        )
+
+    def regra_pausa(self, funcionario, ordem):
+        return self._regras.get((funcionario.cargo_id, ordem))
+
+    def vinculo_escala(self, funcionario, data):
+        return self._escalas.vinculo_em(funcionario, data)
+
+    def horario_aprovado(self, funcionario, data):
+        return (funcionario.pk, data) in self._horarios_aprovados
+
+
+_CONSULTAS = _Consultas()
+
+
+def _validar(funcionario, estado, tipo, agora, consultas=_CONSULTAS, status=None):
+    """
+    Levanta BatidaRecusada; numa SAIDA_PAUSA, retorna a regra da pausa.
+    `status` substitui o status operacional do funcionário (dias anteriores).
+    """
+    if tipo == "ENTRADA" and estado.tem_entrada:
+        raise BatidaRecusada("Você já registrou uma entrada hoje.")
+
+    if tipo == "SAIDA":
+        if not estado.tem_entrada:
+            raise BatidaRecusada(
+                "Você não pode registrar uma saída sem antes registrar uma entrada hoje."
+            )
+        if estado.tem_saida:
+            raise BatidaRecusada("Você já registrou uma saída hoje.")
+
+    if funcionario.status != "ATIVO":
+        raise BatidaRecusada(
+            f"Seu status é '{funcionario.get_status_display()}', você não pode registrar o ponto."
+        )
+
+    if tipo in ["ENTRADA", "SAIDA"]:
+        _validar_escala(funcionario, estado, agora, consultas)
+
+    # O status vem do funcionário, e não do estado do dia: vale para turnos que
+    # cruzam a meia-noite.
+    if status is None:
+        status = funcionario.status_operacional
+
+    if tipo == "ENTRADA" and status != "OFFLINE":
+        raise BatidaRecusada(f"Ação inválida. Seu status atual é '{ROTULOS_STATUS[status]}'.")
+
+    regra_pausa = None
+    if tipo == "SAIDA_PAUSA":
+        if status != "DISPONIVEL":
+            raise BatidaRecusada("Você só pode iniciar uma pausa se estiver 'Disponível'.")
+        regra_pausa = consultas.regra_pausa(funcionario, estado.pausas + 1)
+        if regra_pausa is None:
+            raise BatidaRecusada(
+                "Você não tem mais pausas disponíveis ou elas não estão configuradas para seu cargo."
+            )
+
+    if tipo == "SAIDA_PAUSA_PESSOAL" and status != "DISPONIVEL":
+        raise BatidaRecusada("Você só pode iniciar uma pausa pessoal se estiver 'Disponível'.")
+
+    if tipo in ["VOLTA_PAUSA", "VOLTA_PAUSA_PESSOAL", "VOLTA_ALMOCO"] and status != "EM_PAUSA":
+        raise BatidaRecusada("Você só pode voltar de uma pausa se estiver 'Em Pausa'.")
+
+    if tipo == "SAIDA" and status not in ["DISPONIVEL", "EM_PAUSA"]:
+        raise BatidaRecusada(
+            f"Você não pode registrar a saída com o status '{ROTULOS_STATUS[status]}'."
+        )
+    return regra_pausa
+
+
+def _validar_escala(funcionario, estado, agora, consultas):
+    if not estado.escala_resolvida:
+        _resolver_escala(estado, consultas.vinculo_escala(funcionario, estado.data))
+
+    erro = None
+    if estado.inicio_jornada is None:
+        erro = BatidaRecusada(
+            "Você não tem uma escala de trabalho definida para hoje. Contate o RH."
+        )
+    elif not estado.dia_de_trabalho:
+        erro = BatidaRecusada("Você não pode registrar o ponto em um dia de folga.")
+    elif not (
+        estado.inicio_jornada - TOLERANCIA_JORNADA
+        <= agora
+        <= estado.fim_jornada + TOLERANCIA_JORNADA
+    ):
+        erro = BatidaRecusada(
+            "Você está tentando bater o ponto muito fora do seu horário. Por favor, solicite autorização.",
+            fora_do_horario=True,
+        )
+    # Só quem cai fora da escala paga a consulta da solicitação aprovada.
+    if erro and not consultas.horario_aprovado(funcionario, estado.data):
+        raise erro
+
+
+def _resolver_escala(estado, vinculo):
+    estado.escala_resolvida = True
+    estado.dia_de_trabalho = False
+    estado.inicio_jornada = estado.fim_jornada = None
+    if not vinculo:
+        return
+    escala = vinculo.escala
+    fuso = timezone.get_current_timezone()
+    estado.dia_de_trabalho = str(estado.data.weekday()) in escala.dias_semana.split(",")
+    estado.inicio_jornada = datetime.combine(estado.data, escala.horario_entrada, tzinfo=fuso)
+    estado.fim_jornada = datetime.combine(estado.data, escala.horario_saida, tzinfo=fuso)
+    # Turnos que cruzam a meia-noite
+    if estado.fim_jornada < estado.inicio_jornada:
+        estado.fim_jornada += timedelta(days=1)
+
+
+def _estado_travado(funcionario, data):
+    """EstadoPontoDia do funcionário na data, travado até o fim da transação."""
+    estados = EstadoPontoDia.objects.select_for_update()
+    try:
+        return estados.get(funcionario=funcionario, data=data)
+    except EstadoPontoDia.DoesNotExist:
+        pass
+    estado = _estado_pelos_registros(funcionario, data)
+    try:
+        with transaction.atomic():
+            estado.save(force_insert=True)
+        return estado
+    except IntegrityError:
+        # Outra batida do funcionário criou o estado no meio do caminho.
+        return estados.get(funcionario=funcionario, data=data)
+
+
+def _estados_travados(pares):
+    """
+    EstadoPontoDia de cada (funcionario_id, data), travados até o fim da
+    transação; os que faltam são montados pelos registros, numa query só.
+    """
+    ids = {funcionario_id for funcionario_id, _ in pares}
+    datas = [data for _, data in pares]
+
+    def travar():
+        return {
+            (estado.funcionario_id, estado.data): estado
+            for estado in EstadoPontoDia.objects.select_for_update()
+            .filter(funcionario_id__in=ids, data__range=(min(datas), max(datas)))
+            .order_by("funcionario_id", "data")
+            if (estado.funcionario_id, estado.data) in pares
+        }
+
+    estados = travar()
+    faltando = pares - estados.keys()
+    if not faltando:
+        return estados
+    tipos = {par: [] for par in faltando}
+    registros = _registros_dos_dias(faltando)
+    for funcionario_id, tipo, momento in registros.values_list("funcionario_id", "tipo", "timestamp"):
+        par = (funcionario_id, timezone.localtime(momento).date())
+        if par in tipos:
+            tipos[par].append(tipo)
+    # Quem perder a corrida para uma batida concorrente fica com o estado dela.
+    EstadoPontoDia.objects.bulk_create(
+        [_estado_de(funcionario_id, data, tipos[(funcionario_id, data)]) for funcionario_id, data in faltando],
+        ignore_conflicts=True,
+    )
+    return travar()
+
+
+def _registros_dos_dias(pares, vespera=False):
+    """
+    RegistroPonto de cada (funcionario_id, data), e também da véspera se
+    `vespera`, em ordem de horário: uma query, com um intervalo por data.
+    """
+    por_data = defaultdict(set)
+    for funcionario_id, data in pares:
+        por_data[data].add(funcionario_id)
+    filtro = Q()
+    for data, ids in por_data.items():
+        filtro |= Q(
+            funcionario_id__in=ids,
+            timestamp__gte=_meia_noite(data - timedelta(days=1) if vespera else data),
+            timestamp__lt=_meia_noite(data + timedelta(days=1)),
+        )
+    return RegistroPonto.objects.filter(filtro).order_by("timestamp")
+
+
+def _meia_noite(data):
+    return datetime.combine(data, time.min, tzinfo=timezone.get_current_timezone())
+
+
+_horario = attrgetter("timestamp")
+
+
+def _estado_pelos_registros(funcionario, data):
+    inicio = _meia_noite(data)
+    tipos = list(
+        RegistroPonto.objects.filter(
+            funcionario=funcionario, timestamp__gte=inicio, timestamp__lt=inicio + timedelta(days=1)
+        )
+        .order_by("timestamp")
+        .values_list("tipo", flat=True)
+    )
+    return _estado_de(funcionario.pk, data, tipos)
+
+
+def _estado_de(funcionario_id, data, tipos):
+    return EstadoPontoDia(
+        funcionario_id=funcionario_id,
+        data=data,
+        tem_entrada="ENTRADA" in tipos,
+        tem_saida="SAIDA" in tipos,
+        pausas=tipos.count("SAIDA_PAUSA"),
+        ultimo_tipo=tipos[-1] if tipos else "",
+    )
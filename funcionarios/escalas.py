@@ -0,0 +1,82 @@
+# funcionarios/escalas.py
+"""
+Resolução de "qual escala vale para o funcionário na data X".
+
+Em vez de uma consulta a FuncionarioEscala por dia, os períodos de escala de
+um funcionário (ou de uma equipe inteira) são carregados de uma vez e as
+datas são resolvidas em memória, por busca binária sobre os períodos
+ordenados pela data de início.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.db.models import Q, QuerySet
+
+from .models import FuncionarioEscala
+
+
+def ids_de(funcionarios):
+    """
+    Ids dos `funcionarios` para filtros `__in`: subquery se for um queryset,
+    lista se forem instâncias ou ids.
+    """
+    if isinstance(funcionarios, QuerySet):
+        return funcionarios.values("id")
+    return [getattr(f, "pk", f) for f in funcionarios]
+
+
+class EscalaResolver:
+    """Índice em memória dos períodos de escala, por funcionário."""
+
+    def __init__(self, vinculos):
+        self._inicios = defaultdict(list)
+        self._vinculos = defaultdict(list)
+        # Em datas de início iguais vale o vínculo mais recente (maior pk).
+        for vinculo in sorted(
+            vinculos, key=lambda v: (v.funcionario_id, v.data_inicio, v.pk)
+        ):
+            self._inicios[vinculo.funcionario_id].append(vinculo.data_inicio)
+            self._vinculos[vinculo.funcionario_id].append(vinculo)
+
+    @classmethod
+    def carregar(cls, funcionarios, inicio=None, fim=None):
+        """
+        Carrega, numa única query, os períodos de escala dos funcionários
+        (queryset, lista de instâncias ou de ids) que tocam o intervalo
+        [inicio, fim]. Sem intervalo, carrega o histórico completo.
+        """
+        vinculos = FuncionarioEscala.objects.filter(
+            funcionario_id__in=ids_de(funcionarios)
+        ).select_related("escala")
+        if fim is not None:
+            vinculos = vinculos.filter(data_inicio__lte=fim)
+        if inicio is not None:
+            vinculos = vinculos.filter(Q(data_fim__gte=inicio) | Q(data_fim__isnull=True))
+        return cls(vinculos)
+
+    def vinculo_em(self, funcionario, data):
+        """Retorna o FuncionarioEscala vigente na data, ou None."""
+        funcionario_id = getattr(funcionario, "pk", funcionario)
+        inicios = self._inicios.get(funcionario_id)
+        if not inicios:
+            return None
+        vinculos = self._vinculos[funcionario_id]
+        # Começa pelo período de início mais recente <= data; só volta além
+        # dele quando há períodos sobrepostos.
+        indice = bisect_right(inicios, data) - 1
+        while indice >= 0:
+            vinculo = vinculos[indice]
+            if vinculo.data_fim is None or vinculo.data_fim >= data:
+                return vinculo
+            indice -= 1
+        return None
+
+    def escala_em(self, funcionario, data):
+        """Retorna a Escala vigente na data, ou None."""
+        vinculo = self.vinculo_em(funcionario, data)
+        return vinculo.escala if vinculo else None
+
+
+def resolve_range(funcionarios, inicio, fim):
+    """Resolvedor de escalas para vários funcionários em [inicio, fim], com uma query."""
+    return EscalaResolver.carregar(funcionarios, inicio, fim)
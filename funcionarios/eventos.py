@@ -0,0 +1,292 @@
+# funcionarios/eventos.py
+"""
+Barramento de eventos de batida de ponto.
+
+Depois do commit, a batida publica `(funcionario_id, tipo, timestamp)`, com o
+supervisor do funcionário para o roteamento. No PostgreSQL o evento vai por
+NOTIFY no canal "batidas": cada processo que tem assinantes mantém uma thread
+com LISTEN numa conexão própria e repassa o que chega aos assinantes locais,
+inclusive no processo que publicou. Nos demais bancos (e nos testes, com
+EVENTOS_EM_PROCESSO) a entrega é direta, dentro do processo.
+
+Há dois tipos de assinante:
+
+- filas assíncronas por tópico (o stream do painel), uma por conexão e
+  limitadas: quem não consome perde os eventos pendentes e recebe
+  EVENTO_RECARREGAR no lugar;
+- callbacks síncronos (`ao_receber`), chamados na thread de escuta, que
+  portanto devem ser rápidos.
+
+Se a conexão de escuta cai, a thread reconecta com espera crescente. Como
+eventos podem ter se perdido no intervalo, todas as filas recebem
+EVENTO_RECARREGAR ao reconectar.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+CANAL = "batidas"
+
+TAMANHO_FILA = 100
+
+TOPICO_TODOS = "equipe:todos"
+
+# Evento enviado no lugar dos descartados quando a fila de um cliente enche.
+EVENTO_RECARREGAR = {"tipo": "recarregar"}
+
+# Sem notificações por esse tempo, a conexão de escuta é testada.
+INTERVALO_VERIFICACAO_SEGUNDOS = 30
+
+ESPERA_MAXIMA_RECONEXAO_SEGUNDOS = 30
+
+
+def topico_supervisor(supervisor_id):
+    return f"equipe:{supervisor_id}"
+
+
+def topicos_do_supervisor(supervisor_id):
+    """Tópicos das tabelas de equipe de quem tem esse supervisor."""
+    if supervisor_id:
+        return [TOPICO_TODOS, topico_supervisor(supervisor_id)]
+    return [TOPICO_TODOS]
+
+
+def topicos_do_funcionario(funcionario):
+    """Tópicos das tabelas de equipe em que o funcionário aparece."""
+    return topicos_do_supervisor(funcionario.supervisor_id)
+
+
+class Assinatura:
+    """Fila de eventos de uma conexão, consumida no event loop que a criou."""
+
+    def __init__(self, broker, topicos, tamanho_fila):
+        self.broker = broker
+        self.topicos = topicos
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+        self.loop = asyncio.get_running_loop()
+
+    def entregar(self, evento):
+        # Pode ser chamado de qualquer thread (a batida e a escuta rodam fora
+        # do event loop).
+        try:
+            self.loop.call_soon_threadsafe(self._enfileirar, evento)
+        except RuntimeError:
+            # O loop da conexão já foi encerrado.
+            self.cancelar()
+
+    def _enfileirar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait(EVENTO_RECARREGAR)
+
+    async def proximo(self, timeout=None):
+        """Próximo evento, ou None se nada chegar em `timeout` segundos."""
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def cancelar(self):
+        self.broker.cancelar(self)
+
+
+class Broker:
+    """Distribui os eventos recebidos pelo processo entre os assinantes locais."""
+
+    def __init__(self, tamanho_fila=TAMANHO_FILA):
+        self.tamanho_fila = tamanho_fila
+        self._trava = threading.Lock()
+        self._assinaturas = defaultdict(set)
+        self._callbacks = []
+
+    def assinar(self, *topicos):
+        """Assina os tópicos. Deve ser chamado dentro do event loop consumidor."""
+        assinatura = Assinatura(self, topicos, self.tamanho_fila)
+        with self._trava:
+            for topico in topicos:
+                self._assinaturas[topico].add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            for topico in assinatura.topicos:
+                self._assinaturas[topico].discard(assinatura)
+                if not self._assinaturas[topico]:
+                    del self._assinaturas[topico]
+
+    def ao_receber(self, callback):
+        with self._trava:
+            self._callbacks.append(callback)
+
+    def publicar(self, topico, evento):
+        with self._trava:
+            assinaturas = list(self._assinaturas.get(topico, ()))
+        for assinatura in assinaturas:
+            assinatura.entregar(evento)
+        return len(assinaturas)
+
+    def distribuir(self, evento):
+        """Entrega uma batida às filas dos tópicos dela e aos callbacks."""
+        for topico in topicos_do_supervisor(evento.get("supervisor_id")):
+            self.publicar(topico, evento)
+        with self._trava:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(evento)
+            except Exception:
+                logger.exception("Falha num assinante de batidas.")
+
+    def recarregar_todos(self):
+        with self._trava:
+            assinaturas = set().union(*self._assinaturas.values())
+        for assinatura in assinaturas:
+            assinatura.entregar(EVENTO_RECARREGAR)
+
+
+broker = Broker()
+
+
+class BarramentoEmProcesso:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publicar(self, evento):
+        self.broker.distribuir(evento)
+
+    def iniciar_escuta(self):
+        pass
+
+
+class BarramentoPostgres:
+    def __init__(self, broker, alias=DEFAULT_DB_ALIAS):
+        self.broker = broker
+        self.alias = alias
+        self._thread = None
+        self._trava = threading.Lock()
+
+    def publicar(self, evento):
+        # Chamado depois do commit: em autocommit, o NOTIFY sai na hora.
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CANAL, json.dumps(evento)])
+
+    def iniciar_escuta(self):
+        with self._trava:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._escutar, name="eventos-batidas", daemon=True
+                )
+                self._thread.start()
+
+    def _escutar(self):
+        espera = 1
+        reconexao = False
+        while True:
+            # Conexão própria, fora do controle de conexões por requisição do Django.
+            conexao = connections.create_connection(self.alias)
+            try:
+                with conexao.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANAL}")
+                if reconexao:
+                    logger.info("Escuta de batidas restabelecida.")
+                    self.broker.recarregar_todos()
+                espera = 1
+                self._receber(conexao.connection)
+            except Exception:
+                logger.exception(
+                    "Conexão de escuta de batidas perdida; nova tentativa em %ss.", espera
+                )
+            finally:
+                try:
+                    conexao.close()
+                except Exception:
+                    pass
+            reconexao = True
+            time.sleep(espera)
+            espera = min(espera * 2, ESPERA_MAXIMA_RECONEXAO_SEGUNDOS)
+
+    def _receber(self, bruta):
+        while True:
+            if not select.select([bruta], [], [], INTERVALO_VERIFICACAO_SEGUNDOS)[0]:
+                # Nada chegou: confirma que a conexão continua viva.
+                with bruta.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                continue
+            bruta.poll()
+            while bruta.notifies:
+                notificacao = bruta.notifies.pop(0)
+                try:
+                    evento = json.loads(notificacao.payload)
+                except ValueError:
+                    logger.warning("Notificação inválida no canal %s.", CANAL)
+                    continue
+                self.broker.distribuir(evento)
+
+
+_barramento = None
+_trava_barramento = threading.Lock()
+
+
+def barramento():
+    """O barramento do processo, escolhido pelo banco na primeira chamada."""
+    global _barramento
+    with _trava_barramento:
+        if _barramento is None:
+            if (
+                getattr(settings, "EVENTOS_EM_PROCESSO", False)
+                or connections[DEFAULT_DB_ALIAS].vendor != "postgresql"
+            ):
+                _barramento = BarramentoEmProcesso(broker)
+            else:
+                _barramento = BarramentoPostgres(broker)
+        return _barramento
+
+
+@receiver(setting_changed)
+def _trocar_barramento(setting, **kwargs):
+    global _barramento
+    if setting in ("EVENTOS_EM_PROCESSO", "DATABASES"):
+        _barramento = None
+
+
+def assinar(*topicos):
+    """Fila de eventos dos tópicos para a conexão atual (chamar no event loop)."""
+    barramento().iniciar_escuta()
+    return broker.assinar(*topicos)
+
+
+def ao_receber(callback):
+    """Registra `callback(evento)` para toda batida recebida pelo processo."""
+    barramento().iniciar_escuta()
+    broker.ao_receber(callback)
+
+
+def publicar_batida(funcionario, tipo, timestamp, prazo=None):
+    """
+    Publica uma nova marcação. Chamar depois do commit. Numa SAIDA_PAUSA,
+    `prazo` é o momento em que a pausa estoura o limite da regra.
+    """
+    barramento().publicar(
+        {
+            "tipo": "batida",
+            "funcionario_id": funcionario.pk,
+            "supervisor_id": funcionario.supervisor_id,
+            "marcacao": tipo,
+            "timestamp": timestamp.isoformat(),
+            "prazo": prazo.isoformat() if prazo else None,
+        }
+    )
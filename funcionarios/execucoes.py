@@ -0,0 +1,49 @@
+# funcionarios/execucoes.py
+"""
+Registro das execuções do processar_pontos (ExecucaoProcessamento).
+
+Cada execução grava início, fim, datas processadas, contadores e o tempo
+gasto em cada fase (carga, cálculo e gravação), para acompanhar pelo admin
+se o processamento continua cabendo no intervalo do cron.
+"""
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.utils import timezone
+
+# Intervalo do cron (scripts/crontab); usado no admin para mostrar o consumo.
+ORCAMENTO_SEGUNDOS = 120
+
+
+@contextmanager
+def registrar_execucao(execucao, gravar_inicio=False):
+    """
+    Acumula os resumos na ExecucaoProcessamento e a grava ao final, como
+    concluída ou com o erro. Com ``gravar_inicio`` a linha é gravada já no
+    começo, para execuções longas aparecerem como em andamento (e poderem
+    ser retomadas). Execuções bem-sucedidas que não processaram nenhuma data
+    (o incremental sem pendências) não são gravadas.
+    """
+    execucao.status = "EM_ANDAMENTO"
+    execucao.erro = ""
+    if gravar_inicio:
+        execucao.save()
+    inicio = perf_counter()
+    try:
+        yield execucao
+    except BaseException as erro:
+        execucao.status = "FALHOU"
+        execucao.erro = repr(erro)
+        _finalizar(execucao, inicio)
+        raise
+    if execucao.pk is None and execucao.data_inicial is None:
+        return
+    execucao.status = "CONCLUIDO"
+    _finalizar(execucao, inicio)
+
+
+def _finalizar(execucao, inicio):
+    execucao.finalizado_em = timezone.now()
+    # Uma execução retomada soma o tempo das tentativas anteriores.
+    execucao.segundos_total += perf_counter() - inicio
+    execucao.save()
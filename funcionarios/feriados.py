@@ -0,0 +1,76 @@
+# funcionarios/feriados.py
+"""
+Calendário de feriados compartilhado pelo processamento, views e formulários.
+
+As datas de cada ano (feriados nacionais + feriados customizados, inclusive
+os recorrentes) são calculadas uma única vez e mantidas em memória no
+processo. Os signals de Feriado invalidam o cache local; os demais processos
+recalculam depois de FERIADOS_CACHE_SEGUNDOS.
+"""
+import threading
+import time
+
+from django.db.models import Q
+import holidays
+
+from .models import Feriado
+
+FERIADOS_CACHE_SEGUNDOS = 600
+
+
+class CalendarioFeriados:
+    """Conjunto imutável de datas de feriado por ano, com cache por processo."""
+
+    def __init__(self, pais="BR"):
+        self.pais = pais
+        self._anos = {}  # ano -> (frozenset de datas, momento do cálculo)
+        self._geracao = 0
+        self._lock = threading.Lock()
+
+    def datas(self, ano):
+        """Retorna o frozenset com todas as datas de feriado do ano."""
+        entrada = self._anos.get(ano)
+        if entrada and time.monotonic() - entrada[1] < FERIADOS_CACHE_SEGUNDOS:
+            return entrada[0]
+
+        geracao = self._geracao
+        datas = self._calcular(ano)
+        with self._lock:
+            # Não guarda um resultado calculado antes de uma invalidação.
+            if geracao == self._geracao:
+                self._anos[ano] = (datas, time.monotonic())
+        return datas
+
+    def eh_feriado(self, data):
+        return data in self.datas(data.year)
+
+    def invalidar(self):
+        with self._lock:
+            self._geracao += 1
+            self._anos = {}
+
+    def _calcular(self, ano):
+        datas = set(holidays.country_holidays(self.pais, years=ano))
+        customizados = Feriado.objects.filter(
+            Q(recorrente=True) | Q(data__year=ano)
+        ).values_list("data", "recorrente")
+        for data, recorrente in customizados:
+            if not recorrente:
+                datas.add(data)
+                continue
+            try:
+                datas.add(data.replace(year=ano))
+            except ValueError:
+                # Feriado recorrente em 29/02 não existe em anos não bissextos.
+                continue
+        return frozenset(datas)
+
+
+calendario_feriados = CalendarioFeriados()
+
+
+def eh_dia_de_trabalho(escala, data):
+    """Em feriados só trabalha quem tem escala prioritária; nos demais dias vale a escala."""
+    if calendario_feriados.eh_feriado(data):
+        return escala.prioritaria
+    return str(data.weekday()) in escala.dias_semana.split(",")
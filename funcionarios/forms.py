@@ -1,14 +1,17 @@
 # funcionarios/forms.py
 from django import forms
+from django.db.models import Q
 from .models import (
+    Cargo,
+    CentroDeCusto,
     Funcionario,
-    FuncionarioEscala,
     SolicitacaoAbono,
     SolicitacaoAlteracaoEndereco,
     SolicitacaoAlteracaoBancaria,
     SolicitacaoHorario,
 )
-from django.db.models import Q
+from .feriados import eh_dia_de_trabalho
+from .escalas import resolve_range
 from datetime import datetime, time
 
 
@@ -83,21 +86,13 @@ class SolicitacaoAbonoForm(forms.ModelForm):
         # Validação do dia de trabalho
         if data_para_validar and self.request:
             funcionario = self.request.user.funcionario
-            escala_info = (
-                FuncionarioEscala.objects.filter(
-                    funcionario=funcionario, data_inicio__lte=data_para_validar
-                )
-                .filter(
-                    Q(data_fim__gte=data_para_validar) | Q(data_fim__isnull=True)
-                )
-                .first()
-            )
+            escala_info = resolve_range(
+                [funcionario], data_para_validar, data_para_validar
+            ).vinculo_em(funcionario, data_para_validar)
 
-            is_workday = False
-            if escala_info:
-                dia_da_semana = data_para_validar.weekday()
-                if str(dia_da_semana) in escala_info.escala.dias_semana.split(","):
-                    is_workday = True
+            is_workday = bool(escala_info) and eh_dia_de_trabalho(
+                escala_info.escala, data_para_validar
+            )
 
             if not is_workday:
                 self.add_error(
@@ -118,34 +113,33 @@ class RelatorioFolhaPontoForm(forms.Form):
     )
 
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop("user", None)
+        # Autorizacao do usuário (funcionarios.autorizacao), já resolvida pela view.
+        autorizacao = kwargs.pop("autorizacao", None)
         super().__init__(*args, **kwargs)
 
-        if not user or not hasattr(user, 'funcionario'):
+        if not autorizacao or autorizacao.funcionario_id is None:
             # Se não houver usuário ou funcionário associado, não mostra ninguém
             self.fields["funcionario"].queryset = Funcionario.objects.none()
             return
 
-        is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-        is_supervisor = user.funcionario.equipe.exists()
-
-        if is_analista_rh:
+        if autorizacao.analista_rh:
             # Analista de RH pode ver todos os funcionários ativos
             self.fields["funcionario"].queryset = Funcionario.objects.filter(status='ATIVO')
             self.fields["funcionario"].label = "Selecionar Funcionário"
-        
-        elif is_supervisor:
+
+        elif autorizacao.supervisor:
             # Supervisor pode ver a si mesmo e sua equipe
-            self.fields["funcionario"].queryset = (
-                user.funcionario.equipe.all() | Funcionario.objects.filter(id=user.funcionario.id)
-            ).distinct()
+            self.fields["funcionario"].queryset = Funcionario.objects.filter(
+                pk__in=autorizacao.subordinados | {autorizacao.funcionario_id}
+            )
             self.fields["funcionario"].label = "Selecionar Membro da Equipe"
 
         else:
             # Funcionário comum só pode ver o próprio relatório
-            self_qs = Funcionario.objects.filter(id=user.funcionario.id)
-            self.fields["funcionario"].queryset = self_qs
-            self.fields["funcionario"].initial = user.funcionario
+            self.fields["funcionario"].queryset = Funcionario.objects.filter(
+                pk=autorizacao.funcionario_id
+            )
+            self.fields["funcionario"].initial = autorizacao.funcionario_id
             self.fields["funcionario"].widget = forms.HiddenInput()
 
 
@@ -155,6 +149,54 @@ class RelatorioEquipeForm(forms.Form):
     data_fim = forms.DateField(label="Data de Fim", widget=DateInput)
 
 
+class FiltroEquipeForm(forms.Form):
+    """Filtros e posição (keyset) da tabela de equipe do painel."""
+
+    centro_de_custo = forms.ModelChoiceField(
+        queryset=CentroDeCusto.objects.order_by("nome"),
+        label="Centro de Custo",
+        required=False,
+        empty_label="Todos",
+    )
+    cargo = forms.ModelChoiceField(
+        queryset=Cargo.objects.order_by("nome"), required=False, empty_label="Todos"
+    )
+    supervisor = forms.ModelChoiceField(
+        queryset=Funcionario.objects.filter(equipe__isnull=False)
+        .distinct()
+        .order_by("nome_completo"),
+        required=False,
+        empty_label="Todos",
+    )
+    status_operacional = forms.ChoiceField(
+        choices=[("", "Todos")] + Funcionario.STATUS_OPERACIONAL_CHOICES,
+        label="Status",
+        required=False,
+    )
+    # Último membro da página anterior.
+    apos_nome = forms.CharField(required=False, widget=forms.HiddenInput)
+    apos_id = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for campo in ["centro_de_custo", "cargo", "supervisor", "status_operacional"]:
+            self.fields[campo].widget.attrs["class"] = "form-select form-select-sm"
+
+    def filtrar(self, equipe):
+        dados = self.cleaned_data
+        filtros = Q()
+        for campo in ["centro_de_custo", "cargo", "supervisor", "status_operacional"]:
+            if dados[campo]:
+                filtros &= Q(**{campo: dados[campo]})
+        return equipe.filter(filtros)
+
+    def apos(self):
+        """(nome_completo, id) de onde a página começa, ou None na primeira."""
+        if self.cleaned_data["apos_id"] is None:
+            return None
+        return (self.cleaned_data["apos_nome"], self.cleaned_data["apos_id"])
+
+
 # Este é o nosso novo formulário para endereço
 class SolicitacaoAlteracaoEnderecoForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,71 @@
+# funcionarios/jornadas.py
+"""
+Resumo diário da jornada (JornadaDiaria).
+
+O processamento grava uma linha por funcionário e dia; relatórios e
+dashboards leem essas linhas em vez de recalcular a partir das marcações.
+Dias ainda não processados (hoje, por exemplo) são montados na hora com a
+mesma função, sem gravar.
+"""
+from datetime import datetime, timedelta
+
+from .models import JornadaDiaria
+from .escalas import ids_de
+from .feriados import calendario_feriados, eh_dia_de_trabalho
+from .ponto_timeline import montar_timeline
+
+
+def jornada_esperada(target_date, escala):
+    """Carga horária líquida esperada (em minutos) da escala na data."""
+    entrada_esperada_obj = datetime.combine(target_date, escala.horario_entrada)
+    saida_esperada_obj = datetime.combine(target_date, escala.horario_saida)
+
+    if saida_esperada_obj < entrada_esperada_obj:  # Turno noturno
+        saida_esperada_obj += timedelta(days=1)
+
+    carga_horaria_bruta_esperada = (
+        saida_esperada_obj - entrada_esperada_obj
+    ).total_seconds() / 60
+
+    almoco_a_descontar = 0
+    if carga_horaria_bruta_esperada > 300:
+        almoco_a_descontar = escala.duracao_almoco_minutos
+
+    return carga_horaria_bruta_esperada - almoco_a_descontar
+
+
+def montar_jornada(funcionario_id, data, escala, registros, timeline=None, abonado=False):
+    """Monta (sem gravar) a JornadaDiaria de um funcionário a partir das marcações do dia."""
+    if timeline is None:
+        timeline = montar_timeline(registros)
+    dia_de_trabalho = bool(escala) and eh_dia_de_trabalho(escala, data)
+    return JornadaDiaria(
+        funcionario_id=funcionario_id,
+        data=data,
+        escala=escala,
+        primeira_entrada=timeline.primeira_entrada.timestamp if timeline.primeira_entrada else None,
+        ultima_saida=timeline.ultima_saida.timestamp if timeline.ultima_saida else None,
+        marcacoes=len(registros),
+        minutos_trabalhados=round(timeline.minutos_trabalhados),
+        minutos_pausa=round(timeline.minutos_pausa),
+        minutos_almoco=round(timeline.minutos_almoco),
+        minutos_pausa_pessoal=round(timeline.minutos_pausa_pessoal),
+        minutos_esperados=round(jornada_esperada(data, escala)) if dia_de_trabalho else 0,
+        dia_de_trabalho=dia_de_trabalho,
+        feriado=calendario_feriados.eh_feriado(data),
+        abonado=abonado,
+    )
+
+
+def jornadas_do_periodo(funcionarios, inicio, fim):
+    """
+    Carrega, num único range scan, as jornadas gravadas de [inicio, fim].
+    Aceita queryset, lista de instâncias ou de ids. Retorna
+    {(funcionario_id, data): JornadaDiaria}.
+    """
+    return {
+        (jornada.funcionario_id, jornada.data): jornada
+        for jornada in JornadaDiaria.objects.filter(
+            funcionario_id__in=ids_de(funcionarios), data__range=(inicio, fim)
+        )
+    }
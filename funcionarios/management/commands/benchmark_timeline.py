@@ -0,0 +1,110 @@
+# funcionarios/management/commands/benchmark_timeline.py
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from funcionarios.models import RegistroPonto
+from funcionarios.ponto_timeline import montar_timeline
+
+CICLO = [
+    "SAIDA_PAUSA",
+    "VOLTA_PAUSA",
+    "SAIDA_PAUSA_PESSOAL",
+    "VOLTA_PAUSA_PESSOAL",
+    "SAIDA_ALMOCO",
+    "VOLTA_ALMOCO",
+]
+
+
+def dia_sintetico(marcacoes, padrao="intercalado"):
+    """
+    Gera, sem gravar nada, um dia com ENTRADA, `marcacoes` marcações
+    intermediárias e SAIDA. No padrão "intercalado" cada pausa é fechada logo
+    em seguida; no "aleatorio" os tipos são sorteados, com muitas marcações
+    sem par (o pior caso do pareamento antigo).
+    """
+    inicio = timezone.make_aware(datetime(2025, 1, 6, 8, 0))
+    if padrao == "aleatorio":
+        sorteio = random.Random(marcacoes)
+        meio = [sorteio.choice(CICLO) for _ in range(marcacoes)]
+    else:
+        meio = [CICLO[i % len(CICLO)] for i in range(marcacoes)]
+    tipos = ["ENTRADA"] + meio + ["SAIDA"]
+    return [
+        RegistroPonto(tipo=tipo, timestamp=inicio + timedelta(seconds=i))
+        for i, tipo in enumerate(tipos)
+    ]
+
+
+def pareamento_quadratico(registros):
+    """Pareamento anterior (next() + list.remove por par), mantido só como referência."""
+    total = 0.0
+    for tipo_saida, tipo_volta, sinal in [
+        ("ENTRADA", "SAIDA", 1),
+        ("SAIDA_PAUSA", "VOLTA_PAUSA", -1),
+        ("SAIDA_ALMOCO", "VOLTA_ALMOCO", -1),
+        ("SAIDA_PAUSA_PESSOAL", "VOLTA_PAUSA_PESSOAL", -1),
+    ]:
+        saidas = [r for r in registros if r.tipo == tipo_saida]
+        voltas = [r for r in registros if r.tipo == tipo_volta]
+        duracao = timedelta()
+        for s in saidas:
+            volta = next((v for v in voltas if v.timestamp > s.timestamp), None)
+            if volta:
+                duracao += volta.timestamp - s.timestamp
+                voltas.remove(volta)
+        total += sinal * duracao.total_seconds() / 60
+    return total
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark do pareamento de marcações (ponto_timeline) em dias sintéticos longos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--marcacoes",
+            type=int,
+            nargs="+",
+            default=[10, 100, 1000, 10000],
+            help="Quantidades de marcações intermediárias por dia a medir.",
+        )
+        parser.add_argument(
+            "--repeticoes", type=int, default=5, help="Melhor de N execuções."
+        )
+        parser.add_argument(
+            "--sem-referencia",
+            action="store_true",
+            help="Não mede o pareamento quadrático antigo (lento em dias muito longos).",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'padrão':>12} {'marcações':>10} {'timeline (ms)':>14} {'quadrático (ms)':>16}"
+        )
+        for padrao, marcacoes in [
+            (padrao, marcacoes)
+            for padrao in ("intercalado", "aleatorio")
+            for marcacoes in options["marcacoes"]
+        ]:
+            registros = dia_sintetico(marcacoes, padrao)
+            linear = self.medir(lambda: montar_timeline(registros), options["repeticoes"])
+            referencia = "-"
+            if not options["sem_referencia"]:
+                referencia = self.medir(
+                    lambda: pareamento_quadratico(registros), options["repeticoes"]
+                )
+                # Confere que o atalho linear continua dando o mesmo total.
+                assert abs(
+                    pareamento_quadratico(registros)
+                    - montar_timeline(registros).minutos_trabalhados
+                ) < 1e-6
+                referencia = f"{referencia:.3f}"
+            self.stdout.write(
+                f"{padrao:>12} {len(registros):>10} {linear:>14.3f} {referencia:>16}"
+            )
+
+    def medir(self, funcao, repeticoes):
+        return min(timeit.repeat(funcao, number=1, repeat=repeticoes)) * 1000
@@ -0,0 +1,22 @@
+# funcionarios/management/commands/criar_relogio_ponto.py
+import secrets
+
+from django.core.management.base import BaseCommand
+
+from funcionarios.models import RelogioPonto
+
+
+class Command(BaseCommand):
+    help = "Cadastra um relógio de ponto físico e mostra o token de envio de batidas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("nome", help="Nome do relógio (local, modelo).")
+
+    def handle(self, *args, **options):
+        token = secrets.token_urlsafe(32)
+        relogio = RelogioPonto.objects.create(
+            nome=options["nome"], token_hash=RelogioPonto.hash_do_token(token)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Relógio '{relogio}' cadastrado."))
+        # Só o hash fica no banco: o token não pode ser consultado depois.
+        self.stdout.write(f"Token: {token}")
@@ -0,0 +1,139 @@
+# funcionarios/management/commands/importar_afd.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from funcionarios.afd import ler_afd, somente_digitos
+from funcionarios.models import EstadoPontoDia, Funcionario, RegistroPonto
+from funcionarios.painel import invalidar_tabela_equipe
+from funcionarios.processamento import marcar_dias_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa as marcações de um arquivo AFD (Portarias 1510 e 671). No dia de cada "
+        "funcionário, as marcações alternam entre entrada e saída, em ordem de horário."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Caminho do arquivo AFD.")
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=5000,
+            help="Marcações gravadas por transação.",
+        )
+        parser.add_argument(
+            "--encoding",
+            default="latin-1",
+            help="Codificação do arquivo. Padrão: latin-1.",
+        )
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+        self.tamanho_lote = options["lote"]
+        self.verbosity = options["verbosity"]
+        self.contagem = dict.fromkeys(
+            ["lidas", "gravadas", "duplicadas", "desconhecidas", "invalidas"], 0
+        )
+        self.inicio = time.perf_counter()
+
+        # Documento -> id, para as duas portarias; cabe na memória mesmo com
+        # milhares de funcionários, ao contrário do arquivo.
+        funcionarios = {"pis": {}, "cpf": {}}
+        for pk, cpf, pis in Funcionario.objects.values_list("pk", "cpf", "pis"):
+            funcionarios["cpf"][somente_digitos(cpf)] = pk
+            if pis:
+                funcionarios["pis"][somente_digitos(pis)] = pk
+
+        # Último dia visto de cada funcionário e quantas marcações ele teve,
+        # para alternar entrada e saída sem guardar o arquivo.
+        dias = {}
+        lote = []
+        try:
+            with open(options["arquivo"], encoding=options["encoding"]) as arquivo:
+                for _, campo, documento, momento in ler_afd(arquivo, self._invalida):
+                    self.contagem["lidas"] += 1
+                    funcionario_id = funcionarios[campo].get(documento)
+                    if funcionario_id is None:
+                        self.contagem["desconhecidas"] += 1
+                        continue
+                    data = timezone.localtime(momento).date()
+                    dia, marcacoes = dias.get(funcionario_id, (None, 0))
+                    marcacoes = marcacoes + 1 if dia == data else 1
+                    dias[funcionario_id] = (data, marcacoes)
+                    lote.append(
+                        RegistroPonto(
+                            funcionario_id=funcionario_id,
+                            tipo="ENTRADA" if marcacoes % 2 else "SAIDA",
+                            timestamp=momento,
+                            origem="AFD",
+                        )
+                    )
+                    if len(lote) >= self.tamanho_lote:
+                        self._gravar(lote)
+                        lote = []
+        except OSError as erro:
+            raise CommandError(f"Não foi possível ler o arquivo: {erro}")
+        if lote:
+            self._gravar(lote)
+        invalidar_tabela_equipe()
+
+        c = self.contagem
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{c['gravadas']} marcações gravadas de {c['lidas']} lidas "
+                f"({c['duplicadas']} já existentes, {c['desconhecidas']} de funcionários "
+                f"não cadastrados, {c['invalidas']} linhas inválidas) em "
+                f"{time.perf_counter() - self.inicio:.1f}s ({self._vazao():.0f} marcações/s)."
+            )
+        )
+
+    def _invalida(self, numero):
+        self.contagem["invalidas"] += 1
+        if self.verbosity >= 2:
+            self.stderr.write(f"Linha {numero}: marcação inválida.")
+
+    def _vazao(self):
+        return self.contagem["lidas"] / max(time.perf_counter() - self.inicio, 1e-9)
+
+    def _gravar(self, lote):
+        # bulk_create não dispara os signals de RegistroPonto: o estado do dia
+        # e a fila de reprocessamento são tratados aqui, uma query cada.
+        ids = {registro.funcionario_id for registro in lote}
+        datas = {timezone.localtime(registro.timestamp).date() for registro in lote}
+        hoje = timezone.localdate()
+        with transaction.atomic():
+            vistos = set(
+                RegistroPonto.objects.filter(
+                    funcionario_id__in=ids,
+                    timestamp__range=(
+                        min(registro.timestamp for registro in lote),
+                        max(registro.timestamp for registro in lote),
+                    ),
+                ).values_list("funcionario_id", "timestamp")
+            )
+            novos = []
+            for registro in lote:
+                chave = (registro.funcionario_id, registro.timestamp)
+                if chave not in vistos:
+                    vistos.add(chave)
+                    novos.append(registro)
+            RegistroPonto.objects.bulk_create(novos, batch_size=self.tamanho_lote)
+            EstadoPontoDia.objects.filter(
+                funcionario_id__in=ids, data__range=(min(datas), max(datas))
+            ).delete()
+            marcar_dias_pendentes(
+                (registro.funcionario_id, data)
+                for registro in novos
+                if (data := timezone.localtime(registro.timestamp).date()) < hoje
+            )
+        self.contagem["gravadas"] += len(novos)
+        self.contagem["duplicadas"] += len(lote) - len(novos)
+        if self.verbosity >= 2:
+            self.stdout.write(
+                f"{self.contagem['lidas']} marcações lidas ({self._vazao():.0f}/s)."
+            )
@@ -0,0 +1,16 @@
+# funcionarios/management/commands/limpar_chaves_idempotencia.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from funcionarios.batidas import VALIDADE_CHAVE_IDEMPOTENCIA
+from funcionarios.models import ChaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = "Apaga as chaves de idempotência de batidas que já passaram da validade."
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - VALIDADE_CHAVE_IDEMPOTENCIA
+        # Sem dependentes nem signals, o delete é um único DELETE no banco.
+        apagadas, _ = ChaveIdempotencia.objects.filter(criada_em__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(f"{apagadas} chaves de idempotência apagadas."))
@@ -1,22 +1,49 @@
 # funcionarios/management/commands/processar_pontos.py
-from django.core.management.base import BaseCommand
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
-from datetime import timedelta, datetime, time, date
-from django.db import models
-from funcionarios.models import (
-    Funcionario,
-    RegistroPonto,
-    FuncionarioEscala,
-    BancoDeHoras,
-    SolicitacaoAbono,
-    Feriado,
+from datetime import timedelta, datetime
+from funcionarios.banco_horas import atualizar_checkpoints
+from funcionarios.execucoes import registrar_execucao
+from funcionarios.models import ExecucaoProcessamento
+from funcionarios.travas import TravaOcupada, trava_processamento
+from funcionarios.processamento import (
+    processar_data,
+    processar_incremental,
+    processar_shard,
+    inicializar_worker,
+    montar_shards,
+    resumir,
 )
-import holidays
+
+
+def _parse_data(valor, opcao):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Formato de data inválido em {opcao}. Use YYYY-MM-DD.")
+
+
+def _shard_de_json(shard):
+    data, primeiro_id, ultimo_id = shard
+    return (datetime.strptime(data, "%Y-%m-%d").date(), primeiro_id, ultimo_id)
+
+
+def _shard_para_json(shard):
+    data, primeiro_id, ultimo_id = shard
+    return [data.isoformat(), primeiro_id, ultimo_id]
+
+
+def _formatar_duracao(segundos):
+    segundos = int(segundos)
+    return f"{segundos // 3600:02d}:{segundos % 3600 // 60:02d}:{segundos % 60:02d}"
 
 
 class Command(BaseCommand):
     help = "Processa os registros de ponto para calcular o banco de horas dos funcionários."
-    br_holidays = holidays.country_holidays("BR")
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -24,26 +51,65 @@ class Command(BaseCommand):
             type=str,
             help="Processa os pontos para uma data específica (formato: YYYY-MM-DD). Padrão: ontem.",
         )
-
-    def eh_feriado(self, data_alvo):
-        """Verifica se a data é um feriado nacional ou um feriado customizado."""
-        # 1. Checa a biblioteca de feriados nacionais
-        if data_alvo in self.br_holidays:
-            return True
-
-        # 2. Checa o modelo de feriados customizados (não recorrentes)
-        if Feriado.objects.filter(data=data_alvo, recorrente=False).exists():
-            return True
-
-        # 3. Checa feriados customizados recorrentes
-        if Feriado.objects.filter(
-            data__day=data_alvo.day, data__month=data_alvo.month, recorrente=True
-        ).exists():
-            return True
-
-        return False
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Fecha os dias ainda não processados e recalcula só os dias marcados como pendentes.",
+        )
+        parser.add_argument(
+            "--from",
+            dest="from_date",
+            type=str,
+            help="Início de um reprocessamento por intervalo (formato: YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--to",
+            dest="to_date",
+            type=str,
+            help="Fim (inclusive) do reprocessamento por intervalo. Padrão: ontem.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Número de processos usados no reprocessamento por intervalo.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Quantidade de funcionários por shard (cada shard é uma transação).",
+        )
+        parser.add_argument(
+            "--wait",
+            action="store_true",
+            help="Se outra execução estiver em andamento, aguarda em vez de sair.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignora um reprocessamento interrompido do mesmo intervalo e começa do zero.",
+        )
 
     def handle(self, *args, **options):
+        # Execuções sobrepostas (cron a cada 2 minutos) brigariam pelas mesmas linhas.
+        try:
+            with trava_processamento(esperar=options["wait"]):
+                return self.executar(options)
+        except TravaOcupada as erro:
+            self.stdout.write(self.style.WARNING(f"{erro} Nada foi processado."))
+
+    def executar(self, options):
+        if options["incremental"]:
+            if options["date"] or options["from_date"] or options["to_date"]:
+                raise CommandError("--incremental não aceita --date, --from ou --to.")
+            return self.handle_incremental()
+
+        if options["from_date"] or options["to_date"]:
+            if options["date"]:
+                raise CommandError("Use --date ou --from/--to, não ambos.")
+            return self.handle_intervalo(options)
+
         target_date_str = options["date"]
         if target_date_str:
             try:
@@ -60,225 +126,130 @@ class Command(BaseCommand):
             f"Iniciando processamento de pontos para a data: {target_date.strftime('%d/%m/%Y')}..."
         )
 
-        active_employees = Funcionario.objects.filter(status="ATIVO")
+        with registrar_execucao(ExecucaoProcessamento(modo="DATA")) as execucao:
+            # Todo o dia é carregado e gravado em lote, em vez de funcionário a funcionário.
+            resultado = processar_data(target_date, log=self.stdout.write)
+            execucao.acumular(resumir(resultado))
 
-        for funcionario in active_employees:
-            self.process_employee(funcionario, target_date)
-
-        self.stdout.write(self.style.SUCCESS("Processamento concluído."))
-
-    def process_employee(self, funcionario, target_date):
-        # 0. Verificar se há abono de falta aprovado para o dia
-        if SolicitacaoAbono.objects.filter(
-            funcionario=funcionario,
-            data_inicio__date=target_date,
-            status="APROVADO",
-            tipo_abono="FALTA",
-        ).exists():
             self.stdout.write(
-                f"  - [INFO] Dia com abono de falta aprovado para {funcionario.nome_completo}. Pulando..."
-            )
-            # Garante que o saldo para o dia seja zero, removendo qualquer registro pré-existente.
-            BancoDeHoras.objects.filter(
-                funcionario=funcionario, data=target_date
-            ).delete()
-            return
-
-        # 1. Encontrar a escala do funcionário para o dia
-        escala_info = FuncionarioEscala.objects.filter(
-            funcionario=funcionario, data_inicio__lte=target_date
-        ).filter(
-            models.Q(data_fim__gte=target_date) | models.Q(data_fim__isnull=True)
-        ).first()
-
-        if not escala_info:
-            self.stdout.write(
-                f"  - [AVISO] Nenhuma escala encontrada para {funcionario.nome_completo} na data."
-            )
-            return
-
-        escala = escala_info.escala
-
-        # 2. Obter registros de ponto
-        current_timezone = timezone.get_current_timezone()
-        start_of_day_local = datetime.combine(
-            target_date, time.min, tzinfo=current_timezone
-        )
-        end_of_day_local = datetime.combine(
-            target_date, time.max, tzinfo=current_timezone
-        )
-        registros = RegistroPonto.objects.filter(
-            funcionario=funcionario,
-            timestamp__gte=start_of_day_local,
-            timestamp__lte=end_of_day_local,
-        ).order_by("timestamp")
-
-        # 3. Lógica de feriado
-        if self.eh_feriado(target_date):
-            self.process_holiday(funcionario, target_date, escala, registros)
-        else:
-            self.process_normal_day(funcionario, target_date, escala, registros)
-            
-        # Garante que o status operacional seja OFFLINE para o próximo dia
-        if funcionario.status_operacional != 'OFFLINE':
-            funcionario.status_operacional = 'OFFLINE'
-            funcionario.save(update_fields=['status_operacional'])
-            self.stdout.write(f"  - [STATUS] Status operacional de {funcionario.nome_completo} definido para OFFLINE.")
-
-    def process_holiday(self, funcionario, target_date, escala, registros):
-        self.stdout.write(f"  - [INFO] Dia de feriado para {funcionario.nome_completo}.")
-        jornada_liquida_minutos = self._calculate_jornada_liquida(registros)
-
-        if escala.prioritaria:
-            # Escala prioritária: Deve trabalhar, mas ganha 100% extra.
-            entrada_esperada_obj = datetime.combine(target_date, escala.horario_entrada)
-            saida_esperada_obj = datetime.combine(target_date, escala.horario_saida)
-            if saida_esperada_obj < entrada_esperada_obj:
-                saida_esperada_obj += timedelta(days=1)
-            
-            jornada_esperada_bruta = (saida_esperada_obj - entrada_esperada_obj).total_seconds() / 60
-            almoco_esperado = escala.duracao_almoco_minutos if jornada_esperada_bruta > 300 else 0
-            jornada_esperada_liquida = jornada_esperada_bruta - almoco_esperado
-
-            if not registros.exists():
-                # Falta em feriado em escala prioritária. Debita o dia.
-                saldo_dia = -jornada_esperada_liquida
-                descricao = "Falta em feriado (escala prioritária)"
-                self.stdout.write(f"  - [FALTA] {funcionario.nome_completo}: {descricao}")
-            else:
-                # Trabalhou no feriado. Ganha 100% sobre as horas trabalhadas.
-                saldo_dia = jornada_liquida_minutos + jornada_liquida_minutos - jornada_esperada_liquida
-                descricao = "Trabalho em feriado (100%)"
-                self.stdout.write(f"  - [OK] {funcionario.nome_completo}: {saldo_dia} min. ({descricao})")
-        else:
-            # Escala não prioritária: Folga no feriado, a menos que seja convocado.
-            if not registros.exists():
-                self.stdout.write(f"  - [INFO] Folga de feriado para {funcionario.nome_completo}. Sem processamento.")
-                BancoDeHoras.objects.filter(funcionario=funcionario, data=target_date).delete()
-                return 
-            else:
-                # Foi convocado e trabalhou. Ganha 100% das horas trabalhadas.
-                saldo_dia = jornada_liquida_minutos * 2
-                descricao = "Convocação em feriado (100%)"
-                self.stdout.write(f"  - [OK] {funcionario.nome_completo}: {saldo_dia} min. ({descricao})")
-        
-        saldo_final_minutos = round(saldo_dia)
-        if saldo_final_minutos != 0:
-             BancoDeHoras.objects.update_or_create(
-                funcionario=funcionario,
-                data=target_date,
-                defaults={'minutos': saldo_final_minutos, 'descricao': descricao}
+                f"  {resultado.verificados} funcionários verificados, "
+                f"{len(resultado.saldos)} saldos gravados."
             )
-        else:
-            # Limpa registro caso o saldo seja zero.
-            BancoDeHoras.objects.filter(funcionario=funcionario, data=target_date).delete()
-
+            self.atualizar_checkpoints()
+        self.stdout.write(self.style.SUCCESS("Processamento concluído."))
 
-    def process_normal_day(self, funcionario, target_date, escala, registros):
-        dia_da_semana = target_date.weekday()
-        if str(dia_da_semana) not in escala.dias_semana.split(","):
-            # TODO: Lógica para verificar se houve trabalho em dia de folga
-            self.stdout.write(
-                f"  - [INFO] Dia de folga para {funcionario.nome_completo}. Pulando..."
-            )
+    def handle_incremental(self):
+        with registrar_execucao(ExecucaoProcessamento(modo="INCREMENTAL")) as execucao:
+            resultados = processar_incremental(log=self.stdout.write)
+            for resultado in resultados:
+                execucao.acumular(resumir(resultado))
+        if not resultados:
+            self.stdout.write("Nenhuma alteração desde o último processamento.")
             return
-
-        if not registros.exists():
+        for resultado in resultados:
             self.stdout.write(
-                f"  - [FALTA] Falta injustificada detectada para {funcionario.nome_completo}."
+                f"  {resultado.target_date.strftime('%d/%m/%Y')}: {resultado.verificados} funcionários "
+                f"verificados, {len(resultado.saldos)} saldos gravados."
             )
-            BancoDeHoras.objects.filter(
-                funcionario=funcionario, data=target_date
-            ).delete()
-            return
-        
-        jornada_liquida_minutos = self._calculate_jornada_liquida(registros)
-
-        entrada_esperada_obj = datetime.combine(target_date, escala.horario_entrada)
-        saida_esperada_obj = datetime.combine(target_date, escala.horario_saida)
-
-        if saida_esperada_obj < entrada_esperada_obj:  # Turno noturno
-            saida_esperada_obj += timedelta(days=1)
-
-        carga_horaria_bruta_esperada = (
-            saida_esperada_obj - entrada_esperada_obj
-        ).total_seconds() / 60
-
-        almoco_a_descontar = 0
-        if carga_horaria_bruta_esperada > 300:
-            almoco_a_descontar = escala.duracao_almoco_minutos
-
-        carga_horaria_liquida_esperada = (
-            carga_horaria_bruta_esperada - almoco_a_descontar
-        )
-
-        diferenca_minutos = round(
-            jornada_liquida_minutos - carga_horaria_liquida_esperada
-        )
-
-        if diferenca_minutos != 0:
-            primeira_entrada = registros.filter(tipo="ENTRADA").first()
-            descricao = "Ajuste"
-            if primeira_entrada:
-                descricao = self.get_description(
-                    diferenca_minutos, primeira_entrada, escala.horario_entrada
+        self.stdout.write(self.style.SUCCESS("Processamento incremental concluído."))
+
+    def handle_intervalo(self, options):
+        ontem = timezone.now().date() - timedelta(days=1)
+        if not options["from_date"]:
+            raise CommandError("--to exige --from.")
+        data_inicio = _parse_data(options["from_date"], "--from")
+        data_fim = _parse_data(options["to_date"], "--to") if options["to_date"] else ontem
+        if data_fim < data_inicio:
+            raise CommandError("--to deve ser igual ou posterior a --from.")
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers e --chunk-size devem ser positivos.")
+
+        execucao = None
+        if not options["restart"]:
+            # Com a trava em mãos, uma execução do mesmo intervalo que não
+            # terminou foi interrompida: retoma a partir do último shard gravado.
+            execucao = (
+                ExecucaoProcessamento.objects.filter(
+                    modo="INTERVALO", data_inicial=data_inicio, data_final=data_fim
                 )
-
-            BancoDeHoras.objects.update_or_create(
-                funcionario=funcionario,
-                data=target_date,
-                defaults={"minutos": diferenca_minutos, "descricao": descricao},
+                .exclude(status="CONCLUIDO")
+                .exclude(shards=[])
+                .first()
             )
+        if execucao:
             self.stdout.write(
-                f"  - [OK] {funcionario.nome_completo}: {diferenca_minutos} min. ({descricao})"
+                f"Retomando o reprocessamento iniciado em "
+                f"{timezone.localtime(execucao.iniciado_em).strftime('%d/%m/%Y %H:%M')}: "
+                f"{len(execucao.shards_concluidos)} de {len(execucao.shards)} shards já gravados."
             )
         else:
-            self.stdout.write(f"  - [OK] {funcionario.nome_completo}: Jornada cumprida.")
-
-    def _calculate_jornada_liquida(self, registros):
-        jornada_bruta_minutos = self._calculate_paired_duration(registros, "ENTRADA", "SAIDA")
-        minutos_pausa = self._calculate_paired_duration(registros, "SAIDA_PAUSA", "VOLTA_PAUSA")
-        minutos_almoco = self._calculate_paired_duration(registros, "SAIDA_ALMOCO", "VOLTA_ALMOCO")
-        minutos_pausa_pessoal = self._calculate_paired_duration(registros, "SAIDA_PAUSA_PESSOAL", "VOLTA_PAUSA_PESSOAL")
-        return jornada_bruta_minutos - minutos_pausa - minutos_almoco - minutos_pausa_pessoal
-
-    def _calculate_paired_duration(self, registros, tipo_saida, tipo_volta):
-        saidas = list(registros.filter(tipo=tipo_saida))
-        voltas = list(registros.filter(tipo=tipo_volta))
-        total_duration = timedelta()
-
-        for s in saidas:
-            corresponding_volta = next(
-                (v for v in voltas if v.timestamp > s.timestamp), None
+            datas = [
+                data_inicio + timedelta(days=i)
+                for i in range((data_fim - data_inicio).days + 1)
+            ]
+            execucao = ExecucaoProcessamento(
+                modo="INTERVALO",
+                data_inicial=data_inicio,
+                data_final=data_fim,
+                shards=[
+                    _shard_para_json(shard)
+                    for shard in montar_shards(datas, options["chunk_size"])
+                ],
             )
-            if corresponding_volta:
-                total_duration += corresponding_volta.timestamp - s.timestamp
-                voltas.remove(corresponding_volta)
-
-        return total_duration.total_seconds() / 60
-
-    def get_description(
-        self, diferenca_minutos, entrada_real_obj, entrada_esperada_time
-    ):
-        local_timestamp = entrada_real_obj.timestamp.astimezone(
-            timezone.get_current_timezone()
+        self.stdout.write(
+            f"Reprocessando de {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}: "
+            f"{len(execucao.shards)} shards em {options['workers']} worker(s)..."
         )
-        entrada_real_time = local_timestamp.time()
 
-        atraso_minutos = (
-            datetime.combine(date.today(), entrada_real_time)
-            - datetime.combine(date.today(), entrada_esperada_time)
-        ).total_seconds() / 60
+        with registrar_execucao(execucao, gravar_inicio=True):
+            self.executar_shards(execucao, options["workers"])
+            self.atualizar_checkpoints()
+        self.stdout.write(self.style.SUCCESS("Reprocessamento concluído."))
+
+    def executar_shards(self, execucao, workers):
+        inicio = time.monotonic()
+        total = len(execucao.shards)
+        ja_gravados = len(execucao.shards_concluidos)
+        concluidos = {tuple(shard) for shard in execucao.shards_concluidos}
+        shards = [
+            _shard_de_json(shard)
+            for shard in execucao.shards
+            if tuple(shard) not in concluidos
+        ]
+
+        def registrar(feitos, parcial):
+            # Cada shard já foi gravado na sua transação; marcá-lo aqui é o
+            # checkpoint de onde uma execução interrompida recomeça.
+            execucao.acumular(parcial)
+            execucao.shards_concluidos.append(_shard_para_json(parcial["shard"]))
+            execucao.save()
+            decorrido = time.monotonic() - inicio
+            eta = decorrido / feitos * (len(shards) - feitos)
+            atual = ja_gravados + feitos
+            self.stdout.write(
+                f"  [{atual}/{total}] {atual * 100 // total}% "
+                f"- decorrido {_formatar_duracao(decorrido)} - ETA {_formatar_duracao(eta)}"
+            )
 
-        if atraso_minutos > 5:
-            atraso_arredondado = round(atraso_minutos)
-            if diferenca_minutos < 0 and (diferenca_minutos + atraso_arredondado) < -1:
-                return f"Atraso ({atraso_arredondado} min) e Saída Antecipada"
-            return f"Atraso de {atraso_arredondado} min"
+        if workers == 1:
+            for feitos, shard in enumerate(shards, start=1):
+                registrar(feitos, processar_shard(shard))
+        else:
+            # Nenhuma conexão aberta pode ser herdada pelos processos do pool.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=inicializar_worker
+            ) as pool:
+                futuros = [pool.submit(processar_shard, shard) for shard in shards]
+                for feitos, futuro in enumerate(as_completed(futuros), start=1):
+                    registrar(feitos, futuro.result())
 
-        if diferenca_minutos > 0:
-            return "Horas extras"
-        elif diferenca_minutos < 0:
-            return "Saída antecipada"
+        self.stdout.write(
+            f"  {execucao.funcionarios_verificados} funcionário-dias verificados, "
+            f"{execucao.saldos_gravados} saldos gravados em {_formatar_duracao(time.monotonic() - inicio)}."
+        )
 
-        return "Ajuste"
+    def atualizar_checkpoints(self):
+        gravados = atualizar_checkpoints()
+        if gravados:
+            self.stdout.write(f"  {gravados} checkpoints de saldo do banco de horas atualizados.")
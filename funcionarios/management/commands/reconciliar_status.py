@@ -0,0 +1,60 @@
+# funcionarios/management/commands/reconciliar_status.py
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from funcionarios.models import Funcionario
+from funcionarios.painel import (
+    anotar_ultimo_tipo,
+    invalidar_tabela_equipe,
+    status_pela_marcacao,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Corrige em lote o status operacional dos funcionários ativos que divergir "
+        "da última marcação de ponto do dia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Apenas lista as divergências, sem gravar.",
+        )
+
+    def handle(self, *args, **options):
+        # (status gravado, status esperado) -> ids
+        divergentes = defaultdict(list)
+        funcionarios = anotar_ultimo_tipo(Funcionario.objects.filter(status="ATIVO"))
+        for pk, status_atual, ultimo_tipo in funcionarios.values_list(
+            "pk", "status_operacional", "ultimo_tipo"
+        ).iterator(chunk_size=2000):
+            esperado = status_pela_marcacao(ultimo_tipo)
+            if status_atual != esperado:
+                divergentes[(status_atual, esperado)].append(pk)
+
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS("Nenhuma divergência de status encontrada."))
+            return
+
+        corrigidos = 0
+        for (status_atual, esperado), ids in divergentes.items():
+            self.stdout.write(f"  {len(ids)} funcionário(s) de {status_atual} para {esperado}.")
+            if options["dry_run"]:
+                continue
+            # Só corrige quem continua com o status lido: uma batida feita
+            # durante a reconciliação prevalece.
+            for inicio in range(0, len(ids), 1000):
+                corrigidos += Funcionario.objects.filter(
+                    pk__in=ids[inicio:inicio + 1000], status_operacional=status_atual
+                ).update(status_operacional=esperado)
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Simulação: nada foi gravado."))
+        else:
+            # O update em lote não dispara signals.
+            if corrigidos:
+                invalidar_tabela_equipe()
+            self.stdout.write(self.style.SUCCESS(f"{corrigidos} status corrigidos."))
@@ -2,28 +2,52 @@
 from django.shortcuts import redirect
 from django.urls import reverse
 
+from .models import Funcionario
+
+# Chave da sessão com a "bandeira" de troca de senha obrigatória. É lida do
+# banco na primeira requisição da sessão (o login sempre cria uma nova) e
+# atualizada pela troca de senha.
+CHAVE_SESSAO = "deve_alterar_senha"
+
+
+def marcar_senha_alterada(request):
+    request.session[CHAVE_SESSAO] = False
+
 
 class ForcePasswordChangeMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self._allowed_paths = None
 
-    def __call__(self, request):
-        response = self.get_response(request)
+    @property
+    def allowed_paths(self):
+        # URLs que o usuário sempre pode acessar. Resolvidas na primeira
+        # requisição, quando as URLs já estão carregadas.
+        if self._allowed_paths is None:
+            self._allowed_paths = frozenset(
+                [
+                    reverse("funcionarios:password_change"),
+                    reverse("funcionarios:logout"),
+                    reverse("admin:logout"),  # Para o admin não ser afetado
+                ]
+            )
+        return self._allowed_paths
 
-        # URLs que o usuário sempre pode acessar
-        allowed_paths = [
-            reverse("funcionarios:password_change"),
-            reverse("funcionarios:logout"),
-            reverse("admin:logout"),  # Para o admin não ser afetado
-        ]
+    def __call__(self, request):
+        # A verificação vem antes da view: quem precisa trocar a senha não
+        # chega a executar a página pedida.
+        if request.path not in self.allowed_paths and self._deve_alterar_senha(request):
+            return redirect("funcionarios:password_change")
+        return self.get_response(request)
 
+    def _deve_alterar_senha(self, request):
         # A lógica só se aplica se o usuário estiver logado e não for um superusuário
-        if request.user.is_authenticated and not request.user.is_superuser:
-            # Verifica se o funcionário tem a "bandeira" e não está em uma página permitida
-            if (
-                request.user.funcionario.deve_alterar_senha
-                and request.path not in allowed_paths
-            ):
-                return redirect("funcionarios:password_change")
-
-        return response
+        if not request.user.is_authenticated or request.user.is_superuser:
+            return False
+        if CHAVE_SESSAO not in request.session:
+            request.session[CHAVE_SESSAO] = bool(
+                Funcionario.objects.filter(user=request.user)
+                .values_list("deve_alterar_senha", flat=True)
+                .first()
+            )
+        return request.session[CHAVE_SESSAO]
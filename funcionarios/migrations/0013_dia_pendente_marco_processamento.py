@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0012_feriado_escala_prioritaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcoProcessamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultima_data_completa', models.DateField(help_text='Último dia processado por completo para todos os funcionários.')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Marco de Processamento',
+                'verbose_name_plural': 'Marcos de Processamento',
+            },
+        ),
+        migrations.CreateModel(
+            name='DiaPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('marcado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dias_pendentes', to='funcionarios.funcionario')),
+            ],
+            options={
+                'verbose_name': 'Dia Pendente de Processamento',
+                'verbose_name_plural': 'Dias Pendentes de Processamento',
+                'unique_together': {('funcionario', 'data')},
+            },
+        ),
+    ]
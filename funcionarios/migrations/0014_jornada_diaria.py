@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0013_dia_pendente_marco_processamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JornadaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('primeira_entrada', models.DateTimeField(blank=True, null=True)),
+                ('ultima_saida', models.DateTimeField(blank=True, null=True)),
+                ('marcacoes', models.PositiveIntegerField(default=0)),
+                ('minutos_trabalhados', models.IntegerField(default=0)),
+                ('minutos_pausa', models.PositiveIntegerField(default=0)),
+                ('minutos_almoco', models.PositiveIntegerField(default=0)),
+                ('minutos_pausa_pessoal', models.PositiveIntegerField(default=0)),
+                ('minutos_esperados', models.PositiveIntegerField(default=0)),
+                ('dia_de_trabalho', models.BooleanField(default=False)),
+                ('feriado', models.BooleanField(default=False)),
+                ('abonado', models.BooleanField(default=False, help_text='Dia com abono de falta aprovado.')),
+                ('processado_em', models.DateTimeField(auto_now=True)),
+                ('escala', models.ForeignKey(blank=True, help_text='Escala vigente no dia, usada no cálculo.', null=True, on_delete=django.db.models.deletion.SET_NULL, to='funcionarios.escala')),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jornadas', to='funcionarios.funcionario')),
+            ],
+            options={
+                'verbose_name': 'Jornada Diária',
+                'verbose_name_plural': 'Jornadas Diárias',
+                'ordering': ['-data'],
+                'indexes': [models.Index(fields=['data'], name='funcionario_data_22816e_idx')],
+                'unique_together': {('funcionario', 'data')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0014_jornada_diaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoBancoHoras',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_corte', models.DateField(help_text='Último dia incluído no saldo (fim do período).')),
+                ('minutos', models.IntegerField(help_text='Soma de todos os registros de banco de horas até a data de corte.')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_banco_horas', to='funcionarios.funcionario')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Banco de Horas',
+                'verbose_name_plural': 'Saldos de Banco de Horas',
+                'ordering': ['-data_corte'],
+                'unique_together': {('funcionario', 'data_corte')},
+            },
+        ),
+    ]
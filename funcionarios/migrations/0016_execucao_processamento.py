@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0015_saldo_banco_horas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoProcessamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modo', models.CharField(choices=[('DATA', 'Data única'), ('INTERVALO', 'Intervalo'), ('INCREMENTAL', 'Incremental')], max_length=12)),
+                ('status', models.CharField(choices=[('EM_ANDAMENTO', 'Em andamento'), ('CONCLUIDO', 'Concluído'), ('FALHOU', 'Falhou')], default='EM_ANDAMENTO', max_length=12)),
+                ('iniciado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('data_inicial', models.DateField(blank=True, null=True)),
+                ('data_final', models.DateField(blank=True, null=True)),
+                ('funcionarios_verificados', models.PositiveIntegerField(default=0)),
+                ('saldos_gravados', models.PositiveIntegerField(default=0)),
+                ('saldos_removidos', models.PositiveIntegerField(default=0)),
+                ('status_resetados', models.PositiveIntegerField(default=0)),
+                ('segundos_carga', models.FloatField(default=0)),
+                ('segundos_calculo', models.FloatField(default=0)),
+                ('segundos_gravacao', models.FloatField(default=0)),
+                ('segundos_total', models.FloatField(default=0)),
+                ('erro', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Execução do Processamento',
+                'verbose_name_plural': 'Execuções do Processamento',
+                'ordering': ['-iniciado_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0016_execucao_processamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravaProcessamento',
+            fields=[
+                ('nome', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('dono', models.CharField(help_text='host:pid do processo que detém a trava.', max_length=255)),
+                ('adquirida_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expira_em', models.DateTimeField(help_text='Depois disso a trava é considerada abandonada (processo morto).')),
+            ],
+            options={
+                'verbose_name': 'Trava de Processamento',
+                'verbose_name_plural': 'Travas de Processamento',
+            },
+        ),
+        migrations.AddField(
+            model_name='execucaoprocessamento',
+            name='shards',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='execucaoprocessamento',
+            name='shards_concluidos',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
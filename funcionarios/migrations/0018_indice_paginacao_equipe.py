@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0017_trava_e_retomada_processamento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='funcionario',
+            index=models.Index(fields=['nome_completo', 'id'], name='funcionario_nome_id_idx'),
+        ),
+    ]
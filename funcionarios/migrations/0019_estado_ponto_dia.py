@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0018_indice_paginacao_equipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoPontoDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('tem_entrada', models.BooleanField(default=False)),
+                ('tem_saida', models.BooleanField(default=False)),
+                ('pausas', models.PositiveIntegerField(default=0, help_text='Saídas para pausa programada no dia.')),
+                ('ultimo_tipo', models.CharField(blank=True, choices=[('ENTRADA', 'Entrada'), ('SAIDA', 'Saída'), ('SAIDA_PAUSA', 'Saída para Pausa Programada'), ('VOLTA_PAUSA', 'Volta da Pausa Programada'), ('SAIDA_PAUSA_PESSOAL', 'Saída para Pausa Pessoal'), ('VOLTA_PAUSA_PESSOAL', 'Volta da Pausa Pessoal'), ('SAIDA_ALMOCO', 'Saída Almoço'), ('VOLTA_ALMOCO', 'Volta Almoço')], max_length=30)),
+                ('escala_resolvida', models.BooleanField(default=False)),
+                ('dia_de_trabalho', models.BooleanField(default=False)),
+                ('inicio_jornada', models.DateTimeField(blank=True, help_text='Vazio se não houver escala no dia.', null=True)),
+                ('fim_jornada', models.DateTimeField(blank=True, null=True)),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estados_ponto', to='funcionarios.funcionario')),
+            ],
+            options={
+                'verbose_name': 'Estado do Ponto no Dia',
+                'verbose_name_plural': 'Estados do Ponto no Dia',
+                'unique_together': {('funcionario', 'data')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0020_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelogioPonto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('token_hash', models.CharField(editable=False, max_length=64, unique=True)),
+                ('ativo', models.BooleanField(default=True)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Relógio de Ponto',
+                'verbose_name_plural': 'Relógios de Ponto',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0021_relogio_ponto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='funcionario',
+            name='pis',
+            field=models.CharField(blank=True, help_text='Identifica o funcionário nos arquivos AFD da Portaria 1510.', max_length=11, null=True, unique=True, verbose_name='PIS/PASEP'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcionarios', '0022_funcionario_pis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroponto',
+            name='origem',
+            field=models.CharField(choices=[('WEB', 'Página'), ('FILA_OFFLINE', 'Página, reenviada depois de ficar sem conexão'), ('RELOGIO', 'Relógio de ponto'), ('AFD', 'Importação de AFD'), ('SOLICITACAO', 'Solicitação aprovada pelo supervisor')], default='WEB', max_length=20),
+        ),
+        # Sem default na criação: os registros existentes ficam com NULL em vez
+        # de receberem a hora da migração como se fosse a do recebimento.
+        migrations.AddField(
+            model_name='registroponto',
+            name='recebido_em',
+            field=models.DateTimeField(editable=False, help_text='Quando o servidor recebeu a batida (vazio nos registros anteriores ao campo).', null=True, verbose_name='Recebido em'),
+        ),
+        migrations.AlterField(
+            model_name='registroponto',
+            name='recebido_em',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='Quando o servidor recebeu a batida (vazio nos registros anteriores ao campo).', null=True, verbose_name='Recebido em'),
+        ),
+        migrations.AddField(
+            model_name='solicitacaohorario',
+            name='tipo_ponto',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+    ]
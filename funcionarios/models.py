@@ -1,4 +1,6 @@
 # funcionarios/models.py
+import hashlib
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -197,6 +199,15 @@ class Funcionario(models.Model):
 
     cpf = BRCPFField(unique=True)
 
+    pis = models.CharField(
+        max_length=11,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="PIS/PASEP",
+        help_text="Identifica o funcionário nos arquivos AFD da Portaria 1510.",
+    )
+
     rg = models.CharField(max_length=12)
 
     cargo = models.ForeignKey(Cargo, on_delete=models.SET_NULL, null=True, blank=True)
@@ -220,6 +231,12 @@ class Funcionario(models.Model):
 
     conta = models.CharField(max_length=15)
 
+    class Meta:
+        indexes = [
+            # Paginação por keyset da tabela de equipe do painel.
+            models.Index(fields=["nome_completo", "id"], name="funcionario_nome_id_idx"),
+        ]
+
     def __str__(self):
 
         return self.nome_completo
@@ -311,6 +328,10 @@ class SolicitacaoHorario(models.Model):
 
     motivo = models.TextField(max_length=500)
 
+    # Preenchido quando a solicitação vem de uma batida feita sem conexão e
+    # reenviada tarde: aprovada, ela vira o RegistroPonto desse tipo.
+    tipo_ponto = models.CharField(max_length=30, blank=True)
+
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDENTE")
 
     # Quem e quando analisou a solicitação
@@ -481,6 +502,25 @@ class RegistroPonto(models.Model):
 
     tipo = models.CharField(max_length=30, choices=TIPO_REGISTRO_CHOICES)
 
+    ORIGEM_CHOICES = [
+        ("WEB", "Página"),
+        ("FILA_OFFLINE", "Página, reenviada depois de ficar sem conexão"),
+        ("RELOGIO", "Relógio de ponto"),
+        ("AFD", "Importação de AFD"),
+        ("SOLICITACAO", "Solicitação aprovada pelo supervisor"),
+    ]
+
+    origem = models.CharField(max_length=20, choices=ORIGEM_CHOICES, default="WEB")
+
+    # Para batidas reenviadas ou importadas, difere do horário da marcação.
+    recebido_em = models.DateTimeField(
+        default=timezone.now,
+        null=True,
+        editable=False,
+        verbose_name="Recebido em",
+        help_text="Quando o servidor recebeu a batida (vazio nos registros anteriores ao campo).",
+    )
+
     class Meta:
 
         ordering = ["-timestamp"]
@@ -494,6 +534,122 @@ class RegistroPonto(models.Model):
         return f"{self.funcionario.nome_completo} - {self.get_tipo_display()} em {self.timestamp.strftime('%d/%m/%Y %H:%M:%S')}"
 
 
+class EstadoPontoDia(models.Model):
+
+    """
+    Resumo das marcações de um funcionário no dia (data local), mantido pela
+    batida de ponto para validar a próxima sem consultar os registros.
+    """
+
+    funcionario = models.ForeignKey(
+        Funcionario, on_delete=models.CASCADE, related_name="estados_ponto"
+    )
+
+    data = models.DateField()
+
+    tem_entrada = models.BooleanField(default=False)
+
+    tem_saida = models.BooleanField(default=False)
+
+    pausas = models.PositiveIntegerField(
+        default=0, help_text="Saídas para pausa programada no dia."
+    )
+
+    ultimo_tipo = models.CharField(
+        max_length=30, choices=RegistroPonto.TIPO_REGISTRO_CHOICES, blank=True
+    )
+
+    # Janela da escala, resolvida na primeira ENTRADA/SAIDA do dia e
+    # descartada quando a escala do funcionário muda.
+    escala_resolvida = models.BooleanField(default=False)
+
+    dia_de_trabalho = models.BooleanField(default=False)
+
+    inicio_jornada = models.DateTimeField(
+        null=True, blank=True, help_text="Vazio se não houver escala no dia."
+    )
+
+    fim_jornada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+
+        unique_together = ["funcionario", "data"]
+
+        verbose_name = "Estado do Ponto no Dia"
+
+        verbose_name_plural = "Estados do Ponto no Dia"
+
+    def __str__(self):
+
+        return f"{self.funcionario_id} em {self.data}: {self.ultimo_tipo or 'sem marcações'}"
+
+
+class ChaveIdempotencia(models.Model):
+
+    """
+    Chave enviada pelo cliente com uma batida, para que a repetição do mesmo
+    pedido devolva a batida já gravada em vez de criar outra.
+    """
+
+    funcionario = models.ForeignKey(
+        Funcionario, on_delete=models.CASCADE, related_name="chaves_idempotencia"
+    )
+
+    chave = models.CharField(max_length=64)
+
+    registro = models.ForeignKey(
+        RegistroPonto, on_delete=models.CASCADE, null=True, blank=True
+    )
+
+    criada_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+
+        unique_together = ["funcionario", "chave"]
+
+        # A limpeza das chaves vencidas é um range scan por data.
+        indexes = [models.Index(fields=["criada_em"])]
+
+        verbose_name = "Chave de Idempotência"
+
+        verbose_name_plural = "Chaves de Idempotência"
+
+    def __str__(self):
+
+        return f"{self.funcionario_id}: {self.chave}"
+
+
+class RelogioPonto(models.Model):
+
+    """
+    Relógio de ponto físico (REP) autorizado a enviar batidas em lote. Só o
+    hash do token é guardado; o token é mostrado uma vez, na criação.
+    """
+
+    nome = models.CharField(max_length=100)
+
+    token_hash = models.CharField(max_length=64, unique=True, editable=False)
+
+    ativo = models.BooleanField(default=True)
+
+    criado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+
+        verbose_name = "Relógio de Ponto"
+
+        verbose_name_plural = "Relógios de Ponto"
+
+    @staticmethod
+    def hash_do_token(token):
+
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def __str__(self):
+
+        return self.nome
+
+
 class Feriado(models.Model):
 
     nome = models.CharField(max_length=100)
@@ -508,3 +664,249 @@ class Feriado(models.Model):
     def __str__(self):
 
         return f"{self.nome} ({self.data.strftime('%d/%m')})"
+
+
+class DiaPendente(models.Model):
+
+    """Dia de um funcionário que precisa ser reprocessado no banco de horas."""
+
+    funcionario = models.ForeignKey(
+        Funcionario, on_delete=models.CASCADE, related_name="dias_pendentes"
+    )
+
+    data = models.DateField()
+
+    marcado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+
+        unique_together = ["funcionario", "data"]
+
+        verbose_name = "Dia Pendente de Processamento"
+
+        verbose_name_plural = "Dias Pendentes de Processamento"
+
+    def __str__(self):
+
+        return f"{self.funcionario_id} em {self.data}"
+
+
+class MarcoProcessamento(models.Model):
+
+    """Marca d'água do processamento incremental (registro único, pk=1)."""
+
+    ultima_data_completa = models.DateField(
+        help_text="Último dia processado por completo para todos os funcionários."
+    )
+
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+
+        verbose_name = "Marco de Processamento"
+
+        verbose_name_plural = "Marcos de Processamento"
+
+    def __str__(self):
+
+        return f"Processado até {self.ultima_data_completa}"
+
+
+class JornadaDiaria(models.Model):
+
+    """Resumo da jornada de um funcionário em um dia, gravado pelo processamento."""
+
+    funcionario = models.ForeignKey(
+        Funcionario, on_delete=models.CASCADE, related_name="jornadas"
+    )
+
+    data = models.DateField()
+
+    escala = models.ForeignKey(
+        Escala,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text="Escala vigente no dia, usada no cálculo.",
+    )
+
+    primeira_entrada = models.DateTimeField(null=True, blank=True)
+
+    ultima_saida = models.DateTimeField(null=True, blank=True)
+
+    marcacoes = models.PositiveIntegerField(default=0)
+
+    minutos_trabalhados = models.IntegerField(default=0)
+
+    minutos_pausa = models.PositiveIntegerField(default=0)
+
+    minutos_almoco = models.PositiveIntegerField(default=0)
+
+    minutos_pausa_pessoal = models.PositiveIntegerField(default=0)
+
+    minutos_esperados = models.PositiveIntegerField(default=0)
+
+    dia_de_trabalho = models.BooleanField(default=False)
+
+    feriado = models.BooleanField(default=False)
+
+    abonado = models.BooleanField(
+        default=False, help_text="Dia com abono de falta aprovado."
+    )
+
+    processado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+
+        ordering = ["-data"]
+
+        unique_together = ["funcionario", "data"]
+
+        # Folhas de ponto da empresa inteira são um range scan por data.
+        indexes = [models.Index(fields=["data"])]
+
+        verbose_name = "Jornada Diária"
+
+        verbose_name_plural = "Jornadas Diárias"
+
+    def __str__(self):
+
+        return f"{self.funcionario.nome_completo} em {self.data}: {self.minutos_trabalhados} min"
+
+
+class SaldoBancoHoras(models.Model):
+
+    """Saldo acumulado do banco de horas até uma data de corte (checkpoint)."""
+
+    funcionario = models.ForeignKey(
+        Funcionario, on_delete=models.CASCADE, related_name="saldos_banco_horas"
+    )
+
+    data_corte = models.DateField(
+        help_text="Último dia incluído no saldo (fim do período)."
+    )
+
+    minutos = models.IntegerField(
+        help_text="Soma de todos os registros de banco de horas até a data de corte."
+    )
+
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+
+        ordering = ["-data_corte"]
+
+        unique_together = ["funcionario", "data_corte"]
+
+        verbose_name = "Saldo de Banco de Horas"
+
+        verbose_name_plural = "Saldos de Banco de Horas"
+
+    def __str__(self):
+
+        return f"{self.funcionario.nome_completo}: {self.minutos} min até {self.data_corte}"
+
+
+class ExecucaoProcessamento(models.Model):
+
+    """Histórico das execuções do processar_pontos, com contadores e tempos por fase."""
+
+    MODO_CHOICES = [
+        ("DATA", "Data única"),
+        ("INTERVALO", "Intervalo"),
+        ("INCREMENTAL", "Incremental"),
+    ]
+
+    STATUS_CHOICES = [
+        ("EM_ANDAMENTO", "Em andamento"),
+        ("CONCLUIDO", "Concluído"),
+        ("FALHOU", "Falhou"),
+    ]
+
+    modo = models.CharField(max_length=12, choices=MODO_CHOICES)
+
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default="EM_ANDAMENTO")
+
+    iniciado_em = models.DateTimeField(default=timezone.now)
+
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+
+    data_inicial = models.DateField(null=True, blank=True)
+
+    data_final = models.DateField(null=True, blank=True)
+
+    funcionarios_verificados = models.PositiveIntegerField(default=0)
+
+    saldos_gravados = models.PositiveIntegerField(default=0)
+
+    saldos_removidos = models.PositiveIntegerField(default=0)
+
+    status_resetados = models.PositiveIntegerField(default=0)
+
+    segundos_carga = models.FloatField(default=0)
+
+    segundos_calculo = models.FloatField(default=0)
+
+    segundos_gravacao = models.FloatField(default=0)
+
+    segundos_total = models.FloatField(default=0)
+
+    erro = models.TextField(blank=True)
+
+    # Plano de um reprocessamento por intervalo e o que já foi gravado, para
+    # retomar uma execução interrompida: listas de [data ISO, primeiro_id, ultimo_id].
+    shards = models.JSONField(default=list, blank=True)
+
+    shards_concluidos = models.JSONField(default=list, blank=True)
+
+    class Meta:
+
+        ordering = ["-iniciado_em"]
+
+        verbose_name = "Execução do Processamento"
+
+        verbose_name_plural = "Execuções do Processamento"
+
+    def __str__(self):
+
+        return f"{self.get_modo_display()} em {self.iniciado_em:%d/%m/%Y %H:%M} ({self.get_status_display()})"
+
+    def acumular(self, resumo):
+        """Soma o resumo de uma data (ou shard) processada aos totais da execução."""
+        self.funcionarios_verificados += resumo["verificados"]
+        self.saldos_gravados += resumo["gravados"]
+        self.saldos_removidos += resumo["removidos"]
+        self.status_resetados += resumo["resetados"]
+        self.segundos_carga += resumo["tempos"]["carga"]
+        self.segundos_calculo += resumo["tempos"]["calculo"]
+        self.segundos_gravacao += resumo["tempos"]["gravacao"]
+        for data in resumo["datas"]:
+            if self.data_inicial is None or data < self.data_inicial:
+                self.data_inicial = data
+            if self.data_final is None or data > self.data_final:
+                self.data_final = data
+
+
+class TravaProcessamento(models.Model):
+
+    """Trava de execução para bancos sem advisory lock (fora do PostgreSQL)."""
+
+    nome = models.CharField(max_length=100, primary_key=True)
+
+    dono = models.CharField(max_length=255, help_text="host:pid do processo que detém a trava.")
+
+    adquirida_em = models.DateTimeField(default=timezone.now)
+
+    expira_em = models.DateTimeField(
+        help_text="Depois disso a trava é considerada abandonada (processo morto)."
+    )
+
+    class Meta:
+
+        verbose_name = "Trava de Processamento"
+
+        verbose_name_plural = "Travas de Processamento"
+
+    def __str__(self):
+
+        return f"{self.nome} ({self.dono})"
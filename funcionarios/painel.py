@@ -0,0 +1,214 @@
+# funcionarios/painel.py
+"""
+Dados do painel do supervisor: tabela de equipe e contadores de pendências.
+
+Em vez de consultar marcações, regra de pausa e escala membro a membro, a
+equipe inteira é carregada com subqueries anotadas (última saída para
+pausa/almoço e quantidade de pausas no dia), mais uma query para as regras
+de pausa dos cargos envolvidos e outra para as escalas. O custo de cada
+atualização do painel não depende do tamanho da equipe.
+
+Cada equipe (identificada pelo tópico de eventos do supervisor, ou o geral
+dos Analistas de RH) tem ainda um carimbo de versão no cache, que muda a cada
+batida de um membro; outro carimbo, geral, muda quando escalas, regras de
+pausa ou cadastros mudam. Enquanto os dois não mudam, a consulta periódica da
+tabela é respondida com 304 sem ir ao banco.
+"""
+import time as relogio
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import RegistroPonto, RegraDePausa
+from .escalas import resolve_range
+
+TIPOS_PAUSA = ["SAIDA_PAUSA", "SAIDA_ALMOCO", "SAIDA_PAUSA_PESSOAL"]
+
+
+def status_pela_marcacao(tipo):
+    """Status operacional correspondente ao último tipo de marcação do dia."""
+    if tipo == "ENTRADA" or (tipo or "").startswith("VOLTA_"):
+        return "DISPONIVEL"
+    if tipo in TIPOS_PAUSA:
+        return "EM_PAUSA"
+    # Sem marcação no dia, ou depois da SAIDA.
+    return "OFFLINE"
+
+
+def inicio_do_dia(agora=None):
+    """Meia-noite (no fuso local) do dia de `agora`."""
+    agora = timezone.localtime(agora)
+    return datetime.combine(agora.date(), time.min, tzinfo=agora.tzinfo)
+
+
+def anotar_ultimo_tipo(funcionarios, agora=None):
+    """Anota `ultimo_tipo`: o tipo da última marcação do dia (None se não houver)."""
+    registros_do_dia = RegistroPonto.objects.filter(
+        funcionario=OuterRef("pk"), timestamp__gte=inicio_do_dia(agora)
+    ).order_by("-timestamp")
+    return funcionarios.annotate(ultimo_tipo=Subquery(registros_do_dia.values("tipo")[:1]))
+
+
+def anotar_equipe(equipe, agora=None):
+    """Anota no queryset da equipe o necessário para montar a tabela de status."""
+    desde = inicio_do_dia(agora)
+    ultima_pausa = RegistroPonto.objects.filter(
+        funcionario=OuterRef("pk"), tipo__in=["SAIDA_PAUSA", "SAIDA_ALMOCO"]
+    ).order_by("-timestamp")
+    pausas_hoje = (
+        RegistroPonto.objects.filter(
+            funcionario=OuterRef("pk"), tipo="SAIDA_PAUSA", timestamp__gte=desde
+        )
+        .order_by()
+        .values("funcionario")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return equipe.select_related("user", "cargo").annotate(
+        ultima_pausa_em=Subquery(ultima_pausa.values("timestamp")[:1]),
+        ultima_pausa_tipo=Subquery(ultima_pausa.values("tipo")[:1]),
+        pausas_hoje=Coalesce(Subquery(pausas_hoje), 0, output_field=IntegerField()),
+    )
+
+
+def carregar_equipe(equipe, agora=None, limite=None):
+    """
+    Lista os membros da equipe (até `limite`) com `ultima_pausa_em`,
+    `limite_pausa_segundos` e `escala_atual` preenchidos, em número constante
+    de queries. Só lê: o status operacional exibido é o gravado pela batida de
+    ponto.
+    """
+    agora = agora or timezone.now()
+    hoje = timezone.localtime(agora).date()
+    membros = list(anotar_equipe(equipe, agora)[:limite])
+
+    regras = {
+        (cargo_id, ordem): duracao
+        for cargo_id, ordem, duracao in RegraDePausa.objects.filter(
+            cargo_id__in={membro.cargo_id for membro in membros if membro.cargo_id}
+        ).values_list("cargo_id", "ordem", "duracao_minutos")
+    }
+    escalas = resolve_range(membros, hoje, hoje)
+
+    for membro in membros:
+        membro.limite_pausa_segundos = 0
+        if membro.ultima_pausa_tipo == "SAIDA_PAUSA":
+            duracao = regras.get((membro.cargo_id, membro.pausas_hoje))
+            if duracao:
+                membro.limite_pausa_segundos = duracao * 60
+        membro.escala_atual = escalas.vinculo_em(membro, hoje)
+    return membros
+
+
+TAMANHO_PAGINA_EQUIPE = 50
+
+
+def pagina_da_equipe(equipe, apos=None, tamanho=None, agora=None):
+    """
+    Uma página da equipe em ordem de nome, carregada como em carregar_equipe.
+
+    A paginação é por keyset em (nome_completo, id): `apos` é o par do último
+    membro da página anterior, e cada página custa o mesmo, qualquer que seja
+    a posição. Retorna (membros, par para a próxima página ou None).
+    """
+    tamanho = tamanho or TAMANHO_PAGINA_EQUIPE
+    equipe = equipe.order_by("nome_completo", "id")
+    if apos:
+        nome, pk = apos
+        equipe = equipe.filter(Q(nome_completo__gt=nome) | Q(nome_completo=nome, pk__gt=pk))
+    membros = carregar_equipe(equipe, agora, limite=tamanho + 1)
+    if len(membros) <= tamanho:
+        return membros, None
+    ultimo = membros[tamanho - 1]
+    return membros[:tamanho], (ultimo.nome_completo, ultimo.pk)
+
+
+def prazo_da_pausa(membro):
+    """Momento em que a pausa programada em curso estoura o limite (ou None)."""
+    if (
+        membro.status_operacional != "EM_PAUSA"
+        or not membro.limite_pausa_segundos
+        or not membro.ultima_pausa_em
+    ):
+        return None
+    return membro.ultima_pausa_em + timedelta(seconds=membro.limite_pausa_segundos)
+
+
+CHAVE_VERSAO_GERAL = "painel:versao:geral"
+
+
+def _chave_versao(topico):
+    return f"painel:versao:{topico}"
+
+
+def _versoes(chaves):
+    versoes = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in versoes:
+            # Chave nova ou descartada pelo cache: um valor inédito garante
+            # que nenhum ETag emitido antes continue valendo.
+            cache.add(chave, relogio.time_ns(), timeout=None)
+            versoes[chave] = cache.get(chave)
+    return versoes
+
+
+def versao_da_equipe(topico):
+    """Carimbo de versão da tabela da equipe do `topico`, numa leitura do cache."""
+    chaves = [CHAVE_VERSAO_GERAL, _chave_versao(topico)]
+    versoes = _versoes(chaves)
+    return "-".join(str(versoes[chave]) for chave in chaves)
+
+
+def invalidar_tabela_equipe(*topicos):
+    """Muda a versão das equipes dos `topicos` ou, sem tópicos, de todas."""
+    chaves = [_chave_versao(topico) for topico in topicos] or [CHAVE_VERSAO_GERAL]
+    for chave in chaves:
+        try:
+            cache.incr(chave)
+        except ValueError:
+            # Sem versão no cache, a próxima leitura já cria uma nova.
+            pass
+
+
+# Contadores de solicitações pendentes por equipe. São ajustados pelos
+# signals ao criar, aprovar ou recusar uma solicitação e recontados (um COUNT)
+# só quando faltam no cache. A chave inclui a versão geral, que muda quando um
+# funcionário troca de supervisor; a validade limitada corrige a deriva de uma
+# recontagem concorrente com um ajuste.
+CONTADOR_PENDENTES_SEGUNDOS = 600
+
+
+def _chave_pendentes(geracao, topico, tipo):
+    return f"painel:pendentes:{geracao}:{topico}:{tipo}"
+
+
+def pendentes_da_equipe(topico, pendentes):
+    """
+    Total de pendências da equipe do `topico` por tipo. `pendentes` mapeia o
+    tipo para o queryset usado na recontagem.
+    """
+    geracao = _versoes([CHAVE_VERSAO_GERAL])[CHAVE_VERSAO_GERAL]
+    chaves = {tipo: _chave_pendentes(geracao, topico, tipo) for tipo in pendentes}
+    totais = cache.get_many(list(chaves.values()))
+    resultado = {}
+    for tipo, chave in chaves.items():
+        if chave not in totais:
+            totais[chave] = pendentes[tipo].count()
+            cache.add(chave, totais[chave], timeout=CONTADOR_PENDENTES_SEGUNDOS)
+        resultado[tipo] = totais[chave]
+    return resultado
+
+
+def ajustar_pendentes(topicos, tipo, delta):
+    geracao = cache.get(CHAVE_VERSAO_GERAL)
+    if geracao is None:
+        return
+    for topico in topicos:
+        try:
+            cache.incr(_chave_pendentes(geracao, topico, tipo), delta)
+        except ValueError:
+            # Sem contador no cache: a próxima leitura reconta.
+            pass
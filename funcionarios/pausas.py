@@ -0,0 +1,148 @@
+# funcionarios/pausas.py
+"""
+Acompanhamento, no servidor, das pausas programadas em curso.
+
+Cada processo mantém um min-heap com o prazo (início + limite da regra de
+pausa) de quem está em pausa, alimentado pelas batidas do barramento de
+eventos: SAIDA_PAUSA traz o prazo, e qualquer outra marcação encerra a pausa.
+Prazos vencidos saem do heap para o conjunto de excedidos de cada equipe, e
+"quem passou do limite agora" custa O(k) para os k excedidos da equipe, mais
+a retirada amortizada dos prazos que venceram desde a última consulta.
+
+O estado é reconstruído do banco na primeira consulta e depois a cada
+RESSINCRONIZAR_SEGUNDOS, o que recupera batidas perdidas (queda da escuta, ou
+batidas de outros processos quando o barramento é em processo). Batidas que
+chegam durante a reconstrução são reaplicadas sobre ela.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.utils import timezone
+
+from .eventos import TOPICO_TODOS, ao_receber, topicos_do_supervisor
+from .models import Funcionario
+from .painel import carregar_equipe, prazo_da_pausa
+
+RESSINCRONIZAR_SEGUNDOS = 300
+
+
+@dataclass(frozen=True)
+class PausaEmCurso:
+    funcionario_id: int
+    supervisor_id: int
+    inicio: datetime
+    prazo: datetime
+
+
+class RastreadorPausas:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._heap = []  # (prazo, funcionario_id, PausaEmCurso)
+        self._em_curso = {}  # funcionario_id -> PausaEmCurso ainda no heap
+        self._excedidas = defaultdict(dict)  # tópico -> {funcionario_id: PausaEmCurso}
+        self._reconstruindo = None  # batidas recebidas durante a reconstrução
+        self._sincronizado_em = None
+
+    def registrar(self, evento):
+        """Callback do barramento para cada batida."""
+        if evento.get("tipo") != "batida":
+            return
+        with self._trava:
+            if self._reconstruindo is not None:
+                self._reconstruindo.append(evento)
+            self._aplicar(evento)
+
+    def excedidas(self, topico, agora=None):
+        """Pausas da equipe do `topico` que passaram do limite, por prazo."""
+        if self._sincronizado_em is None or (
+            time.monotonic() - self._sincronizado_em > RESSINCRONIZAR_SEGUNDOS
+        ):
+            self.ressincronizar()
+        agora = agora or timezone.now()
+        with self._trava:
+            self._vencer(agora)
+            return sorted(self._excedidas.get(topico, {}).values(), key=lambda p: p.prazo)
+
+    def ressincronizar(self, agora=None):
+        agora = agora or timezone.now()
+        with self._trava:
+            self._reconstruindo = []
+        try:
+            membros = carregar_equipe(
+                Funcionario.objects.filter(status="ATIVO", status_operacional="EM_PAUSA"), agora
+            )
+        except Exception:
+            with self._trava:
+                self._reconstruindo = None
+            raise
+        with self._trava:
+            self._heap, self._em_curso, self._excedidas = [], {}, defaultdict(dict)
+            for membro in membros:
+                prazo = prazo_da_pausa(membro)
+                if prazo:
+                    self._iniciar(
+                        PausaEmCurso(membro.pk, membro.supervisor_id, membro.ultima_pausa_em, prazo)
+                    )
+            for evento in self._reconstruindo:
+                self._aplicar(evento)
+            self._reconstruindo = None
+            self._sincronizado_em = time.monotonic()
+
+    def _aplicar(self, evento):
+        funcionario_id = evento["funcionario_id"]
+        inicio = datetime.fromisoformat(evento["timestamp"])
+        atual = self._em_curso.get(funcionario_id) or self._excedida(funcionario_id)
+        if atual and atual.inicio > inicio:
+            # Batida antiga, já superada pelo estado atual.
+            return
+        self._encerrar(funcionario_id)
+        if evento.get("marcacao") == "SAIDA_PAUSA" and evento.get("prazo"):
+            self._iniciar(
+                PausaEmCurso(
+                    funcionario_id,
+                    evento.get("supervisor_id"),
+                    inicio,
+                    datetime.fromisoformat(evento["prazo"]),
+                )
+            )
+
+    def _iniciar(self, pausa):
+        self._em_curso[pausa.funcionario_id] = pausa
+        heapq.heappush(self._heap, (pausa.prazo, pausa.funcionario_id, pausa))
+
+    def _encerrar(self, funcionario_id):
+        # A entrada no heap fica e é descartada quando chegar ao topo.
+        pausa = self._em_curso.pop(funcionario_id, None) or self._excedida(funcionario_id)
+        if pausa:
+            for topico in topicos_do_supervisor(pausa.supervisor_id):
+                self._excedidas[topico].pop(funcionario_id, None)
+
+    def _excedida(self, funcionario_id):
+        return self._excedidas.get(TOPICO_TODOS, {}).get(funcionario_id)
+
+    def _vencer(self, agora):
+        while self._heap and self._heap[0][0] <= agora:
+            _, funcionario_id, pausa = heapq.heappop(self._heap)
+            if self._em_curso.get(funcionario_id) is not pausa:
+                continue
+            del self._em_curso[funcionario_id]
+            for topico in topicos_do_supervisor(pausa.supervisor_id):
+                self._excedidas[topico][funcionario_id] = pausa
+
+
+_rastreador = None
+_trava_rastreador = threading.Lock()
+
+
+def rastreador_pausas():
+    """O rastreador do processo, inscrito no barramento na primeira chamada."""
+    global _rastreador
+    with _trava_rastreador:
+        if _rastreador is None:
+            _rastreador = RastreadorPausas()
+            ao_receber(_rastreador.registrar)
+        return _rastreador
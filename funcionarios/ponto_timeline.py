@@ -0,0 +1,103 @@
+# funcionarios/ponto_timeline.py
+"""
+Linha do tempo das marcações de ponto de um dia.
+
+Usada pelo processamento do banco de horas e pelos relatórios para somar,
+numa única passada sobre as marcações ordenadas por horário, os minutos de
+jornada, pausa, almoço e pausa pessoal, além de apontar intervalos que
+ficaram abertos e marcações sem par.
+"""
+from collections import deque
+
+# Tipo que abre um intervalo -> (tipo que o fecha, categoria)
+ABERTURAS = {
+    "ENTRADA": ("SAIDA", "jornada"),
+    "SAIDA_PAUSA": ("VOLTA_PAUSA", "pausa"),
+    "SAIDA_ALMOCO": ("VOLTA_ALMOCO", "almoco"),
+    "SAIDA_PAUSA_PESSOAL": ("VOLTA_PAUSA_PESSOAL", "pausa_pessoal"),
+}
+
+# Tipo que fecha um intervalo -> categoria
+FECHAMENTOS = {fechamento: categoria for fechamento, categoria in ABERTURAS.values()}
+
+
+class Timeline:
+    """Resultado do pareamento das marcações de um dia."""
+
+    def __init__(self):
+        self.minutos = {categoria: 0.0 for _, categoria in ABERTURAS.values()}
+        self.primeira_entrada = None
+        self.ultima_saida = None
+        self.intervalos_abertos = []  # marcações de abertura que ficaram sem fechamento
+        self.anomalias = []  # (marcação, descrição)
+
+    @property
+    def minutos_jornada(self):
+        return self.minutos["jornada"]
+
+    @property
+    def minutos_pausa(self):
+        return self.minutos["pausa"]
+
+    @property
+    def minutos_almoco(self):
+        return self.minutos["almoco"]
+
+    @property
+    def minutos_pausa_pessoal(self):
+        return self.minutos["pausa_pessoal"]
+
+    @property
+    def minutos_trabalhados(self):
+        """Jornada bruta menos pausas, almoço e pausas pessoais."""
+        return (
+            self.minutos_jornada
+            - self.minutos_pausa
+            - self.minutos_almoco
+            - self.minutos_pausa_pessoal
+        )
+
+
+def montar_timeline(registros):
+    """
+    Pareia as marcações (ordenadas por timestamp) em uma única passada.
+
+    Cada fechamento consome a abertura mais antiga ainda pendente da mesma
+    categoria, o que dá os mesmos totais do pareamento "primeira volta depois
+    da saída" usado antes, em tempo linear.
+    """
+    timeline = Timeline()
+    pendentes = {categoria: deque() for categoria in timeline.minutos}
+
+    for registro in registros:
+        tipo = registro.tipo
+        if tipo in ABERTURAS:
+            pendentes[ABERTURAS[tipo][1]].append(registro)
+            if tipo == "ENTRADA" and timeline.primeira_entrada is None:
+                timeline.primeira_entrada = registro
+            continue
+
+        categoria = FECHAMENTOS.get(tipo)
+        if categoria is None:
+            timeline.anomalias.append((registro, f"Tipo de marcação desconhecido: {tipo}"))
+            continue
+
+        fila = pendentes[categoria]
+        if not fila or fila[0].timestamp >= registro.timestamp:
+            timeline.anomalias.append((registro, "Fechamento sem abertura correspondente"))
+            continue
+
+        abertura = fila.popleft()
+        timeline.minutos[categoria] += (
+            registro.timestamp - abertura.timestamp
+        ).total_seconds() / 60
+        if tipo == "SAIDA":
+            timeline.ultima_saida = registro
+
+    for fila in pendentes.values():
+        timeline.intervalos_abertos.extend(fila)
+    timeline.intervalos_abertos.sort(key=lambda r: r.timestamp)
+    for registro in timeline.intervalos_abertos:
+        timeline.anomalias.append((registro, "Intervalo aberto sem fechamento"))
+
+    return timeline
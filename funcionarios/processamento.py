@@ -0,0 +1,451 @@
+# funcionarios/processamento.py
+"""
+Motor de processamento em lote do banco de horas.
+
+Carrega de uma vez os dados do dia (pontos, escalas, abonos e feriados) de
+todos os funcionários ativos, calcula os saldos em memória e grava o
+resultado em uma única transação.
+"""
+from collections import defaultdict
+from datetime import timedelta, datetime, time, date
+from time import perf_counter
+
+import django
+from django.db import transaction, connections
+from django.utils import timezone
+
+from .models import (
+    Funcionario,
+    RegistroPonto,
+    BancoDeHoras,
+    SolicitacaoAbono,
+    DiaPendente,
+    MarcoProcessamento,
+    JornadaDiaria,
+)
+from .feriados import calendario_feriados
+from .escalas import resolve_range
+from .ponto_timeline import montar_timeline
+from .jornadas import jornada_esperada, montar_jornada
+from .banco_horas import atualizar_checkpoints, invalidar_checkpoints
+from .painel import invalidar_tabela_equipe
+
+
+class DadosDoDia:
+    """Tudo o que é preciso para processar uma data, carregado em lote."""
+
+    def __init__(self, target_date, funcionarios, escalas, registros, abonos, feriado):
+        self.target_date = target_date
+        self.funcionarios = funcionarios
+        self.escalas = escalas
+        self.registros = registros
+        self.abonos = abonos
+        self.feriado = feriado
+
+
+class ResultadoProcessamento:
+    """Saldos calculados para uma data, prontos para serem gravados."""
+
+    def __init__(self, target_date):
+        self.target_date = target_date
+        self.saldos = {}  # funcionario_id -> (minutos, descricao)
+        self.remover = set()  # funcionario_ids cujo saldo do dia deve ser apagado
+        self.status_offline = []  # funcionarios a terem o status resetado
+        self.jornadas = []  # JornadaDiaria de cada funcionário verificado
+        self.verificados = 0
+        self.removidos = 0
+        self.tempos = {"carga": 0.0, "calculo": 0.0, "gravacao": 0.0}  # segundos por fase
+
+
+# Campos da JornadaDiaria sobrescritos quando o dia é reprocessado.
+CAMPOS_JORNADA = [
+    "escala",
+    "primeira_entrada",
+    "ultima_saida",
+    "marcacoes",
+    "minutos_trabalhados",
+    "minutos_pausa",
+    "minutos_almoco",
+    "minutos_pausa_pessoal",
+    "minutos_esperados",
+    "dia_de_trabalho",
+    "feriado",
+    "abonado",
+    "processado_em",
+]
+
+
+def carregar_dados(target_date, funcionarios=None):
+    """Carrega os dados da data para todos os funcionários em poucas queries."""
+    if funcionarios is None:
+        funcionarios = Funcionario.objects.filter(status="ATIVO")
+    funcionarios = list(
+        funcionarios.only("id", "nome_completo", "status_operacional").order_by("id")
+    )
+    ids = [f.id for f in funcionarios]
+
+    abonos = set(
+        SolicitacaoAbono.objects.filter(
+            funcionario_id__in=ids,
+            data_inicio__date=target_date,
+            status="APROVADO",
+            tipo_abono="FALTA",
+        ).values_list("funcionario_id", flat=True)
+    )
+
+    resolver = resolve_range(ids, target_date, target_date)
+    escalas = {
+        funcionario_id: resolver.escala_em(funcionario_id, target_date)
+        for funcionario_id in ids
+    }
+
+    current_timezone = timezone.get_current_timezone()
+    start_of_day_local = datetime.combine(target_date, time.min, tzinfo=current_timezone)
+    end_of_day_local = datetime.combine(target_date, time.max, tzinfo=current_timezone)
+    registros = defaultdict(list)
+    for registro in (
+        RegistroPonto.objects.filter(
+            funcionario_id__in=ids,
+            timestamp__gte=start_of_day_local,
+            timestamp__lte=end_of_day_local,
+        )
+        .only("id", "funcionario_id", "tipo", "timestamp")
+        .order_by("funcionario_id", "timestamp")
+    ):
+        registros[registro.funcionario_id].append(registro)
+
+    return DadosDoDia(
+        target_date,
+        funcionarios,
+        escalas,
+        registros,
+        abonos,
+        calendario_feriados.eh_feriado(target_date),
+    )
+
+
+def calcular(dados, log=None, resetar_status=True):
+    """
+    Calcula em memória o saldo do dia de cada funcionário.
+
+    ``resetar_status`` só deve ser usado ao fechar o dia anterior: num
+    reprocessamento histórico o status atual dos funcionários não pode mudar.
+    """
+    log = log or (lambda msg: None)
+    resultado = ResultadoProcessamento(dados.target_date)
+
+    for funcionario in dados.funcionarios:
+        resultado.verificados += 1
+
+        escala = dados.escalas.get(funcionario.id)
+        registros = dados.registros.get(funcionario.id, [])
+        timeline = montar_timeline(registros)
+        abonado = funcionario.id in dados.abonos
+        resultado.jornadas.append(
+            montar_jornada(
+                funcionario.id, dados.target_date, escala, registros, timeline, abonado
+            )
+        )
+
+        # 0. Abono de falta aprovado: o saldo do dia deve ser zero.
+        if abonado:
+            log(
+                f"  - [INFO] Dia com abono de falta aprovado para {funcionario.nome_completo}. Pulando..."
+            )
+            resultado.remover.add(funcionario.id)
+            continue
+
+        # 1. Escala do funcionário para o dia
+        if not escala:
+            log(
+                f"  - [AVISO] Nenhuma escala encontrada para {funcionario.nome_completo} na data."
+            )
+            continue
+
+        # 2. Lógica de feriado
+        if dados.feriado:
+            saldo = calcular_feriado(
+                funcionario, dados.target_date, escala, registros, timeline, log
+            )
+        else:
+            saldo = calcular_dia_normal(
+                funcionario, dados.target_date, escala, registros, timeline, log
+            )
+
+        if saldo is None:
+            pass
+        elif saldo[0] != 0:
+            resultado.saldos[funcionario.id] = saldo
+        else:
+            # Limpa registro caso o saldo seja zero.
+            resultado.remover.add(funcionario.id)
+
+        # Garante que o status operacional seja OFFLINE para o próximo dia
+        if resetar_status and funcionario.status_operacional != "OFFLINE":
+            funcionario.status_operacional = "OFFLINE"
+            resultado.status_offline.append(funcionario)
+            log(
+                f"  - [STATUS] Status operacional de {funcionario.nome_completo} definido para OFFLINE."
+            )
+
+    return resultado
+
+
+def gravar(resultado):
+    """Grava os saldos, as jornadas do dia e o reset de status em uma única transação."""
+    target_date = resultado.target_date
+    with transaction.atomic():
+        BancoDeHoras.objects.bulk_create(
+            [
+                BancoDeHoras(
+                    funcionario_id=funcionario_id,
+                    data=target_date,
+                    minutos=minutos,
+                    descricao=descricao,
+                )
+                for funcionario_id, (minutos, descricao) in resultado.saldos.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["funcionario", "data"],
+            update_fields=["minutos", "descricao"],
+            batch_size=1000,
+        )
+        removidos = 0
+        if resultado.remover:
+            removidos, _ = BancoDeHoras.objects.filter(
+                funcionario_id__in=resultado.remover, data=target_date
+            ).delete()
+        JornadaDiaria.objects.bulk_create(
+            resultado.jornadas,
+            update_conflicts=True,
+            unique_fields=["funcionario", "data"],
+            update_fields=CAMPOS_JORNADA,
+            batch_size=1000,
+        )
+        # Checkpoints de saldo que incluíam o dia deixam de valer.
+        invalidar_checkpoints(
+            set(resultado.saldos) | resultado.remover, target_date
+        )
+        Funcionario.objects.bulk_update(
+            resultado.status_offline, ["status_operacional"], batch_size=1000
+        )
+        if resultado.status_offline:
+            # bulk_update não passa pelos signals: as tabelas de equipe em
+            # cache mostrariam o status de antes do reset.
+            transaction.on_commit(invalidar_tabela_equipe)
+    return removidos
+
+
+def processar_data(target_date, funcionarios=None, log=None, resetar_status=True):
+    """Processa uma data em lote: carrega, calcula em memória e grava."""
+    inicio = perf_counter()
+    dados = carregar_dados(target_date, funcionarios)
+    carregado = perf_counter()
+    resultado = calcular(dados, log, resetar_status)
+    calculado = perf_counter()
+    resultado.removidos = gravar(resultado)
+    resultado.tempos = {
+        "carga": carregado - inicio,
+        "calculo": calculado - carregado,
+        "gravacao": perf_counter() - calculado,
+    }
+    return resultado
+
+
+def resumir(resultado):
+    """Contadores e tempos de um resultado, no formato aceito por ExecucaoProcessamento.acumular."""
+    return {
+        "datas": [resultado.target_date],
+        "verificados": resultado.verificados,
+        "gravados": len(resultado.saldos),
+        "removidos": resultado.removidos,
+        "resetados": len(resultado.status_offline),
+        "tempos": resultado.tempos,
+    }
+
+
+def marcar_dias_pendentes(pares):
+    """
+    Enfileira pares (funcionario_id, data) para o próximo processamento
+    incremental. Uma única query, idempotente para pares já enfileirados.
+    """
+    agora = timezone.now()
+    DiaPendente.objects.bulk_create(
+        [
+            DiaPendente(funcionario_id=funcionario_id, data=data, marcado_em=agora)
+            for funcionario_id, data in set(pares)
+        ],
+        update_conflicts=True,
+        unique_fields=["funcionario", "data"],
+        update_fields=["marcado_em"],
+    )
+
+
+def processar_incremental(log=None):
+    """
+    Processa apenas o que mudou desde a última execução.
+
+    Dias ainda não fechados (do marco até ontem) são processados por
+    completo, uma única vez; depois disso só os pares (funcionário, data) da
+    fila de pendentes são recalculados. Sem pendências, custa duas queries.
+    Retorna a lista de resultados, vazia quando não havia nada a fazer.
+    """
+    ontem = timezone.localdate() - timedelta(days=1)
+    inicio = timezone.now()
+
+    marco = MarcoProcessamento.objects.filter(pk=1).first()
+    if marco is None:
+        datas_completas = [ontem]
+    else:
+        datas_completas = [
+            marco.ultima_data_completa + timedelta(days=i)
+            for i in range(1, (ontem - marco.ultima_data_completa).days + 1)
+        ]
+
+    pendentes = defaultdict(set)
+    for funcionario_id, data in DiaPendente.objects.filter(data__lte=ontem).values_list(
+        "funcionario_id", "data"
+    ):
+        if data not in datas_completas:
+            pendentes[data].add(funcionario_id)
+
+    if not datas_completas and not pendentes:
+        return []
+
+    resultados = []
+    for data in datas_completas:
+        # O status operacional só é resetado ao fechar o dia anterior.
+        resultados.append(processar_data(data, log=log, resetar_status=data == ontem))
+    for data, ids in sorted(pendentes.items()):
+        funcionarios = Funcionario.objects.filter(status="ATIVO", id__in=ids)
+        resultados.append(processar_data(data, funcionarios, log=log, resetar_status=False))
+
+    # Pares marcados durante esta execução ficam para a próxima.
+    DiaPendente.objects.filter(data__lte=ontem, marcado_em__lte=inicio).delete()
+    MarcoProcessamento.objects.update_or_create(
+        pk=1, defaults={"ultima_data_completa": ontem}
+    )
+    atualizar_checkpoints(ontem)
+    return resultados
+
+
+def processar_shard(shard):
+    """
+    Processa um shard (data, primeiro_id, ultimo_id) de um reprocessamento em
+    lote. Executado nos workers do pool; cada shard é gravado na sua própria
+    transação.
+    """
+    target_date, primeiro_id, ultimo_id = shard
+    funcionarios = Funcionario.objects.filter(
+        status="ATIVO", id__gte=primeiro_id, id__lte=ultimo_id
+    )
+    resultado = processar_data(target_date, funcionarios, resetar_status=False)
+    return dict(resumir(resultado), shard=shard)
+
+
+def inicializar_worker():
+    """Prepara um processo do pool: Django configurado e conexões próprias."""
+    django.setup()
+    # Cada worker abre a sua própria conexão na primeira query.
+    connections.close_all()
+
+
+def montar_shards(datas, tamanho_lote):
+    """Divide o trabalho em shards de (data, faixa de ids de funcionários)."""
+    ids = list(
+        Funcionario.objects.filter(status="ATIVO")
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    faixas = [
+        (ids[i], ids[min(i + tamanho_lote, len(ids)) - 1])
+        for i in range(0, len(ids), tamanho_lote)
+    ]
+    return [(data, primeiro, ultimo) for data in datas for primeiro, ultimo in faixas]
+
+
+def calcular_feriado(funcionario, target_date, escala, registros, timeline, log):
+    """Retorna (minutos, descricao) para um feriado."""
+    log(f"  - [INFO] Dia de feriado para {funcionario.nome_completo}.")
+    jornada_liquida_minutos = timeline.minutos_trabalhados
+
+    if escala.prioritaria:
+        # Escala prioritária: Deve trabalhar, mas ganha 100% extra.
+        jornada_esperada_liquida = jornada_esperada(target_date, escala)
+
+        if not registros:
+            # Falta em feriado em escala prioritária. Debita o dia.
+            saldo_dia = -jornada_esperada_liquida
+            descricao = "Falta em feriado (escala prioritária)"
+            log(f"  - [FALTA] {funcionario.nome_completo}: {descricao}")
+        else:
+            # Trabalhou no feriado. Ganha 100% sobre as horas trabalhadas.
+            saldo_dia = jornada_liquida_minutos + jornada_liquida_minutos - jornada_esperada_liquida
+            descricao = "Trabalho em feriado (100%)"
+            log(f"  - [OK] {funcionario.nome_completo}: {saldo_dia} min. ({descricao})")
+    else:
+        # Escala não prioritária: Folga no feriado, a menos que seja convocado.
+        if not registros:
+            log(f"  - [INFO] Folga de feriado para {funcionario.nome_completo}. Sem processamento.")
+            return 0, ""
+        # Foi convocado e trabalhou. Ganha 100% das horas trabalhadas.
+        saldo_dia = jornada_liquida_minutos * 2
+        descricao = "Convocação em feriado (100%)"
+        log(f"  - [OK] {funcionario.nome_completo}: {saldo_dia} min. ({descricao})")
+
+    return round(saldo_dia), descricao
+
+
+def calcular_dia_normal(funcionario, target_date, escala, registros, timeline, log):
+    """Retorna (minutos, descricao) para um dia comum, ou None se não houver o que gravar."""
+    dia_da_semana = target_date.weekday()
+    if str(dia_da_semana) not in escala.dias_semana.split(","):
+        # TODO: Lógica para verificar se houve trabalho em dia de folga
+        log(f"  - [INFO] Dia de folga para {funcionario.nome_completo}. Pulando...")
+        return None
+
+    if not registros:
+        log(f"  - [FALTA] Falta injustificada detectada para {funcionario.nome_completo}.")
+        return 0, ""
+
+    jornada_liquida_minutos = timeline.minutos_trabalhados
+    carga_horaria_liquida_esperada = jornada_esperada(target_date, escala)
+
+    diferenca_minutos = round(jornada_liquida_minutos - carga_horaria_liquida_esperada)
+
+    if diferenca_minutos == 0:
+        log(f"  - [OK] {funcionario.nome_completo}: Jornada cumprida.")
+        return 0, ""
+
+    descricao = "Ajuste"
+    if timeline.primeira_entrada:
+        descricao = get_description(
+            diferenca_minutos, timeline.primeira_entrada, escala.horario_entrada
+        )
+    log(f"  - [OK] {funcionario.nome_completo}: {diferenca_minutos} min. ({descricao})")
+    return diferenca_minutos, descricao
+
+
+def get_description(diferenca_minutos, entrada_real_obj, entrada_esperada_time):
+    local_timestamp = entrada_real_obj.timestamp.astimezone(
+        timezone.get_current_timezone()
+    )
+    entrada_real_time = local_timestamp.time()
+
+    atraso_minutos = (
+        datetime.combine(date.today(), entrada_real_time)
+        - datetime.combine(date.today(), entrada_esperada_time)
+    ).total_seconds() / 60
+
+    if atraso_minutos > 5:
+        atraso_arredondado = round(atraso_minutos)
+        if diferenca_minutos < 0 and (diferenca_minutos + atraso_arredondado) < -1:
+            return f"Atraso ({atraso_arredondado} min) e Saída Antecipada"
+        return f"Atraso de {atraso_arredondado} min"
+
+    if diferenca_minutos > 0:
+        return "Horas extras"
+    elif diferenca_minutos < 0:
+        return "Saída antecipada"
+
+    return "Ajuste"
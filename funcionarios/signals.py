@@ -1,10 +1,21 @@
 # funcionarios/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Funcionario, RegistroPonto
+from django.utils import timezone
+from .models import (
+    Funcionario, RegistroPonto, SolicitacaoAbono, Feriado, BancoDeHoras,
+    Cargo, Escala, FuncionarioEscala, RegraDePausa, SolicitacaoHorario, EstadoPontoDia,
+)
+from .processamento import marcar_dias_pendentes
+from .banco_horas import invalidar_checkpoints
+from .feriados import calendario_feriados
+from .eventos import topicos_do_funcionario
+from .painel import ajustar_pendentes, invalidar_tabela_equipe
+from .autorizacao import invalidar_autorizacoes
 import random
-from datetime import date
+from datetime import date, timedelta
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 
 
@@ -30,3 +41,171 @@ def criar_user_para_funcionario(sender, instance, created, **kwargs):
         print(
             f"Usuário criado para {instance.nome_completo}. Matrícula: {matricula}, Senha: {senha}"
         )
+
+
+def _data_local(momento):
+    # O formulário de abono grava datetimes ingênuos (já no horário local).
+    if timezone.is_naive(momento):
+        return momento.date()
+    return timezone.localtime(momento).date()
+
+
+@receiver(post_save, sender=RegistroPonto)
+@receiver(post_delete, sender=RegistroPonto)
+def marcar_dia_do_registro(sender, instance, **kwargs):
+    # O dia corrente é fechado por completo no próximo processamento, então só
+    # alterações em dias passados precisam ir para a fila.
+    data = _data_local(instance.timestamp)
+    if data < timezone.localdate():
+        marcar_dias_pendentes([(instance.funcionario_id, data)])
+
+
+@receiver(post_save, sender=SolicitacaoAbono)
+def marcar_dias_do_abono(sender, instance, **kwargs):
+    if instance.status != "APROVADO":
+        return
+    hoje = timezone.localdate()
+    data = _data_local(instance.data_inicio)
+    fim = min(_data_local(instance.data_fim), hoje - timedelta(days=1))
+    pares = []
+    while data <= fim:
+        pares.append((instance.funcionario_id, data))
+        data += timedelta(days=1)
+    if pares:
+        marcar_dias_pendentes(pares)
+
+
+@receiver(post_save, sender=Feriado)
+@receiver(post_delete, sender=Feriado)
+def invalidar_calendario_feriados(sender, **kwargs):
+    calendario_feriados.invalidar()
+
+
+@receiver(post_save, sender=BancoDeHoras)
+@receiver(post_delete, sender=BancoDeHoras)
+def invalidar_saldos_do_banco_de_horas(sender, instance, **kwargs):
+    # O processamento grava em lote (sem signals) e invalida por conta própria;
+    # aqui ficam as alterações avulsas, pelo admin ou pelo shell.
+    invalidar_checkpoints([instance.funcionario_id], instance.data)
+
+
+# Estado do ponto no dia (funcionarios/batidas.py). A batida já atualiza o
+# seu; registros gravados ou apagados por fora descartam o estado do dia, e
+# mudanças de escala, a janela resolvida dali em diante.
+
+@receiver(post_save, sender=RegistroPonto)
+@receiver(post_delete, sender=RegistroPonto)
+def descartar_estado_do_dia(sender, instance, **kwargs):
+    if getattr(instance, "_estado_ponto_atualizado", False):
+        return
+    EstadoPontoDia.objects.filter(
+        funcionario_id=instance.funcionario_id, data=_data_local(instance.timestamp)
+    ).delete()
+
+
+@receiver(post_save, sender=FuncionarioEscala)
+@receiver(post_delete, sender=FuncionarioEscala)
+@receiver(post_save, sender=Escala)
+@receiver(post_delete, sender=Escala)
+def descartar_janelas_de_escala(sender, instance, **kwargs):
+    estados = EstadoPontoDia.objects.filter(data__gte=timezone.localdate(), escala_resolvida=True)
+    if sender is FuncionarioEscala:
+        estados = estados.filter(funcionario_id=instance.funcionario_id)
+    estados.update(escala_resolvida=False)
+
+
+# A versão da tabela de equipe só muda depois do commit: mudada antes, uma
+# consulta no meio da transação guardaria os dados antigos com o ETag novo.
+
+@receiver(post_save, sender=RegistroPonto)
+@receiver(post_delete, sender=RegistroPonto)
+@receiver(post_save, sender=FuncionarioEscala)
+@receiver(post_delete, sender=FuncionarioEscala)
+def invalidar_tabela_da_equipe_do_funcionario(sender, instance, **kwargs):
+    try:
+        topicos = topicos_do_funcionario(instance.funcionario)
+    except Funcionario.DoesNotExist:
+        # Funcionário apagado junto: invalida todas as equipes.
+        topicos = []
+    transaction.on_commit(lambda: invalidar_tabela_equipe(*topicos))
+
+
+@receiver(post_save, sender=Funcionario)
+@receiver(post_delete, sender=Funcionario)
+@receiver(post_save, sender=Cargo)
+@receiver(post_delete, sender=Cargo)
+@receiver(post_save, sender=Escala)
+@receiver(post_delete, sender=Escala)
+@receiver(post_save, sender=RegraDePausa)
+@receiver(post_delete, sender=RegraDePausa)
+def invalidar_tabelas_de_equipe(sender, **kwargs):
+    transaction.on_commit(invalidar_tabela_equipe)
+
+
+# Contadores de pendências do painel. O status com que a solicitação foi
+# carregada fica guardado para saber, no save, se ela entrou ou saiu de
+# PENDENTE.
+TIPO_PENDENCIA = {SolicitacaoHorario: "horario", SolicitacaoAbono: "abono"}
+
+
+@receiver(post_init, sender=SolicitacaoHorario)
+@receiver(post_init, sender=SolicitacaoAbono)
+def guardar_status_da_solicitacao(sender, instance, **kwargs):
+    instance._status_carregado = instance.__dict__.get("status") if instance.pk else None
+
+
+def _ajustar_pendentes_da_solicitacao(sender, instance, delta):
+    try:
+        topicos = topicos_do_funcionario(instance.funcionario)
+    except Funcionario.DoesNotExist:
+        return
+    transaction.on_commit(lambda: ajustar_pendentes(topicos, TIPO_PENDENCIA[sender], delta))
+
+
+@receiver(post_save, sender=SolicitacaoHorario)
+@receiver(post_save, sender=SolicitacaoAbono)
+def contar_pendencia_salva(sender, instance, created, **kwargs):
+    antes = None if created else instance._status_carregado
+    delta = (instance.status == "PENDENTE") - (antes == "PENDENTE")
+    instance._status_carregado = instance.status
+    if delta:
+        _ajustar_pendentes_da_solicitacao(sender, instance, delta)
+
+
+@receiver(post_delete, sender=SolicitacaoHorario)
+@receiver(post_delete, sender=SolicitacaoAbono)
+def contar_pendencia_apagada(sender, instance, **kwargs):
+    if instance._status_carregado == "PENDENTE":
+        _ajustar_pendentes_da_solicitacao(sender, instance, -1)
+
+
+# Autorizações guardadas nas sessões: mudam com o supervisor ou o usuário de
+# um funcionário e com os grupos de um usuário. Updates em lote no supervisor
+# não passam por aqui e precisam chamar invalidar_autorizacoes().
+
+def _vinculos(instance):
+    return (instance.__dict__.get("supervisor_id"), instance.__dict__.get("user_id"))
+
+
+@receiver(post_init, sender=Funcionario)
+def guardar_vinculos_do_funcionario(sender, instance, **kwargs):
+    instance._vinculos_carregados = _vinculos(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Funcionario)
+def invalidar_autorizacoes_do_funcionario(sender, instance, created, **kwargs):
+    antes = None if created else instance._vinculos_carregados
+    instance._vinculos_carregados = _vinculos(instance)
+    if antes != instance._vinculos_carregados:
+        transaction.on_commit(invalidar_autorizacoes)
+
+
+@receiver(post_delete, sender=Funcionario)
+def invalidar_autorizacoes_do_funcionario_apagado(sender, **kwargs):
+    transaction.on_commit(invalidar_autorizacoes)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_autorizacoes_dos_grupos(sender, action, **kwargs):
+    if action.startswith("post_"):
+        transaction.on_commit(invalidar_autorizacoes)
@@ -1,12 +1,39 @@
 # funcionarios/tests.py
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from datetime import date, timedelta, datetime
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 # Importações para os modelos que vamos criar
-from django.contrib.auth.models import User
-from .models import Funcionario, Cargo, CentroDeCusto, Banco, Escala, FuncionarioEscala, BancoDeHoras, RegistroPonto
+from django.contrib.auth.models import Group, Permission, User
+from .models import (
+    Funcionario, Cargo, CentroDeCusto, Banco, Escala, FuncionarioEscala, BancoDeHoras, RegistroPonto,
+    DiaPendente, MarcoProcessamento, Feriado, JornadaDiaria, SaldoBancoHoras,
+    ExecucaoProcessamento, TravaProcessamento, RegraDePausa, SolicitacaoAbono, SolicitacaoHorario,
+    EstadoPontoDia, ChaveIdempotencia, RelogioPonto,
+)
+from .processamento import processar_data, processar_incremental
+from .feriados import calendario_feriados
+from .escalas import EscalaResolver, resolve_range
+from .jornadas import jornadas_do_periodo
+from .banco_horas import atualizar_checkpoints, saldo_em, saldos_em
+from .travas import TravaOcupada, trava_processamento
+from .painel import inicio_do_dia
+from .batidas import BatidaRecusada, registrar_batida, registrar_batida_idempotente
+from .pausas import RastreadorPausas, rastreador_pausas
+from .eventos import EVENTO_RECARREGAR, Broker, ao_receber, broker, publicar_batida
+from .ponto_timeline import montar_timeline
+from .management.commands.benchmark_timeline import dia_sintetico, pareamento_quadratico
 
 
 class PaginasDoSistemaTests(TestCase):
@@ -217,3 +244,1129 @@ class RelatorioEquipeViewTests(TestCase):
         self.assertEqual(totais['total_geral_extras_minutos'], 180)
         self.assertEqual(totais['total_geral_devidas_minutos'], 30)
         self.assertEqual(totais['total_geral_faltas'], dados_membro1['faltas'])
+
+
+class ProcessarPontosTests(TestCase):
+    def setUp(self):
+        self.escala = Escala.objects.create(
+            nome="Escala Comercial",
+            dias_semana="0,1,2,3,4",
+            horario_entrada="09:00",
+            horario_saida="18:00",
+        )
+        # Uma segunda-feira que não é feriado
+        self.data = date(2025, 3, 10)
+
+    def criar_funcionario(self, indice, **kwargs):
+        user = User.objects.create_user(f"proc{indice}", password="password")
+        funcionario = Funcionario.objects.create(
+            user=user,
+            nome_completo=f"Funcionário {indice}",
+            cpf=f"{indice:011d}",
+            data_nascimento="1990-01-01",
+            data_contratacao="2020-01-01",
+            deve_alterar_senha=False,
+            **kwargs,
+        )
+        FuncionarioEscala.objects.create(funcionario=funcionario, escala=self.escala, data_inicio="2020-01-01")
+        return funcionario
+
+    def bater(self, funcionario, tipo, hora, minuto=0):
+        momento = timezone.make_aware(datetime.combine(self.data, datetime.min.time()).replace(hour=hora, minute=minuto))
+        return RegistroPonto.objects.create(funcionario=funcionario, tipo=tipo, timestamp=momento)
+
+    def test_calcula_saldo_e_reseta_status(self):
+        funcionario = self.criar_funcionario(1, status_operacional="DISPONIVEL")
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA_ALMOCO", 12)
+        self.bater(funcionario, "VOLTA_ALMOCO", 13)
+        self.bater(funcionario, "SAIDA", 19)
+
+        call_command("processar_pontos", date=self.data.isoformat(), stdout=StringIO())
+
+        saldo = BancoDeHoras.objects.get(funcionario=funcionario, data=self.data)
+        self.assertEqual(saldo.minutos, 60)
+        self.assertEqual(saldo.descricao, "Horas extras")
+        funcionario.refresh_from_db()
+        self.assertEqual(funcionario.status_operacional, "OFFLINE")
+
+    def test_reset_de_status_invalida_a_tabela_da_equipe(self):
+        supervisor = self.criar_funcionario(1)
+        membro = self.criar_funcionario(2, supervisor=supervisor, status_operacional="DISPONIVEL")
+        self.bater(membro, "ENTRADA", 9)
+        self.client.login(username="proc1", password="password")
+        url = reverse("funcionarios:tabela_equipe")
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            processar_data(self.data)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["equipe"][0].status_operacional, "OFFLINE")
+
+    def test_grava_jornada_diaria(self):
+        funcionario = self.criar_funcionario(1)
+        ausente = self.criar_funcionario(2)
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA_ALMOCO", 12)
+        self.bater(funcionario, "VOLTA_ALMOCO", 13)
+        self.bater(funcionario, "SAIDA", 19)
+
+        processar_data(self.data)
+        processar_data(self.data)  # Reprocessar atualiza a mesma linha
+
+        jornada = JornadaDiaria.objects.get(funcionario=funcionario, data=self.data)
+        self.assertEqual(jornada.escala, self.escala)
+        self.assertEqual(jornada.marcacoes, 4)
+        self.assertEqual(jornada.minutos_trabalhados, 540)
+        self.assertEqual(jornada.minutos_almoco, 60)
+        self.assertEqual(jornada.minutos_esperados, 480)
+        self.assertEqual(timezone.localtime(jornada.ultima_saida).hour, 19)
+        self.assertTrue(jornada.dia_de_trabalho)
+        self.assertFalse(jornada.feriado)
+        falta = JornadaDiaria.objects.get(funcionario=ausente, data=self.data)
+        self.assertEqual((falta.marcacoes, falta.minutos_trabalhados), (0, 0))
+        self.assertEqual(JornadaDiaria.objects.count(), 2)
+
+        self.assertEqual(
+            jornadas_do_periodo([funcionario, ausente], self.data, self.data),
+            {(funcionario.id, self.data): jornada, (ausente.id, self.data): falta},
+        )
+
+    def test_jornada_cumprida_remove_saldo_antigo(self):
+        funcionario = self.criar_funcionario(1)
+        BancoDeHoras.objects.create(funcionario=funcionario, data=self.data, minutos=-30, descricao="Atraso")
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA", 17)
+
+        call_command("processar_pontos", date=self.data.isoformat(), stdout=StringIO())
+
+        self.assertFalse(BancoDeHoras.objects.filter(funcionario=funcionario, data=self.data).exists())
+
+    def test_numero_de_queries_independe_do_numero_de_funcionarios(self):
+        def contar_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                processar_data(self.data)
+            return len(ctx.captured_queries)
+
+        for i in range(1, 3):
+            funcionario = self.criar_funcionario(i, status_operacional="DISPONIVEL")
+            self.bater(funcionario, "ENTRADA", 9)
+            self.bater(funcionario, "SAIDA", 19)
+        poucos = contar_queries()
+
+        for i in range(3, 9):
+            funcionario = self.criar_funcionario(i, status_operacional="DISPONIVEL")
+            self.bater(funcionario, "ENTRADA", 9)
+            self.bater(funcionario, "SAIDA", 19)
+        Funcionario.objects.update(status_operacional="DISPONIVEL")
+        muitos = contar_queries()
+
+        self.assertEqual(poucos, muitos)
+
+    def test_reprocessamento_por_intervalo(self):
+        funcionario = self.criar_funcionario(1, status_operacional="DISPONIVEL")
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA", 19)
+        saida = StringIO()
+
+        call_command(
+            "processar_pontos",
+            "--from", (self.data - timedelta(days=2)).isoformat(),
+            "--to", self.data.isoformat(),
+            "--chunk-size", "1",
+            stdout=saida,
+        )
+
+        self.assertIn("[3/3] 100%", saida.getvalue())
+        self.assertEqual(BancoDeHoras.objects.get(funcionario=funcionario, data=self.data).minutos, 120)
+        # Um reprocessamento histórico não mexe no status atual do funcionário.
+        funcionario.refresh_from_db()
+        self.assertEqual(funcionario.status_operacional, "DISPONIVEL")
+
+    def test_incremental_ocioso_custa_duas_queries(self):
+        MarcoProcessamento.objects.create(pk=1, ultima_data_completa=timezone.localdate() - timedelta(days=1))
+
+        with self.assertNumQueries(2):
+            self.assertEqual(processar_incremental(), [])
+
+    def test_incremental_recalcula_apenas_dias_alterados(self):
+        MarcoProcessamento.objects.create(pk=1, ultima_data_completa=timezone.localdate() - timedelta(days=1))
+        funcionario = self.criar_funcionario(1)
+        outro = self.criar_funcionario(2)
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA", 19)
+
+        self.assertEqual(list(DiaPendente.objects.values_list("funcionario_id", "data")), [(funcionario.id, self.data)])
+        resultados = processar_incremental()
+
+        self.assertEqual(len(resultados), 1)
+        self.assertEqual(resultados[0].verificados, 1)
+        self.assertEqual(BancoDeHoras.objects.get(funcionario=funcionario, data=self.data).minutos, 120)
+        self.assertFalse(BancoDeHoras.objects.filter(funcionario=outro).exists())
+        self.assertFalse(DiaPendente.objects.exists())
+
+
+    def test_registra_execucao_com_contadores_e_tempos(self):
+        funcionario = self.criar_funcionario(1, status_operacional="DISPONIVEL")
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA", 19)
+
+        call_command("processar_pontos", date=self.data.isoformat(), stdout=StringIO())
+
+        execucao = ExecucaoProcessamento.objects.get()
+        self.assertEqual((execucao.modo, execucao.status), ("DATA", "CONCLUIDO"))
+        self.assertEqual((execucao.data_inicial, execucao.data_final), (self.data, self.data))
+        self.assertEqual(execucao.funcionarios_verificados, 1)
+        self.assertEqual(execucao.saldos_gravados, 1)
+        self.assertEqual(execucao.status_resetados, 1)
+        self.assertGreater(execucao.segundos_total, 0)
+        self.assertGreaterEqual(
+            execucao.segundos_total,
+            execucao.segundos_carga + execucao.segundos_calculo + execucao.segundos_gravacao,
+        )
+
+    def test_incremental_ocioso_nao_registra_execucao(self):
+        MarcoProcessamento.objects.create(pk=1, ultima_data_completa=timezone.localdate() - timedelta(days=1))
+
+        call_command("processar_pontos", "--incremental", stdout=StringIO())
+
+        self.assertFalse(ExecucaoProcessamento.objects.exists())
+
+    def test_admin_mostra_tendencia(self):
+        call_command("processar_pontos", date=self.data.isoformat(), stdout=StringIO())
+        User.objects.create_superuser("admin", "admin@test.com", "password")
+        self.client.login(username="admin", password="password")
+
+        response = self.client.get(reverse("admin:funcionarios_execucaoprocessamento_changelist"))
+
+        self.assertContains(response, "Tendência")
+
+
+    def test_execucao_sobreposta_sai_sem_processar(self):
+        funcionario = self.criar_funcionario(1)
+        self.bater(funcionario, "ENTRADA", 9)
+        self.bater(funcionario, "SAIDA", 19)
+        saida = StringIO()
+
+        with trava_processamento():
+            with self.assertRaises(TravaOcupada):
+                with trava_processamento():
+                    pass
+            call_command("processar_pontos", date=self.data.isoformat(), stdout=saida)
+
+        self.assertIn("execução de processar_pontos em andamento", saida.getvalue())
+        self.assertFalse(BancoDeHoras.objects.exists())
+        self.assertFalse(TravaProcessamento.objects.exists())
+
+    def test_trava_vencida_e_retomada(self):
+        TravaProcessamento.objects.create(
+            nome="processar_pontos", dono="outro-host:1", expira_em=timezone.now() - timedelta(minutes=1)
+        )
+
+        call_command("processar_pontos", date=self.data.isoformat(), stdout=StringIO())
+
+        self.assertEqual(ExecucaoProcessamento.objects.get().status, "CONCLUIDO")
+        self.assertFalse(TravaProcessamento.objects.exists())
+
+    def test_reprocessamento_interrompido_e_retomado(self):
+        funcionario = self.criar_funcionario(1)
+        datas = [self.data, self.data + timedelta(days=1), self.data + timedelta(days=2)]
+        for data in datas:
+            momento = timezone.make_aware(datetime.combine(data, datetime.min.time()))
+            RegistroPonto.objects.create(funcionario=funcionario, tipo="ENTRADA", timestamp=momento.replace(hour=9))
+            RegistroPonto.objects.create(funcionario=funcionario, tipo="SAIDA", timestamp=momento.replace(hour=19))
+        shards = [[data.isoformat(), funcionario.id, funcionario.id] for data in datas]
+        ExecucaoProcessamento.objects.create(
+            modo="INTERVALO", status="FALHOU", data_inicial=datas[0], data_final=datas[-1],
+            shards=shards, shards_concluidos=shards[:1],
+        )
+        saida = StringIO()
+
+        call_command("processar_pontos", "--from", datas[0].isoformat(), "--to", datas[-1].isoformat(), stdout=saida)
+
+        self.assertNotIn("[1/3]", saida.getvalue())
+        self.assertIn("[3/3] 100%", saida.getvalue())
+        # O shard já gravado antes da interrupção não é refeito.
+        self.assertEqual(
+            list(BancoDeHoras.objects.order_by("data").values_list("data", flat=True)), datas[1:]
+        )
+        execucao = ExecucaoProcessamento.objects.get()
+        self.assertEqual(execucao.status, "CONCLUIDO")
+        self.assertEqual(len(execucao.shards_concluidos), 3)
+
+        call_command(
+            "processar_pontos", "--from", datas[0].isoformat(), "--to", datas[-1].isoformat(),
+            "--restart", stdout=StringIO(),
+        )
+        self.assertEqual(BancoDeHoras.objects.count(), 3)
+
+
+class TabelaEquipeTests(TestCase):
+    def setUp(self):
+        self.cargo = Cargo.objects.create(nome="Operador")
+        RegraDePausa.objects.create(cargo=self.cargo, nome="Pausa 1", ordem=1, duracao_minutos=10)
+        RegraDePausa.objects.create(cargo=self.cargo, nome="Pausa 2", ordem=2, duracao_minutos=20)
+        self.escala = Escala.objects.create(
+            nome="Escala Painel", dias_semana="0,1,2,3,4,5,6", horario_entrada="08:00", horario_saida="17:00",
+        )
+        user = User.objects.create_user("supervisor_painel", password="password")
+        self.supervisor = Funcionario.objects.create(
+            user=user, nome_completo="Supervisor Painel", cpf="55555555555",
+            data_nascimento="1980-01-01", data_contratacao="2020-01-01", deve_alterar_senha=False,
+        )
+        self.client.login(username="supervisor_painel", password="password")
+        # A reconstrução do rastreador de pausas fica fora das contagens de queries.
+        rastreador_pausas().ressincronizar()
+
+    def adicionar_membros(self, quantidade):
+        # Marcações sempre dentro do dia local, mesmo logo depois da meia-noite.
+        inicio = max(timezone.now() - timedelta(minutes=30), inicio_do_dia())
+        for _ in range(quantidade):
+            indice = Funcionario.objects.count()
+            user = User.objects.create_user(f"membro_painel{indice}", password="password")
+            membro = Funcionario.objects.create(
+                user=user, nome_completo=f"Membro Painel {indice}", cpf=f"6{indice:010d}",
+                data_nascimento="1990-01-01", data_contratacao="2020-01-01",
+                supervisor=self.supervisor, cargo=self.cargo, status_operacional="EM_PAUSA",
+            )
+            FuncionarioEscala.objects.create(funcionario=membro, escala=self.escala, data_inicio="2020-01-01")
+            for minutos, tipo in [(0, "ENTRADA"), (10, "SAIDA_PAUSA"), (15, "VOLTA_PAUSA"), (25, "SAIDA_PAUSA")]:
+                RegistroPonto.objects.create(funcionario=membro, tipo=tipo, timestamp=inicio + timedelta(minutes=minutos))
+
+    def contar_queries(self):
+        # A primeira requisição da sessão resolve e guarda a autorização; a
+        # contagem é a das consultas periódicas seguintes.
+        self.client.get(reverse("funcionarios:tabela_equipe"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("funcionarios:tabela_equipe"))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_numero_de_queries_independe_do_tamanho_da_equipe(self):
+        self.adicionar_membros(2)
+        _, poucos = self.contar_queries()
+
+        self.adicionar_membros(8)
+        response, muitos = self.contar_queries()
+
+        self.assertEqual(poucos, muitos)
+        self.assertLessEqual(muitos, 8)
+        membro = response.context["equipe"][0]
+        self.assertEqual(membro.status_operacional, "EM_PAUSA")
+        self.assertEqual(membro.pausas_hoje, 2)
+        self.assertEqual(membro.limite_pausa_segundos, 20 * 60)
+        self.assertEqual(membro.escala_atual.escala, self.escala)
+        self.assertContains(response, "pause-timer")
+
+    def test_consulta_nao_grava_status(self):
+        self.adicionar_membros(2)
+        Funcionario.objects.filter(supervisor=self.supervisor).update(status_operacional="OFFLINE")
+
+        self.contar_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("funcionarios:tabela_equipe"))
+
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")])
+        self.assertFalse(Funcionario.objects.filter(status_operacional="EM_PAUSA").exists())
+
+    def test_analista_de_rh_pagina_e_filtra_a_tabela(self):
+        self.supervisor.user.groups.add(Group.objects.get(name="Analista de RH"))
+        self.adicionar_membros(5)
+        url = reverse("funcionarios:tabela_equipe")
+
+        nomes, parametros = [], {}
+        with patch("funcionarios.painel.TAMANHO_PAGINA_EQUIPE", 2):
+            while True:
+                response = self.client.get(url, parametros)
+                nomes += [membro.nome_completo for membro in response.context["equipe"]]
+                self.assertLessEqual(len(response.context["equipe"]), 2)
+                if not response.context["proxima_pagina"]:
+                    break
+                apos_nome, apos_id = response.context["proxima_pagina"]
+                parametros = {"apos_nome": apos_nome, "apos_id": apos_id}
+
+        self.assertEqual(
+            nomes,
+            list(Funcionario.objects.filter(status="ATIVO").order_by("nome_completo", "id")
+                 .values_list("nome_completo", flat=True)),
+        )
+
+        response = self.client.get(url, {"status_operacional": "OFFLINE"})
+        self.assertEqual([m.pk for m in response.context["equipe"]], [self.supervisor.pk])
+        response = self.client.get(url, {"supervisor": self.supervisor.pk, "cargo": self.cargo.pk})
+        self.assertEqual(len(response.context["equipe"]), 5)
+
+    def test_consulta_sem_mudancas_responde_304_sem_ler_marcacoes(self):
+        self.adicionar_membros(2)
+        url = reverse("funcionarios:tabela_equipe")
+        etag = self.client.get(url)["ETag"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in ctx.captured_queries if "registroponto" in q["sql"]])
+
+        # Batida de um membro muda a versão da equipe.
+        membro = Funcionario.objects.filter(supervisor=self.supervisor).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            RegistroPonto.objects.create(funcionario=membro, tipo="VOLTA_PAUSA")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        # Mudança de regra de pausa muda a versão de todas as equipes.
+        with self.captureOnCommitCallbacks(execute=True):
+            RegraDePausa.objects.filter(cargo=self.cargo, ordem=1).update(duracao_minutos=15)
+            RegraDePausa.objects.get(cargo=self.cargo, ordem=1).save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pausa_que_estoura_o_limite_muda_o_etag(self):
+        self.adicionar_membros(1)
+        rastreador_pausas().ressincronizar()
+        url = reverse("funcionarios:tabela_equipe")
+        response = self.client.get(url)
+        self.assertNotContains(response, "table-danger")
+
+        # A segunda pausa (20 min) começou há 5; o prazo vence sem nenhuma batida.
+        with patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(minutes=20)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "table-danger")
+
+    def test_reconciliar_status_corrige_divergencias(self):
+        self.adicionar_membros(3)
+        Funcionario.objects.filter(supervisor=self.supervisor).update(status_operacional="DISPONIVEL")
+        self.supervisor.status_operacional = "EM_PAUSA"  # Sem marcações hoje: deveria estar OFFLINE
+        self.supervisor.save()
+
+        call_command("reconciliar_status", stdout=StringIO())
+
+        self.assertEqual(Funcionario.objects.filter(supervisor=self.supervisor, status_operacional="EM_PAUSA").count(), 3)
+        self.supervisor.refresh_from_db()
+        self.assertEqual(self.supervisor.status_operacional, "OFFLINE")
+
+    def test_bate_ponto_atualiza_status_atomicamente(self):
+        self.supervisor.status_operacional = "DISPONIVEL"
+        self.supervisor.save()
+
+        self.client.post(reverse("funcionarios:bate_ponto"), {"tipo_ponto": "SAIDA_PAUSA_PESSOAL"})
+
+        self.supervisor.refresh_from_db()
+        self.assertEqual(self.supervisor.status_operacional, "EM_PAUSA")
+        self.assertEqual(RegistroPonto.objects.get(funcionario=self.supervisor).tipo, "SAIDA_PAUSA_PESSOAL")
+
+
+@override_settings(EVENTOS_EM_PROCESSO=True)
+class EventosEquipeTests(TestCase):
+    def setUp(self):
+        self.cargo = Cargo.objects.create(nome="Operador")
+        RegraDePausa.objects.create(cargo=self.cargo, nome="Pausa 1", ordem=1, duracao_minutos=1)
+        self.user = User.objects.create_user("supervisor_eventos", password="password")
+        self.user.user_permissions.add(Permission.objects.get(codename="view_funcionario"))
+        self.supervisor = Funcionario.objects.create(
+            user=self.user, nome_completo="Supervisor Eventos", cpf="77777777777",
+            data_nascimento="1980-01-01", data_contratacao="2020-01-01", deve_alterar_senha=False,
+        )
+        self.membro = Funcionario.objects.create(
+            user=User.objects.create_user("membro_eventos", password="password"),
+            nome_completo="Membro Eventos", cpf="88888888888", data_nascimento="1990-01-01",
+            data_contratacao="2020-01-01", supervisor=self.supervisor, cargo=self.cargo,
+            status_operacional="DISPONIVEL", deve_alterar_senha=False,
+        )
+
+    async def abrir_stream(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("funcionarios:eventos_equipe"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        fluxo = aiter(response.streaming_content)
+        self.assertEqual(await anext(fluxo), b"retry: 5000\n\n")
+        return fluxo
+
+    async def test_broker_entrega_por_topico_com_fila_limitada(self):
+        broker = Broker(tamanho_fila=2)
+        assinatura = broker.assinar("equipe:1")
+
+        broker.publicar("equipe:2", {"tipo": "batida", "funcionario_id": 2})
+        broker.publicar("equipe:1", {"tipo": "batida", "funcionario_id": 1})
+        self.assertEqual(await assinatura.proximo(1), {"tipo": "batida", "funcionario_id": 1})
+        self.assertIsNone(await assinatura.proximo(0.01))
+
+        # Um cliente que não consome perde os eventos e é mandado recarregar.
+        for funcionario_id in range(3):
+            broker.publicar("equipe:1", {"tipo": "batida", "funcionario_id": funcionario_id})
+        self.assertEqual(await assinatura.proximo(1), EVENTO_RECARREGAR)
+        self.assertIsNone(await assinatura.proximo(0.01))
+
+        assinatura.cancelar()
+        self.assertEqual(broker.publicar("equipe:1", {"tipo": "batida"}), 0)
+
+    async def test_barramento_roteia_batida_pelo_supervisor(self):
+        da_equipe = broker.assinar(f"equipe:{self.supervisor.pk}")
+        de_outra_equipe = broker.assinar("equipe:0")
+        recebidos = []
+        ao_receber(recebidos.append)
+        self.addCleanup(broker._callbacks.remove, recebidos.append)
+
+        publicar_batida(self.membro, "ENTRADA", timezone.now())
+
+        evento = await da_equipe.proximo(1)
+        self.assertEqual((evento["funcionario_id"], evento["marcacao"]), (self.membro.pk, "ENTRADA"))
+        self.assertIsNone(await de_outra_equipe.proximo(0.01))
+        self.assertEqual(recebidos, [evento])
+
+        # Numa reconexão da escuta, todas as filas são mandadas recarregar.
+        broker.recarregar_todos()
+        self.assertEqual(await de_outra_equipe.proximo(1), EVENTO_RECARREGAR)
+        da_equipe.cancelar()
+        de_outra_equipe.cancelar()
+
+    async def test_stream_envia_linha_de_quem_bateu_ponto(self):
+        fluxo = await self.abrir_stream()
+
+        await Funcionario.objects.filter(pk=self.membro.pk).aupdate(status_operacional="EM_PAUSA")
+        registro = await RegistroPonto.objects.acreate(funcionario=self.membro, tipo="SAIDA_PAUSA_PESSOAL")
+        publicar_batida(self.membro, registro.tipo, registro.timestamp)
+
+        evento = (await asyncio.wait_for(anext(fluxo), 5)).decode()
+        self.assertTrue(evento.startswith("event: status\n"))
+        self.assertIn(f"membro-{self.membro.pk}", evento)
+        self.assertIn("Em Pausa", evento)
+
+    async def test_stream_avisa_pausa_excedida(self):
+        # Pausa de 1 minuto que estoura logo depois de o stream abrir.
+        inicio = timezone.now() - timedelta(seconds=59.5)
+        await Funcionario.objects.filter(pk=self.membro.pk).aupdate(status_operacional="EM_PAUSA")
+        await RegistroPonto.objects.acreate(funcionario=self.membro, tipo="SAIDA_PAUSA", timestamp=inicio)
+
+        fluxo = await self.abrir_stream()
+
+        evento = (await asyncio.wait_for(anext(fluxo), 5)).decode()
+        self.assertEqual(
+            evento, f'event: pausa_excedida\ndata: {{"funcionario_id": {self.membro.pk}}}\n\n'
+        )
+
+    def test_rastreador_separa_pausas_excedidas_por_equipe(self):
+        rastreador = RastreadorPausas()
+        rastreador.ressincronizar()
+        agora = timezone.now()
+        equipe = f"equipe:{self.supervisor.pk}"
+
+        def batida(funcionario_id, marcacao, inicio, prazo=None):
+            rastreador.registrar({
+                "tipo": "batida", "funcionario_id": funcionario_id, "supervisor_id": self.supervisor.pk,
+                "marcacao": marcacao, "timestamp": inicio.isoformat(),
+                "prazo": prazo.isoformat() if prazo else None,
+            })
+
+        batida(1, "SAIDA_PAUSA", agora - timedelta(minutes=15), agora - timedelta(minutes=5))
+        batida(2, "SAIDA_PAUSA", agora - timedelta(minutes=5), agora + timedelta(minutes=5))
+        self.assertEqual([p.funcionario_id for p in rastreador.excedidas(equipe, agora)], [1])
+        self.assertEqual([p.funcionario_id for p in rastreador.excedidas("equipe:todos", agora)], [1])
+        self.assertEqual(rastreador.excedidas("equipe:0", agora), [])
+
+        depois = agora + timedelta(minutes=6)
+        self.assertEqual([p.funcionario_id for p in rastreador.excedidas(equipe, depois)], [1, 2])
+
+        batida(1, "VOLTA_PAUSA", agora)
+        batida(2, "SAIDA_PAUSA", agora - timedelta(hours=1))  # Fora de ordem: ignorada.
+        self.assertEqual([p.funcionario_id for p in rastreador.excedidas(equipe, depois)], [2])
+
+    def test_alertas_de_pausa_da_equipe(self):
+        # Pausa de 1 minuto iniciada há 3, vinda do banco na reconstrução.
+        Funcionario.objects.filter(pk=self.membro.pk).update(status_operacional="EM_PAUSA")
+        RegistroPonto.objects.create(
+            funcionario=self.membro, tipo="SAIDA_PAUSA",
+            timestamp=max(timezone.now() - timedelta(minutes=3), inicio_do_dia()),
+        )
+        rastreador_pausas().ressincronizar()
+        self.client.force_login(self.user)
+
+        alertas = self.client.get(reverse("funcionarios:alertas_pausa")).json()["alertas"]
+
+        self.assertEqual([(a["funcionario_id"], a["nome"]) for a in alertas], [(self.membro.pk, "Membro Eventos")])
+
+    def test_stream_sob_wsgi_cai_na_consulta_periodica(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("funcionarios:eventos_equipe"))
+        self.assertEqual(response.status_code, 204)
+
+    def test_bate_ponto_publica_depois_do_commit(self):
+        FuncionarioEscala.objects.create(
+            funcionario=self.membro, data_inicio="2020-01-01",
+            escala=Escala.objects.create(
+                nome="Escala Eventos", dias_semana="0,1,2,3,4,5,6",
+                horario_entrada="08:00", horario_saida="17:00",
+            ),
+        )
+        self.client.force_login(self.membro.user)
+
+        with patch("funcionarios.batidas.publicar_batida") as publicar:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self.client.post(reverse("funcionarios:bate_ponto"), {"tipo_ponto": "SAIDA_PAUSA_PESSOAL"})
+            publicar.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        publicar.assert_called_once()
+        self.assertEqual(publicar.call_args.args[:2], (self.membro, "SAIDA_PAUSA_PESSOAL"))
+
+
+class PainelPendenciasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("supervisor_pendencias", password="password")
+        user.user_permissions.add(Permission.objects.get(codename="view_funcionario"))
+        self.supervisor = Funcionario.objects.create(
+            user=user, nome_completo="Supervisor Pendencias", cpf="99999999999",
+            data_nascimento="1980-01-01", data_contratacao="2020-01-01", deve_alterar_senha=False,
+        )
+        self.membro = Funcionario.objects.create(
+            user=User.objects.create_user("membro_pendencias", password="password"),
+            nome_completo="Membro Pendencias", cpf="10101010101", data_nascimento="1990-01-01",
+            data_contratacao="2020-01-01", supervisor=self.supervisor,
+        )
+        self.client.login(username="supervisor_pendencias", password="password")
+
+    def criar_pendencias(self, quantidade):
+        agora = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(quantidade):
+                SolicitacaoHorario.objects.create(funcionario=self.membro, data_hora_ponto=agora, motivo="Teste")
+                SolicitacaoAbono.objects.create(
+                    funcionario=self.membro, tipo_abono="FALTA", data_inicio=agora, data_fim=agora, motivo="Teste",
+                )
+
+    def abrir_painel(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("funcionarios:supervisor_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response, ctx.captured_queries
+
+    def test_painel_tem_numero_constante_de_queries(self):
+        self.criar_pendencias(2)
+        self.abrir_painel()  # Primeira abertura conta as pendências.
+        _, poucas = self.abrir_painel()
+
+        self.criar_pendencias(20)
+        response, muitas = self.abrir_painel()
+
+        self.assertEqual(len(poucas), len(muitas))
+        self.assertFalse([q for q in muitas if "COUNT(" in q["sql"].upper()])
+        pagina = response.context["solicitacoes_horario_pendentes"]
+        self.assertEqual(pagina.paginator.count, 22)
+        self.assertEqual(len(pagina), 10)
+
+    def test_aprovacao_atualiza_o_contador(self):
+        self.criar_pendencias(3)
+        self.abrir_painel()
+        solicitacao = SolicitacaoHorario.objects.first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("funcionarios:aprovar_solicitacao_horario", args=[solicitacao.pk]))
+
+        response, _ = self.abrir_painel()
+        self.assertEqual(response.context["solicitacoes_horario_pendentes"].paginator.count, 2)
+        self.assertEqual(response.context["solicitacoes_abono_pendentes"].paginator.count, 3)
+
+
+class AutorizacaoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("supervisor_autorizacao", password="password")
+        user.user_permissions.add(Permission.objects.get(codename="view_funcionario"))
+        self.supervisor = Funcionario.objects.create(
+            user=user, nome_completo="Supervisor Autorizacao", cpf="12121212121",
+            data_nascimento="1980-01-01", data_contratacao="2020-01-01", deve_alterar_senha=False,
+        )
+        self.membro = Funcionario.objects.create(
+            user=User.objects.create_user("membro_autorizacao", password="password"),
+            nome_completo="Membro Autorizacao", cpf="13131313131", data_nascimento="1990-01-01",
+            data_contratacao="2020-01-01",
+        )
+        self.solicitacao = SolicitacaoHorario.objects.create(
+            funcionario=self.membro, data_hora_ponto=timezone.now(), motivo="Teste"
+        )
+        self.client.login(username="supervisor_autorizacao", password="password")
+
+    def aprovar(self):
+        self.client.get(reverse("funcionarios:aprovar_solicitacao_horario", args=[self.solicitacao.pk]))
+        self.solicitacao.refresh_from_db()
+        return self.solicitacao.status
+
+    def test_papel_e_equipe_ficam_na_sessao(self):
+        url = reverse("funcionarios:tabela_equipe")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if "auth_group" in q["sql"]])
+
+    def test_troca_de_supervisor_muda_a_autorizacao(self):
+        self.assertEqual(self.aprovar(), "PENDENTE")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.membro.supervisor = self.supervisor
+            self.membro.save()
+
+        self.assertEqual(self.aprovar(), "APROVADO")
+        self.assertEqual(self.solicitacao.analisado_por, self.supervisor)
+
+    def test_aprovacao_grava_a_batida_uma_vez(self):
+        self.membro.supervisor = self.supervisor
+        self.membro.save()
+        ontem = timezone.localtime().replace(hour=10, minute=0) - timedelta(days=1)
+        self.solicitacao.tipo_ponto = "ENTRADA"
+        self.solicitacao.data_hora_ponto = ontem
+        self.solicitacao.save()
+
+        self.assertEqual(self.aprovar(), "APROVADO")
+        self.assertEqual(self.aprovar(), "APROVADO")
+        registro = RegistroPonto.objects.get(funcionario=self.membro)
+        self.assertEqual((registro.tipo, registro.origem), ("ENTRADA", "SOLICITACAO"))
+
+        # Uma segunda entrada no dia é recusada, e a solicitação fica pendente.
+        self.solicitacao = SolicitacaoHorario.objects.create(
+            funcionario=self.membro, data_hora_ponto=ontem + timedelta(hours=1),
+            motivo="Teste", tipo_ponto="ENTRADA",
+        )
+        self.assertEqual(self.aprovar(), "PENDENTE")
+        self.assertEqual(RegistroPonto.objects.filter(funcionario=self.membro).count(), 1)
+
+    def test_entrada_no_grupo_de_rh_muda_a_autorizacao(self):
+        self.client.get(reverse("funcionarios:tabela_equipe"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supervisor.user.groups.add(Group.objects.get(name="Analista de RH"))
+
+        response = self.client.get(reverse("funcionarios:tabela_equipe"))
+        self.assertContains(response, "Membro Autorizacao")
+
+
+class TrocaDeSenhaObrigatoriaTests(TestCase):
+    def setUp(self):
+        self.funcionario = Funcionario.objects.create(
+            user=User.objects.create_user("senha_obrigatoria", password="password"),
+            nome_completo="Senha Obrigatoria", cpf="14141414141",
+            data_nascimento="1990-01-01", data_contratacao="2020-01-01",
+        )
+        self.client.login(username="senha_obrigatoria", password="password")
+
+    def test_redireciona_antes_de_executar_a_view(self):
+        response = self.client.post(reverse("funcionarios:bate_ponto"), {"tipo_ponto": "ENTRADA"})
+
+        self.assertRedirects(response, reverse("funcionarios:password_change"), fetch_redirect_response=False)
+        self.assertFalse(RegistroPonto.objects.filter(funcionario=self.funcionario).exists())
+
+    def test_bandeira_fica_na_sessao_depois_da_troca(self):
+        self.client.post(
+            reverse("funcionarios:password_change"),
+            {"old_password": "password", "new_password1": "Nova@Senha2026", "new_password2": "Nova@Senha2026"},
+        )
+        self.assertFalse(self.client.session["deve_alterar_senha"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("funcionarios:tabela_equipe"))
+        consulta_da_bandeira = 'SELECT "funcionarios_funcionario"."deve_alterar_senha"'
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith(consulta_da_bandeira)])
+
+
+class RegistrarBatidaTests(TestCase):
+    def setUp(self):
+        cargo = Cargo.objects.create(nome="Atendente")
+        RegraDePausa.objects.create(cargo=cargo, nome="Pausa 1", ordem=1, duracao_minutos=10)
+        self.funcionario = Funcionario.objects.create(
+            user=User.objects.create_user("batida_estado", password="password"),
+            nome_completo="Batida Estado", cpf="15151515151", data_nascimento="1990-01-01",
+            data_contratacao="2020-01-01", cargo=cargo, deve_alterar_senha=False,
+        )
+        FuncionarioEscala.objects.create(
+            funcionario=self.funcionario, data_inicio="2020-01-01",
+            escala=Escala.objects.create(
+                nome="Escala Batida", dias_semana="0,1,2,3,4,5,6",
+                horario_entrada="08:00", horario_saida="17:00",
+            ),
+        )
+        self.dez_horas = datetime.combine(
+            timezone.localdate(), datetime.min.time(), tzinfo=timezone.get_current_timezone()
+        ) + timedelta(hours=10)
+
+    def bater(self, tipo, minutos=0):
+        return registrar_batida(self.funcionario, tipo, self.dez_horas + timedelta(minutes=minutos))
+
+    def test_batidas_do_dia_mantem_o_estado(self):
+        self.bater("ENTRADA")
+        self.bater("SAIDA_PAUSA", 60)
+        with CaptureQueriesContext(connection) as ctx:
+            self.bater("VOLTA_PAUSA", 70)
+        # Trava do estado, status do funcionário, registro e estado.
+        comandos = [q for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(comandos), 4)
+        self.assertFalse([q for q in comandos if 'FROM "funcionarios_funcionario"' in q["sql"]])
+        self.bater("SAIDA", 120)
+
+        estado = EstadoPontoDia.objects.get(funcionario=self.funcionario)
+        self.assertEqual(estado.data, timezone.localdate())
+        self.assertTrue(estado.tem_entrada and estado.tem_saida)
+        self.assertEqual((estado.pausas, estado.ultimo_tipo), (1, "SAIDA"))
+        self.funcionario.refresh_from_db()
+        self.assertEqual(self.funcionario.status_operacional, "OFFLINE")
+        with self.assertRaisesMessage(BatidaRecusada, "Você já registrou uma saída hoje."):
+            self.bater("SAIDA", 130)
+
+    def test_recusa_fora_da_janela_da_escala(self):
+        with self.assertRaises(BatidaRecusada) as recusa:
+            registrar_batida(self.funcionario, "ENTRADA", self.dez_horas - timedelta(hours=5))
+        self.assertTrue(recusa.exception.fora_do_horario)
+        self.assertFalse(RegistroPonto.objects.exists())
+
+    def test_registro_gravado_por_fora_refaz_o_estado(self):
+        self.bater("ENTRADA")
+        for minutos, tipo in [(5, "SAIDA_PAUSA"), (15, "VOLTA_PAUSA")]:
+            RegistroPonto.objects.create(
+                funcionario=self.funcionario, tipo=tipo, timestamp=self.dez_horas + timedelta(minutes=minutos)
+            )
+        self.assertFalse(EstadoPontoDia.objects.exists())
+
+        with self.assertRaisesMessage(BatidaRecusada, "Você não tem mais pausas disponíveis"):
+            self.bater("SAIDA_PAUSA", 30)
+        self.assertEqual(EstadoPontoDia.objects.get(funcionario=self.funcionario).pausas, 1)
+
+    def bater_pela_api(self, tipo, chave):
+        return self.client.post(
+            reverse("funcionarios:api_bate_ponto"), {"tipo": tipo},
+            content_type="application/json", headers={"Idempotency-Key": chave},
+        )
+
+    def test_api_repetida_com_a_mesma_chave_nao_duplica(self):
+        Funcionario.objects.filter(pk=self.funcionario.pk).update(status_operacional="DISPONIVEL")
+        self.client.login(username="batida_estado", password="password")
+
+        primeira = self.bater_pela_api("SAIDA_PAUSA_PESSOAL", "chave-1")
+        repetida = self.bater_pela_api("SAIDA_PAUSA_PESSOAL", "chave-1")
+
+        self.assertEqual((primeira.status_code, repetida.status_code), (201, 200))
+        self.assertEqual(primeira.json()["registro"], repetida.json()["registro"])
+        self.assertTrue(repetida.json()["repetida"])
+        self.assertEqual(primeira.json()["status_operacional"], "EM_PAUSA")
+        self.assertIn("Voltar da Pausa", primeira.json()["relogio"])
+        self.assertEqual(RegistroPonto.objects.filter(funcionario=self.funcionario).count(), 1)
+
+        recusada = self.bater_pela_api("SAIDA_PAUSA_PESSOAL", "chave-2")
+        self.assertEqual(recusada.status_code, 422)
+        self.assertFalse(ChaveIdempotencia.objects.filter(chave="chave-2").exists())
+
+    def test_limpeza_apaga_chaves_vencidas(self):
+        registro = self.bater("ENTRADA")
+        ChaveIdempotencia.objects.create(funcionario=self.funcionario, chave="nova", registro=registro)
+        ChaveIdempotencia.objects.create(
+            funcionario=self.funcionario, chave="velha", registro=registro,
+            criada_em=timezone.now() - timedelta(days=2),
+        )
+
+        call_command("limpar_chaves_idempotencia", stdout=StringIO())
+
+        self.assertEqual(list(ChaveIdempotencia.objects.values_list("chave", flat=True)), ["nova"])
+
+    def test_fila_sem_conexao_reenviada_junta(self):
+        agora = timezone.now()
+        RegistroPonto.objects.create(funcionario=self.funcionario, tipo="ENTRADA", timestamp=agora - timedelta(hours=1))
+        self.funcionario.status_operacional = "DISPONIVEL"
+        self.funcionario.save()
+        registrar_batida_idempotente(self.funcionario, "SAIDA_PAUSA_PESSOAL", "k1", agora - timedelta(minutes=12))
+        self.client.login(username="batida_estado", password="password")
+
+        def batida(chave, tipo, minutos):
+            return {"chave": chave, "tipo": tipo, "timestamp": (agora - timedelta(minutes=minutos)).isoformat()}
+
+        fila = [
+            batida("k1", "SAIDA_PAUSA_PESSOAL", 13),  # o pedido original chegou
+            batida("k2", "VOLTA_PAUSA", 10),  # não há pausa programada aberta
+            batida("k3", "VOLTA_PAUSA_PESSOAL", 9),
+            batida("k4", "SAIDA_PAUSA_PESSOAL", 14),  # anterior à última marcação
+            batida("k5", "ENTRADA", 180),  # antiga: vai para o supervisor
+        ]
+        url = reverse("funcionarios:api_sincronizar_batidas")
+        resposta = self.client.post(url, {"batidas": fila}, content_type="application/json")
+
+        self.assertEqual(
+            [item["situacao"] for item in resposta.json()["resultados"]],
+            ["duplicada", "recusada", "gravada", "recusada", "solicitada"],
+        )
+        self.funcionario.refresh_from_db()
+        self.assertEqual(self.funcionario.status_operacional, "DISPONIVEL")
+        self.assertIn("Registrar Saída", resposta.json()["relogio"])
+        reenviada = RegistroPonto.objects.get(funcionario=self.funcionario, tipo="VOLTA_PAUSA_PESSOAL")
+        self.assertEqual(reenviada.origem, "FILA_OFFLINE")
+        self.assertGreater(reenviada.recebido_em - reenviada.timestamp, timedelta(minutes=8))
+        self.assertFalse(RegistroPonto.objects.filter(funcionario=self.funcionario, tipo="ENTRADA", origem="FILA_OFFLINE").exists())
+        solicitacao = SolicitacaoHorario.objects.get(funcionario=self.funcionario)
+        self.assertEqual((solicitacao.status, solicitacao.tipo_ponto), ("PENDENTE", "ENTRADA"))
+
+        reenvio = self.client.post(url, {"batidas": fila[2:]}, content_type="application/json")
+        self.assertEqual(reenvio.json()["duplicadas"], 2)
+        self.assertEqual(SolicitacaoHorario.objects.count(), 1)
+
+    def test_api_com_chave_de_batida_enviada_para_aprovacao(self):
+        self.client.login(username="batida_estado", password="password")
+        antiga = {"chave": "kx", "tipo": "ENTRADA", "timestamp": (timezone.now() - timedelta(hours=3)).isoformat()}
+        self.client.post(
+            reverse("funcionarios:api_sincronizar_batidas"), {"batidas": [antiga]},
+            content_type="application/json",
+        )
+
+        resposta = self.bater_pela_api("ENTRADA", "kx")
+
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.json()["situacao"], "solicitada")
+        self.assertFalse(RegistroPonto.objects.filter(funcionario=self.funcionario).exists())
+
+    def enviar_lote(self, batidas, token="token-relogio"):
+        return self.client.post(
+            reverse("funcionarios:api_relogio_batidas"), {"batidas": batidas},
+            content_type="application/json", headers={"Authorization": f"Token {token}"},
+        )
+
+    def test_lote_do_relogio(self):
+        RelogioPonto.objects.create(nome="Portaria", token_hash=RelogioPonto.hash_do_token("token-relogio"))
+        ontem = self.dez_horas - timedelta(days=1)
+        batidas = [
+            {"matricula": "batida_estado", "tipo": "SAIDA_PAUSA", "timestamp": (ontem + timedelta(hours=1)).isoformat()},
+            {"matricula": "batida_estado", "tipo": "ENTRADA", "timestamp": ontem.isoformat()},
+            {"matricula": "batida_estado", "tipo": "ENTRADA", "timestamp": (ontem - timedelta(hours=5)).isoformat()},
+            {"matricula": "ninguem", "tipo": "ENTRADA", "timestamp": ontem.isoformat()},
+        ]
+
+        self.assertEqual(self.enviar_lote(batidas, token="errado").status_code, 401)
+        resposta = self.enviar_lote(batidas)
+        self.assertEqual(
+            [item["situacao"] for item in resposta.json()["resultados"]],
+            ["gravada", "gravada", "recusada", "recusada"],
+        )
+        self.assertEqual(RegistroPonto.objects.filter(funcionario=self.funcionario).count(), 2)
+        estado = EstadoPontoDia.objects.get(funcionario=self.funcionario, data=ontem.date())
+        self.assertEqual((estado.tem_entrada, estado.pausas, estado.ultimo_tipo), (True, 1, "SAIDA_PAUSA"))
+        self.assertEqual(
+            set(RegistroPonto.objects.filter(funcionario=self.funcionario).values_list("origem", flat=True)),
+            {"RELOGIO"},
+        )
+        # Batidas de ontem não mudam o status de hoje, e a entrada de hoje segue livre.
+        status_antes = self.funcionario.status_operacional
+        self.funcionario.refresh_from_db()
+        self.assertEqual(self.funcionario.status_operacional, status_antes)
+        self.assertTrue(DiaPendente.objects.filter(funcionario=self.funcionario, data=ontem.date()).exists())
+        self.bater("ENTRADA")
+
+        # O reenvio do mesmo lote não duplica nada.
+        reenvio = self.enviar_lote(batidas[:2]).json()
+        self.assertEqual(reenvio["duplicadas"], 2)
+        self.assertEqual(RegistroPonto.objects.filter(funcionario=self.funcionario).count(), 3)
+
+
+    def test_relogio_envia_ontem_depois_de_uma_batida_hoje(self):
+        RelogioPonto.objects.create(nome="Portaria", token_hash=RelogioPonto.hash_do_token("token-relogio"))
+        self.bater("ENTRADA")
+        ontem = self.dez_horas - timedelta(days=1)
+        batidas = [
+            {"matricula": "batida_estado", "tipo": "ENTRADA", "timestamp": ontem.isoformat()},
+            {"matricula": "batida_estado", "tipo": "SAIDA", "timestamp": (ontem + timedelta(hours=6)).isoformat()},
+        ]
+
+        resposta = self.enviar_lote(batidas)
+
+        self.assertEqual([item["situacao"] for item in resposta.json()["resultados"]], ["gravada", "gravada"])
+        self.funcionario.refresh_from_db()
+        self.assertEqual(self.funcionario.status_operacional, "DISPONIVEL")
+
+
+class ImportarAfdTests(TestCase):
+    def setUp(self):
+        self.funcionario = Funcionario.objects.create(
+            nome_completo="Importado AFD", cpf="16161616161", pis="12345678901",
+            data_nascimento="1990-01-01", data_contratacao="2020-01-01",
+        )
+
+    def importar(self, linhas):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="latin-1") as arquivo:
+            arquivo.write("\r\n".join(linhas) + "\r\n")
+        self.addCleanup(os.remove, arquivo.name)
+        saida = StringIO()
+        call_command("importar_afd", arquivo.name, lote=2, stdout=saida)
+        return saida.getvalue()
+
+    def test_importa_as_duas_portarias_sem_duplicar(self):
+        linhas = [
+            "0000000001" + "1" * 20,  # cabeçalho: ignorado
+            "000000002" "3" "10012025" "0800" "012345678901",  # 1510, PIS
+            "000000003" "3" "2025-01-10T12:00:00-0300" "016161616161" "ABCD",  # 671, CPF
+            "000000004" "3" "32012025" "0800" "012345678901",  # data inválida
+            "000000005" "3" "10012025" "0900" "099999999999",  # PIS desconhecido
+        ]
+
+        saida = self.importar(linhas)
+
+        self.assertIn("2 marcações gravadas de 3 lidas", saida)
+        self.assertIn("1 de funcionários não cadastrados, 1 linhas inválidas", saida)
+        self.assertEqual(
+            [(timezone.localtime(r.timestamp).hour, r.tipo) for r in RegistroPonto.objects.order_by("timestamp")],
+            [(8, "ENTRADA"), (12, "SAIDA")],
+        )
+        self.assertTrue(DiaPendente.objects.filter(funcionario=self.funcionario, data=date(2025, 1, 10)).exists())
+
+        self.assertIn("0 marcações gravadas de 3 lidas (2 já existentes", self.importar(linhas))
+        self.assertEqual(RegistroPonto.objects.count(), 2)
+
+
+class SaldoBancoHorasTests(TestCase):
+    def setUp(self):
+        self.funcionario = Funcionario.objects.create(
+            nome_completo="Saldo Teste", cpf="44444444444",
+            data_nascimento="1990-01-01", data_contratacao="2020-01-01",
+        )
+        for dia, minutos in [(date(2025, 1, 10), 60), (date(2025, 1, 20), -15), (date(2025, 3, 5), 30)]:
+            BancoDeHoras.objects.create(funcionario=self.funcionario, data=dia, minutos=minutos, descricao="Ajuste")
+
+    def test_checkpoints_mensais(self):
+        self.assertEqual(atualizar_checkpoints(date(2025, 3, 31)), 3)
+
+        self.assertEqual(
+            list(SaldoBancoHoras.objects.order_by("data_corte").values_list("data_corte", "minutos")),
+            [(date(2025, 1, 31), 45), (date(2025, 2, 28), 45), (date(2025, 3, 31), 75)],
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(saldo_em(self.funcionario), 75)
+        self.assertEqual(saldo_em(self.funcionario, date(2025, 1, 15)), 60)
+        self.assertEqual(saldos_em([self.funcionario], date(2025, 2, 10)), {self.funcionario.id: 45})
+        # Nada novo para gravar na segunda execução.
+        self.assertEqual(atualizar_checkpoints(date(2025, 3, 31)), 0)
+
+    def test_alteracao_antiga_invalida_checkpoints_posteriores(self):
+        atualizar_checkpoints(date(2025, 3, 31))
+
+        BancoDeHoras.objects.create(funcionario=self.funcionario, data=date(2025, 2, 3), minutos=-100, descricao="Atraso")
+
+        self.assertEqual(list(SaldoBancoHoras.objects.values_list("data_corte", flat=True)), [date(2025, 1, 31)])
+        self.assertEqual(saldo_em(self.funcionario), -25)
+        atualizar_checkpoints(date(2025, 3, 31))
+        self.assertEqual(SaldoBancoHoras.objects.get(data_corte=date(2025, 3, 31)).minutos, -25)
+
+
+class CalendarioFeriadosTests(TestCase):
+    def setUp(self):
+        # O cache é do processo e não acompanha o rollback entre os testes.
+        calendario_feriados.invalidar()
+        self.addCleanup(calendario_feriados.invalidar)
+
+    def test_combina_feriados_nacionais_e_customizados(self):
+        Feriado.objects.create(nome="Aniversário da Cidade", data=date(2025, 1, 25))
+        Feriado.objects.create(nome="Padroeiro", data=date(2010, 6, 13), recorrente=True)
+
+        datas = calendario_feriados.datas(2025)
+
+        self.assertIn(date(2025, 12, 25), datas)  # Natal (nacional)
+        self.assertIn(date(2025, 1, 25), datas)
+        self.assertIn(date(2025, 6, 13), datas)
+        self.assertNotIn(date(2026, 1, 25), calendario_feriados.datas(2026))
+        self.assertIn(date(2026, 6, 13), calendario_feriados.datas(2026))
+
+    def test_consultas_usam_o_cache_e_signal_invalida(self):
+        calendario_feriados.datas(2025)
+        with self.assertNumQueries(0):
+            self.assertFalse(calendario_feriados.eh_feriado(date(2025, 3, 11)))
+
+        Feriado.objects.create(nome="Feriado Municipal", data=date(2025, 3, 11))
+
+        self.assertTrue(calendario_feriados.eh_feriado(date(2025, 3, 11)))
+
+
+class EscalaResolverTests(TestCase):
+    def setUp(self):
+        self.diurna = Escala.objects.create(nome="Diurna", dias_semana="0,1,2,3,4", horario_entrada="08:00", horario_saida="17:00")
+        self.noturna = Escala.objects.create(nome="Noturna", dias_semana="0,1,2,3,4", horario_entrada="22:00", horario_saida="06:00")
+        self.funcionarios = []
+        for i in range(1, 4):
+            user = User.objects.create_user(f"escala{i}", password="password")
+            self.funcionarios.append(Funcionario.objects.create(
+                user=user, nome_completo=f"Escala {i}", cpf=f"9{i:010d}",
+                data_nascimento="1990-01-01", data_contratacao="2020-01-01",
+            ))
+
+    def test_resolve_periodos_em_sequencia(self):
+        funcionario = self.funcionarios[0]
+        FuncionarioEscala.objects.create(funcionario=funcionario, escala=self.diurna, data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 31))
+        FuncionarioEscala.objects.create(funcionario=funcionario, escala=self.noturna, data_inicio=date(2025, 2, 1))
+
+        resolver = EscalaResolver.carregar([funcionario])
+
+        self.assertIsNone(resolver.escala_em(funcionario, date(2024, 12, 31)))
+        self.assertEqual(resolver.escala_em(funcionario, date(2025, 1, 31)), self.diurna)
+        self.assertEqual(resolver.escala_em(funcionario, date(2025, 2, 1)), self.noturna)
+        self.assertEqual(resolver.escala_em(funcionario.id, date(2030, 1, 1)), self.noturna)
+
+    def test_periodo_sobreposto_e_lacuna(self):
+        funcionario = self.funcionarios[0]
+        FuncionarioEscala.objects.create(funcionario=funcionario, escala=self.diurna, data_inicio=date(2025, 1, 1))
+        FuncionarioEscala.objects.create(funcionario=funcionario, escala=self.noturna, data_inicio=date(2025, 1, 10), data_fim=date(2025, 1, 15))
+
+        resolver = EscalaResolver.carregar([funcionario])
+
+        self.assertEqual(resolver.escala_em(funcionario, date(2025, 1, 12)), self.noturna)
+        # Depois do fim do período mais recente, vale o período anterior ainda aberto.
+        self.assertEqual(resolver.escala_em(funcionario, date(2025, 1, 20)), self.diurna)
+
+    def test_resolve_range_usa_uma_query_para_a_equipe(self):
+        for funcionario in self.funcionarios:
+            FuncionarioEscala.objects.create(funcionario=funcionario, escala=self.diurna, data_inicio=date(2025, 1, 1))
+
+        with self.assertNumQueries(1):
+            resolver = resolve_range(self.funcionarios, date(2025, 3, 1), date(2025, 3, 31))
+            for funcionario in self.funcionarios:
+                for dia in range(1, 32):
+                    self.assertEqual(resolver.escala_em(funcionario, date(2025, 3, dia)), self.diurna)
+
+
+class PontoTimelineTests(TestCase):
+    def marcacoes(self, *pares):
+        inicio = timezone.make_aware(datetime(2025, 3, 10, 0, 0))
+        return [
+            RegistroPonto(tipo=tipo, timestamp=inicio + timedelta(minutes=minuto))
+            for tipo, minuto in pares
+        ]
+
+    def test_totais_por_categoria(self):
+        timeline = montar_timeline(self.marcacoes(
+            ("ENTRADA", 480), ("SAIDA_PAUSA", 600), ("VOLTA_PAUSA", 610),
+            ("SAIDA_ALMOCO", 720), ("VOLTA_ALMOCO", 780), ("SAIDA", 1020),
+        ))
+
+        self.assertEqual(timeline.minutos_jornada, 540)
+        self.assertEqual(timeline.minutos_pausa, 10)
+        self.assertEqual(timeline.minutos_almoco, 60)
+        self.assertEqual(timeline.minutos_trabalhados, 470)
+        self.assertEqual(timeline.primeira_entrada.timestamp.hour, 8)
+        self.assertEqual(timeline.ultima_saida.timestamp.hour, 17)
+        self.assertEqual(timeline.anomalias, [])
+
+    def test_intervalo_aberto_e_fechamento_sem_abertura(self):
+        timeline = montar_timeline(self.marcacoes(
+            ("VOLTA_PAUSA", 470), ("ENTRADA", 480), ("SAIDA_ALMOCO", 720), ("SAIDA", 1020),
+        ))
+
+        self.assertEqual(timeline.minutos_jornada, 540)
+        self.assertEqual(timeline.minutos_almoco, 0)
+        self.assertEqual([r.tipo for r in timeline.intervalos_abertos], ["SAIDA_ALMOCO"])
+        self.assertEqual(
+            [(r.tipo, descricao) for r, descricao in timeline.anomalias],
+            [
+                ("VOLTA_PAUSA", "Fechamento sem abertura correspondente"),
+                ("SAIDA_ALMOCO", "Intervalo aberto sem fechamento"),
+            ],
+        )
+
+    def test_dia_longo_igual_ao_pareamento_antigo(self):
+        for padrao in ("intercalado", "aleatorio"):
+            registros = dia_sintetico(2000, padrao)
+            self.assertAlmostEqual(
+                montar_timeline(registros).minutos_trabalhados,
+                pareamento_quadratico(registros),
+            )
@@ -0,0 +1,96 @@
+# funcionarios/travas.py
+"""
+Trava de execução do processar_pontos, para que execuções do cron não se
+sobreponham.
+
+No PostgreSQL é um advisory lock de sessão, mantido numa conexão própria:
+o reprocessamento paralelo fecha as conexões do Django antes de criar o pool,
+o que soltaria uma trava presa à conexão padrão. Como é de sessão, a trava
+some junto com o processo se ele morrer. Nos demais bancos é uma linha de
+TravaProcessamento com validade, retomada por outro processo depois que
+expira.
+"""
+import os
+import socket
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .models import TravaProcessamento
+
+# Validade da trava por linha; depois disso o dono é considerado morto.
+TRAVA_VALIDADE = timedelta(hours=6)
+
+INTERVALO_ESPERA_SEGUNDOS = 5
+
+
+class TravaOcupada(Exception):
+    """Outra execução já detém a trava."""
+
+
+def trava_processamento(nome="processar_pontos", esperar=False):
+    """
+    Context manager que detém a trava `nome` durante o bloco. Sem
+    ``esperar``, levanta TravaOcupada na hora se outra execução a detém;
+    com ``esperar``, aguarda a liberação.
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor == "postgresql":
+        return _advisory_lock(nome, esperar)
+    return _trava_por_linha(nome, esperar)
+
+
+@contextmanager
+def _advisory_lock(nome, esperar):
+    chave = zlib.crc32(nome.encode())
+    conexao = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        with conexao.cursor() as cursor:
+            if esperar:
+                cursor.execute("SELECT pg_advisory_lock(%s)", [chave])
+            else:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [chave])
+                if not cursor.fetchone()[0]:
+                    raise TravaOcupada(f"Já existe uma execução de {nome} em andamento.")
+        yield
+    finally:
+        # Encerrar a sessão solta o advisory lock.
+        conexao.close()
+
+
+@contextmanager
+def _trava_por_linha(nome, esperar):
+    dono = f"{socket.gethostname()}:{os.getpid()}"
+    while not _adquirir_linha(nome, dono):
+        if not esperar:
+            atual = TravaProcessamento.objects.filter(nome=nome).first()
+            raise TravaOcupada(
+                f"Já existe uma execução de {nome} em andamento"
+                f"{f' ({atual.dono})' if atual else ''}."
+            )
+        time.sleep(INTERVALO_ESPERA_SEGUNDOS)
+    try:
+        yield
+    finally:
+        TravaProcessamento.objects.filter(nome=nome, dono=dono).delete()
+
+
+def _adquirir_linha(nome, dono):
+    agora = timezone.now()
+    expira_em = agora + TRAVA_VALIDADE
+    # Uma trava vencida pertence a um processo que morreu sem liberá-la.
+    if TravaProcessamento.objects.filter(nome=nome, expira_em__lt=agora).update(
+        dono=dono, adquirida_em=agora, expira_em=expira_em
+    ):
+        return True
+    try:
+        with transaction.atomic():
+            TravaProcessamento.objects.create(
+                nome=nome, dono=dono, adquirida_em=agora, expira_em=expira_em
+            )
+    except IntegrityError:
+        return False
+    return True
@@ -29,6 +29,13 @@ urlpatterns = [
         name="password_change_done",
     ),
     path("bate-ponto/", views.bate_ponto_view, name="bate_ponto"),
+    path("api/bate-ponto/", views.bate_ponto_api_view, name="api_bate_ponto"),
+    path(
+        "api/bate-ponto/sincronizar/",
+        views.sincronizar_batidas_view,
+        name="api_sincronizar_batidas",
+    ),
+    path("api/relogios/batidas/", views.relogio_batidas_view, name="api_relogio_batidas"),
     path(
         "supervisor/dashboard/",
         views.supervisor_dashboard_view,
@@ -40,6 +47,8 @@ urlpatterns = [
         name="relatorio_equipe",
     ),
     path("supervisor/tabela-equipe/", views.tabela_equipe_view, name="tabela_equipe"),
+    path("supervisor/eventos-equipe/", views.eventos_equipe_view, name="eventos_equipe"),
+    path("supervisor/alertas-pausa/", views.alertas_pausa_view, name="alertas_pausa"),
     path(
         "solicitar-horario/",
         views.solicitar_horario_view,
@@ -4,18 +4,28 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import PasswordChangeView
+from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.db.models import Sum, Q
+from django.db import transaction
+from django.db.models import Sum
 
 # Importações para trabalhar com data e hora
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta, datetime, time
 from collections import defaultdict
 import calendar
-import holidays
+import json
+
+from asgiref.sync import sync_to_async
 
 
 from .forms import (
+    FiltroEquipeForm,
     RelatorioFolhaPontoForm,
     RelatorioEquipeForm,
     SolicitacaoAbonoForm,
@@ -30,11 +40,33 @@ from .models import (
     RegistroPonto,
     Funcionario,
     RegraDePausa,
-    FuncionarioEscala,
     BancoDeHoras,
     SolicitacaoHorario,
-    Feriado,
+    RelogioPonto,
+)
+from .feriados import calendario_feriados, eh_dia_de_trabalho
+from .escalas import resolve_range
+from .jornadas import jornadas_do_periodo, montar_jornada
+from .banco_horas import saldo_em
+from .painel import (
+    carregar_equipe,
+    pagina_da_equipe,
+    pendentes_da_equipe,
+    prazo_da_pausa,
+    versao_da_equipe,
+)
+from .eventos import TOPICO_TODOS, assinar, topico_supervisor
+from .pausas import rastreador_pausas
+from .autorizacao import autorizacao
+from .batidas import (
+    BatidaRecusada,
+    ResultadoLote,
+    registrar_batida,
+    registrar_batida_idempotente,
+    registrar_fila,
+    registrar_lote,
 )
+from .middleware import marcar_senha_alterada
 
 
 def login_view(request):
@@ -57,6 +89,7 @@ class CustomPasswordChangeView(PasswordChangeView):
         funcionario = self.request.user.funcionario
         funcionario.deve_alterar_senha = False
         funcionario.save()
+        marcar_senha_alterada(self.request)
         return super().form_valid(form)
 
 
@@ -66,32 +99,57 @@ def supervisor_dashboard_view(request):
     if not user.is_superuser and not user.has_perm("funcionarios.view_funcionario"):
         return redirect("funcionarios:home")
 
-    is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-    
-    solicitacoes_horario_pendentes = SolicitacaoHorario.objects.filter(status="PENDENTE")
-    solicitacoes_abono_pendentes = SolicitacaoAbono.objects.filter(status="PENDENTE")
+    aut = autorizacao(request)
+    is_analista_rh = aut.analista_rh
 
+    pendentes = {
+        "horario": SolicitacaoHorario.objects.filter(status="PENDENTE"),
+        "abono": SolicitacaoAbono.objects.filter(status="PENDENTE"),
+    }
+    topico, _ = _escopo_da_equipe(request)
     if not is_analista_rh:
-        supervisor_logado = user.funcionario
-        equipe_ids = supervisor_logado.equipe.values_list("id", flat=True)
-        solicitacoes_horario_pendentes = solicitacoes_horario_pendentes.filter(
-            funcionario_id__in=equipe_ids
-        )
-        solicitacoes_abono_pendentes = solicitacoes_abono_pendentes.filter(
-            funcionario_id__in=equipe_ids
+        pendentes = {
+            tipo: solicitacoes.filter(funcionario__supervisor_id=aut.funcionario_id)
+            for tipo, solicitacoes in pendentes.items()
+        }
+
+    # Totais vêm dos contadores em cache; as listas, uma página por vez.
+    totais = pendentes_da_equipe(topico, pendentes)
+    paginas = {}
+    for tipo, solicitacoes in pendentes.items():
+        paginas[tipo] = _pagina_de_pendencias(
+            request, f"pagina_{tipo}", solicitacoes.select_related("funcionario"), totais[tipo]
         )
 
     context = {
         "supervisor": user.funcionario,
-        "solicitacoes_horario_pendentes": solicitacoes_horario_pendentes,
-        "solicitacoes_abono_pendentes": solicitacoes_abono_pendentes,
+        "solicitacoes_horario_pendentes": paginas["horario"],
+        "solicitacoes_abono_pendentes": paginas["abono"],
+        "filtro_equipe": FiltroEquipeForm() if is_analista_rh else None,
     }
     return render(request, "funcionarios/supervisor_dashboard.html", context)
 
 
+PENDENCIAS_POR_PAGINA = 10
+
+
+def _pagina_de_pendencias(request, parametro, solicitacoes, total):
+    """Página da lista de pendências, sem COUNT: o total vem do contador."""
+    paginator = Paginator(solicitacoes, PENDENCIAS_POR_PAGINA)
+    paginator.count = total
+    pagina = paginator.get_page(request.GET.get(parametro))
+    pagina.parametro = parametro
+    return pagina
+
+
 @login_required
 def home_view(request):
-    funcionario = request.user.funcionario
+    context = _contexto_do_relogio(request.user.funcionario)
+    return render(request, "funcionarios/home.html", context)
+
+
+def _contexto_do_relogio(funcionario):
+    """Contexto do relógio de ponto da página inicial (_relogio_ponto.html)."""
     agora = timezone.now()
     inicio_do_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
     fim_do_dia = agora.replace(hour=23, minute=59, second=59, microsecond=999999)
@@ -140,14 +198,20 @@ def home_view(request):
         timestamp__date=agora.date()
     ).order_by('-timestamp').first()
 
-    context = {
+    return {
         "funcionario_data": funcionario,
         "proxima_pausa_regra": proxima_pausa_regra,
         "ultima_pausa": ultima_pausa,
         "hora_fim_pausa": hora_fim_pausa.isoformat() if hora_fim_pausa else None,
         "ultimo_ponto_entrada": ultimo_ponto_entrada,
     }
-    return render(request, "funcionarios/home.html", context)
+
+
+def _relogio_html(request, funcionario):
+    """O relógio de ponto renderizado, para a página trocar sem recarregar."""
+    return render_to_string(
+        "funcionarios/_relogio_ponto.html", _contexto_do_relogio(funcionario), request=request
+    )
 
 
 @login_required
@@ -204,20 +268,11 @@ def minha_jornada_view(request):
     year = agora.year
     month = agora.month
 
-    escala_atual = (
-        FuncionarioEscala.objects.filter(
-            funcionario=funcionario, data_inicio__lte=agora.date()
-        )
-        .filter(Q(data_fim__gte=agora.date()) | Q(data_fim__isnull=True))
-        .first()
+    escala_atual = resolve_range([funcionario], agora.date(), agora.date()).vinculo_em(
+        funcionario, agora.date()
     )
 
-    saldo_total_minutos = (
-        BancoDeHoras.objects.filter(funcionario=funcionario).aggregate(
-            total=Sum("minutos")
-        )["total"]
-        or 0
-    )
+    saldo_total_minutos = saldo_em(funcionario)
     saldo_horas = int(saldo_total_minutos // 60)
     saldo_minutos_restantes = int(saldo_total_minutos % 60)
 
@@ -235,7 +290,6 @@ def minha_jornada_view(request):
     # --- Lógica do Calendário ---
     def gerar_dados_calendario(year, month, escala_info):
         cal = calendar.Calendar()
-        br_holidays = holidays.country_holidays("BR")
         dias_trabalho_escala = []
         escala_prioritaria = False
         if escala_info:
@@ -250,9 +304,7 @@ def minha_jornada_view(request):
             for day_date in week:
                 status = "fora_mes"
                 if day_date.month == month:
-                    is_holiday = (day_date in br_holidays) or \
-                                 Feriado.objects.filter(data=day_date, recorrente=False).exists() or \
-                                 Feriado.objects.filter(data__day=day_date.day, data__month=day_date.month, recorrente=True).exists()
+                    is_holiday = calendario_feriados.eh_feriado(day_date)
 
                     is_workday = day_date.weekday() in dias_trabalho_escala
 
@@ -300,151 +352,215 @@ def bate_ponto_view(request):
         messages.error(request, "Você precisa selecionar um tipo de registro.")
         return redirect("funcionarios:home")
 
-    inicio_do_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    if tipo_ponto not in dict(RegistroPonto.TIPO_REGISTRO_CHOICES):
+        messages.error(request, "Tipo de registro inválido.")
+        return redirect("funcionarios:home")
 
-    if tipo_ponto == "ENTRADA":
-        if RegistroPonto.objects.filter(
-            funcionario=funcionario, tipo="ENTRADA", timestamp__gte=inicio_do_dia
-        ).exists():
-            messages.error(request, "Você já registrou uma entrada hoje.")
-            return redirect("funcionarios:home")
+    try:
+        registrar_batida(funcionario, tipo_ponto, agora)
+    except BatidaRecusada as recusa:
+        messages.error(request, str(recusa))
+        if recusa.fora_do_horario:
+            return redirect("funcionarios:solicitar_horario")
+        return redirect("funcionarios:home")
 
-    if tipo_ponto == "SAIDA":
-        if not RegistroPonto.objects.filter(
-            funcionario=funcionario, tipo="ENTRADA", timestamp__gte=inicio_do_dia
-        ).exists():
-            messages.error(
-                request,
-                "Você não pode registrar uma saída sem antes registrar uma entrada hoje.",
-            )
-            return redirect("funcionarios:home")
-        if RegistroPonto.objects.filter(
-            funcionario=funcionario, tipo="SAIDA", timestamp__gte=inicio_do_dia
-        ).exists():
-            messages.error(request, "Você já registrou uma saída hoje.")
-            return redirect("funcionarios:home")
+    messages.success(
+        request, f"'{tipo_ponto.replace('_', ' ').title()}' registrada com sucesso!"
+    )
+    return redirect("funcionarios:home")
 
-    if funcionario.status != "ATIVO":
-        messages.error(
-            request,
-            f"Seu status é '{funcionario.get_status_display()}', você não pode registrar o ponto.",
-        )
-        return redirect("funcionarios:home")
 
-    if tipo_ponto in ["ENTRADA", "SAIDA"]:
-        data_local = timezone.localtime(agora).date()
-        solicitacao_aprovada = SolicitacaoHorario.objects.filter(
-            funcionario=funcionario, status="APROVADO", data_hora_ponto__date=data_local
-        ).exists()
+@login_required
+@require_POST
+def bate_ponto_api_view(request):
+    """
+    Batida de ponto em JSON, sem redirecionamento. O cabeçalho
+    Idempotency-Key (ou o campo "chave") identifica o pedido: repeti-lo
+    devolve a batida já gravada, com status 200 em vez de 201.
+    """
+    try:
+        dados = json.loads(request.body or b"{}")
+    except ValueError:
+        dados = None
+    if not isinstance(dados, dict):
+        return JsonResponse({"erro": "Corpo JSON inválido."}, status=400)
+    tipo_ponto = dados.get("tipo")
+    chave = request.headers.get("Idempotency-Key") or dados.get("chave")
+    if not tipo_ponto:
+        return JsonResponse({"erro": "Você precisa selecionar um tipo de registro."}, status=400)
+    if not isinstance(chave, str) or not 0 < len(chave) <= 64:
+        return JsonResponse(
+            {"erro": "Informe uma chave de idempotência de até 64 caracteres."}, status=400
+        )
 
-        if not solicitacao_aprovada:
-            escala_atual = (
-                FuncionarioEscala.objects.filter(
-                    funcionario=funcionario, data_inicio__lte=data_local
-                )
-                .filter(Q(data_fim__gte=data_local) | Q(data_fim__isnull=True))
-                .first()
-            )
-            if not escala_atual:
-                messages.error(request, "Você não tem uma escala de trabalho definida para hoje. Contate o RH.")
-                return redirect("funcionarios:home")
+    funcionario = request.user.funcionario
+    try:
+        registro, repetida = registrar_batida_idempotente(funcionario, tipo_ponto, chave)
+    except BatidaRecusada as recusa:
+        return JsonResponse(
+            {"erro": str(recusa), "fora_do_horario": recusa.fora_do_horario}, status=422
+        )
+    if registro is None:
+        # A chave já foi usada por uma batida guardada sem conexão que virou
+        # solicitação de horário: não há registro para devolver.
+        return JsonResponse(
+            {
+                "erro": "Esta batida foi enviada ao seu supervisor para aprovação.",
+                "situacao": "solicitada",
+            },
+            status=409,
+        )
+    return JsonResponse(
+        {
+            "registro": {
+                "id": registro.pk,
+                "tipo": registro.tipo,
+                "timestamp": registro.timestamp.isoformat(),
+            },
+            "status_operacional": funcionario.status_operacional,
+            "repetida": repetida,
+            "relogio": _relogio_html(request, funcionario),
+        },
+        status=200 if repetida else 201,
+    )
 
-            # Validação do dia da semana
-            dia_da_semana = data_local.weekday()
-            if str(dia_da_semana) not in escala_atual.escala.dias_semana.split(","):
-                messages.error(request, "Você não pode registrar o ponto em um dia de folga.")
-                return redirect("funcionarios:home")
 
-            # Validação do limite de horas extras
-            horario_inicio_jornada = escala_atual.escala.horario_entrada
-            horario_fim_jornada = escala_atual.escala.horario_saida
+TAMANHO_MAXIMO_LOTE = 1000
 
-            # Cria objetos datetime para comparação, lidando com fuso horário
-            current_timezone = timezone.get_current_timezone()
-            inicio_jornada_dt = datetime.combine(data_local, horario_inicio_jornada, tzinfo=current_timezone)
-            fim_jornada_dt = datetime.combine(data_local, horario_fim_jornada, tzinfo=current_timezone)
-            
-            # Lida com turnos que cruzam a meia-noite
-            if fim_jornada_dt < inicio_jornada_dt:
-                fim_jornada_dt += timedelta(days=1)
-
-            limite_inicio = inicio_jornada_dt - timedelta(hours=2)
-            limite_fim = fim_jornada_dt + timedelta(hours=2)
-
-            if not (limite_inicio <= agora <= limite_fim):
-                messages.error(request, "Você está tentando bater o ponto muito fora do seu horário. Por favor, solicite autorização.")
-                return redirect("funcionarios:solicitar_horario")
-
-    if tipo_ponto == "ENTRADA":
-        if funcionario.status_operacional != "OFFLINE":
-            messages.error(
-                request,
-                f"Ação inválida. Seu status atual é '{funcionario.get_status_operacional_display()}'.",
-            )
-            return redirect("funcionarios:home")
-        
-    if tipo_ponto == "SAIDA_PAUSA":
-        if funcionario.status_operacional != "DISPONIVEL":
-            messages.error(
-                request, f"Você só pode iniciar uma pausa se estiver 'Disponível'."
-            )
-            return redirect("funcionarios:home")
 
-        pausas_hoje_count = RegistroPonto.objects.filter(
-            funcionario=funcionario, tipo="SAIDA_PAUSA", timestamp__gte=inicio_do_dia
-        ).count()
+def _relogio_autenticado(request):
+    tipo, _, token = request.headers.get("Authorization", "").partition(" ")
+    if tipo != "Token" or not token:
+        return None
+    return RelogioPonto.objects.filter(
+        token_hash=RelogioPonto.hash_do_token(token), ativo=True
+    ).first()
 
-        try:
-            RegraDePausa.objects.get(cargo=funcionario.cargo, ordem=pausas_hoje_count + 1)
-        except RegraDePausa.DoesNotExist:
-            messages.error(
-                request,
-                "Você não tem mais pausas disponíveis ou elas não estão configuradas para seu cargo.",
-            )
-            return redirect("funcionarios:home")
 
-    if tipo_ponto == "SAIDA_PAUSA_PESSOAL":
-        if funcionario.status_operacional != "DISPONIVEL":
-            messages.error(
-                request, f"Você só pode iniciar uma pausa pessoal se estiver 'Disponível'."
-            )
-            return redirect("funcionarios:home")
+def _horario_da_batida(valor):
+    try:
+        momento = parse_datetime(valor) if isinstance(valor, str) else None
+    except ValueError:
+        momento = None
+    if momento and timezone.is_naive(momento):
+        # Relógios sem fuso informam o horário local.
+        momento = timezone.make_aware(momento)
+    return momento
 
-    if tipo_ponto in ["VOLTA_PAUSA", "VOLTA_PAUSA_PESSOAL", "VOLTA_ALMOCO"]:
-        if funcionario.status_operacional != "EM_PAUSA":
-            messages.error(
-                request, f"Você só pode voltar de uma pausa se estiver 'Em Pausa'."
-            )
-            return redirect("funcionarios:home")
 
-    if tipo_ponto == "SAIDA":
-        if funcionario.status_operacional not in ["DISPONIVEL", "EM_PAUSA"]:
-            messages.error(
-                request,
-                f"Você não pode registrar a saída com o status '{funcionario.get_status_operacional_display()}'.",
-            )
-            return redirect("funcionarios:home")
+@csrf_exempt
+@require_POST
+def relogio_batidas_view(request):
+    """
+    Recebe as batidas de um relógio de ponto físico, em lotes de até
+    TAMANHO_MAXIMO_LOTE, autenticado por "Authorization: Token <token>".
+    Cada batida traz matrícula, tipo e horário (ISO 8601); a resposta traz o
+    resultado de cada uma, na ordem do envio. Reenviar o lote é seguro: as
+    batidas já gravadas voltam como "duplicada".
+    """
+    if _relogio_autenticado(request) is None:
+        return JsonResponse({"erro": "Relógio não autorizado."}, status=401)
+    itens = _lista_de_batidas(request, TAMANHO_MAXIMO_LOTE)
+    if itens is None:
+        return JsonResponse(
+            {"erro": f"Envie em \"batidas\" uma lista de 1 a {TAMANHO_MAXIMO_LOTE} batidas."},
+            status=400,
+        )
 
-    status_map = {
-        "ENTRADA": "DISPONIVEL",
-        "SAIDA_PAUSA": "EM_PAUSA",
-        "VOLTA_PAUSA": "DISPONIVEL",
-        "SAIDA_PAUSA_PESSOAL": "EM_PAUSA",
-        "VOLTA_PAUSA_PESSOAL": "DISPONIVEL",
-        "SAIDA_ALMOCO": "EM_PAUSA",
-        "VOLTA_ALMOCO": "DISPONIVEL",
-        "SAIDA": "OFFLINE",
-    }
-    funcionario.status_operacional = status_map.get(
-        tipo_ponto, funcionario.status_operacional
+    matriculas = {item.get("matricula") for item in itens if isinstance(item.get("matricula"), str)}
+    funcionarios = dict(
+        Funcionario.objects.filter(user__username__in=matriculas).values_list("user__username", "pk")
     )
-    funcionario.save()
-
-    RegistroPonto.objects.create(funcionario=funcionario, tipo=tipo_ponto)
-    messages.success(
-        request, f"'{tipo_ponto.replace('_', ' ').title()}' registrada com sucesso!"
+    resultados = [None] * len(itens)
+    lote, posicoes = [], []
+    for indice, item in enumerate(itens):
+        funcionario_id = funcionarios.get(item.get("matricula"))
+        momento = _horario_da_batida(item.get("timestamp"))
+        if funcionario_id is None:
+            resultados[indice] = ResultadoLote("recusada", "Matrícula não encontrada.")
+        elif momento is None:
+            resultados[indice] = ResultadoLote("recusada", "Horário inválido.")
+        else:
+            lote.append((funcionario_id, item.get("tipo"), momento))
+            posicoes.append(indice)
+    for indice, resultado in zip(posicoes, registrar_lote(lote)):
+        resultados[indice] = resultado
+    return _resposta_do_lote(resultados)
+
+
+def _lista_de_batidas(request, tamanho_maximo):
+    """Itens da lista "batidas" do corpo JSON, ou None se o corpo não serve."""
+    try:
+        dados = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    batidas = dados.get("batidas") if isinstance(dados, dict) else None
+    if not isinstance(batidas, list) or not 0 < len(batidas) <= tamanho_maximo:
+        return None
+    return [item if isinstance(item, dict) else {} for item in batidas]
+
+
+def _resposta_do_lote(resultados, **extras):
+    resposta = []
+    for resultado in resultados:
+        item = {"situacao": resultado.situacao}
+        if resultado.mensagem:
+            item["erro" if resultado.situacao == "recusada" else "aviso"] = resultado.mensagem
+        if resultado.registro:
+            item["registro_id"] = resultado.registro.pk
+        resposta.append(item)
+    return JsonResponse(
+        {
+            "resultados": resposta,
+            "gravadas": sum(r.situacao == "gravada" for r in resultados),
+            "duplicadas": sum(r.situacao == "duplicada" for r in resultados),
+            "recusadas": sum(r.situacao == "recusada" for r in resultados),
+            "solicitadas": sum(r.situacao == "solicitada" for r in resultados),
+            **extras,
+        }
     )
-    return redirect("funcionarios:home")
+
+
+TAMANHO_MAXIMO_FILA = 50
+
+
+@login_required
+@require_POST
+def sincronizar_batidas_view(request):
+    """
+    Batidas que a página guardou enquanto estava sem conexão, reenviadas
+    juntas quando a conexão volta. Cada uma traz tipo, horário original
+    (ISO 8601) e a chave de idempotência do clique; a resposta traz o
+    resultado de cada uma, na ordem. As antigas vão para aprovação do
+    supervisor (ver registrar_fila).
+    """
+    itens = _lista_de_batidas(request, TAMANHO_MAXIMO_FILA)
+    if itens is None:
+        return JsonResponse(
+            {"erro": f"Envie em \"batidas\" uma lista de 1 a {TAMANHO_MAXIMO_FILA} batidas."},
+            status=400,
+        )
+
+    resultados = [None] * len(itens)
+    fila, posicoes = [], []
+    for indice, item in enumerate(itens):
+        chave = item.get("chave")
+        momento = _horario_da_batida(item.get("timestamp"))
+        if not isinstance(chave, str) or not 0 < len(chave) <= 64:
+            resultados[indice] = ResultadoLote(
+                "recusada", "Informe uma chave de idempotência de até 64 caracteres."
+            )
+        elif momento is None:
+            resultados[indice] = ResultadoLote("recusada", "Horário inválido.")
+        else:
+            fila.append((item.get("tipo"), momento, chave))
+            posicoes.append(indice)
+    funcionario = request.user.funcionario
+    for indice, resultado in zip(posicoes, registrar_fila(funcionario, fila)):
+        resultados[indice] = resultado
+    # O lote grava o status em outra instância do funcionário.
+    funcionario.refresh_from_db(fields=["status_operacional"])
+    return _resposta_do_lote(resultados, relogio=_relogio_html(request, funcionario))
 
 
 @login_required
@@ -487,6 +603,7 @@ def solicitar_abono_view(request):
 
     faltas_nao_justificadas = []
     dias_a_verificar = (hoje - data_inicio_busca).days
+    escalas = resolve_range([funcionario], data_inicio_busca, hoje)
 
     for i in range(dias_a_verificar + 1):
         data_atual = data_inicio_busca + timedelta(days=i)
@@ -497,19 +614,12 @@ def solicitar_abono_view(request):
         ):
             continue
 
-        escala_do_dia = (
-            FuncionarioEscala.objects.filter(
-                funcionario=funcionario, data_inicio__lte=data_atual
-            )
-            .filter(Q(data_fim__gte=data_atual) | Q(data_fim__isnull=True))
-            .first()
-        )
+        escala_do_dia = escalas.vinculo_em(funcionario, data_atual)
 
         if not escala_do_dia:
             continue
 
-        dias_de_trabalho = [int(d) for d in escala_do_dia.escala.dias_semana.split(",")]
-        if data_atual.weekday() in dias_de_trabalho:
+        if eh_dia_de_trabalho(escala_do_dia.escala, data_atual):
             faltas_nao_justificadas.append(data_atual)
 
     if request.method == "POST":
@@ -530,116 +640,202 @@ def solicitar_abono_view(request):
     return render(request, "funcionarios/solicitar_abono.html", context)
 
 
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 ...
 
-@never_cache
+def _excedidas_da_equipe(request, topico):
+    # Calculadas uma vez por requisição: o ETag e a tabela usam o mesmo conjunto.
+    if not hasattr(request, "_excedidas"):
+        request._excedidas = {
+            pausa.funcionario_id for pausa in rastreador_pausas().excedidas(topico)
+        }
+    return request._excedidas
+
+
+def _etag_tabela_equipe(request):
+    # Só lê o cache e o rastreador de pausas: sem mudança na equipe, a
+    # resposta é 304 sem consultar marcações. A data entra porque pausas do
+    # dia e escala vigente viram à meia-noite; as pausas excedidas, porque um
+    # prazo que vence não muda a versão da equipe.
+    topico, _ = _escopo_da_equipe(request)
+    excedidas = ",".join(map(str, sorted(_excedidas_da_equipe(request, topico))))
+    return (
+        f"{topico}:{timezone.localdate().isoformat()}:{versao_da_equipe(topico)}:{excedidas}"
+    )
+
+
+# no-cache (e não no-store): o navegador guarda a tabela, mas revalida a cada
+# consulta enviando o ETag.
 @login_required
+@cache_control(no_cache=True, private=True)
+@condition(etag_func=_etag_tabela_equipe)
 def tabela_equipe_view(request):
-    user = request.user
-    is_analista_rh = user.groups.filter(name='Analista de RH').exists()
+    # Marcações, pausas, regras e escalas vêm em número fixo de queries,
+    # qualquer que seja o tamanho da equipe. A consulta não grava nada: o
+    # status é mantido pela batida de ponto (e pelo reconciliar_status).
+    topico, equipe = _escopo_da_equipe(request)
+    # Só a página visível é carregada: filtros e posição vêm na própria
+    # consulta periódica. Filtros inválidos são ignorados.
+    filtro = FiltroEquipeForm(request.GET)
+    apos = None
+    if filtro.is_valid():
+        equipe = filtro.filtrar(equipe)
+        apos = filtro.apos()
+    membros, proxima_pagina = pagina_da_equipe(equipe, apos)
+    excedidas = _excedidas_da_equipe(request, topico)
+    for membro in membros:
+        membro.pausa_excedida = membro.pk in excedidas
+
+    context = {
+        "equipe": membros,
+        "proxima_pagina": proxima_pagina,
+        "primeira_pagina": apos is None,
+    }
+    return render(request, "funcionarios/_tabela_equipe.html", context)
+
+
+def _escopo_da_equipe(request):
+    """(tópico, queryset) da equipe que o usuário acompanha no painel."""
+    aut = autorizacao(request)
+    if aut.analista_rh:
+        return TOPICO_TODOS, Funcionario.objects.filter(status='ATIVO')
+    if aut.funcionario_id is None:
+        raise Http404("Usuário sem funcionário associado.")
+    return (
+        topico_supervisor(aut.funcionario_id),
+        Funcionario.objects.filter(supervisor_id=aut.funcionario_id),
+    )
 
-    if is_analista_rh:
-        equipe = Funcionario.objects.filter(status='ATIVO')
-    else:
-        supervisor = get_object_or_404(Funcionario, user=user)
-        equipe = supervisor.equipe.all()
-        
-    agora = timezone.now()
-    inicio_do_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    for membro in equipe:
-        # Sincroniza o status do funcionário com base no seu último registro de ponto do dia.
-        ultimo_registro = RegistroPonto.objects.filter(
-            funcionario=membro,
-            timestamp__gte=inicio_do_dia
-        ).order_by('-timestamp').first()
-
-        novo_status = 'OFFLINE'
-        if ultimo_registro:
-            if ultimo_registro.tipo == 'ENTRADA' or ultimo_registro.tipo.startswith('VOLTA_'):
-                novo_status = 'DISPONIVEL'
-            elif ultimo_registro.tipo in ['SAIDA_PAUSA', 'SAIDA_ALMOCO', 'SAIDA_PAUSA_PESSOAL']:
-                novo_status = 'EM_PAUSA'
-            # Se o tipo for 'SAIDA', o status permanece 'OFFLINE', que é o padrão.
-        
-        if membro.status_operacional != novo_status:
-            membro.status_operacional = novo_status
-            Funcionario.objects.filter(pk=membro.pk).update(status_operacional=novo_status)
-
-        # Lógica para calcular tempo de pausa (permanece a mesma)
-        membro.ultima_pausa = None
-        membro.limite_pausa_segundos = 0
-        if membro.status_operacional == "EM_PAUSA":
-            ultima_pausa_registro = RegistroPonto.objects.filter(
-                funcionario=membro, tipo__in=["SAIDA_PAUSA", "SAIDA_ALMOCO"]
-            ).order_by("-timestamp").first()
-            membro.ultima_pausa = ultima_pausa_registro
-
-            if ultima_pausa_registro and ultima_pausa_registro.tipo == "SAIDA_PAUSA":
-                pausas_hoje_count = RegistroPonto.objects.filter(
-                    funcionario=membro,
-                    tipo="SAIDA_PAUSA",
-                    timestamp__gte=inicio_do_dia,
-                ).count()
-                regra_atual = RegraDePausa.objects.filter(
-                    cargo=membro.cargo, ordem=pausas_hoje_count
-                ).first()
-                if regra_atual:
-                    membro.limite_pausa_segundos = regra_atual.duracao_minutos * 60
-        
-        # Lógica da escala (permanece a mesma)
-        membro.escala_atual = (
-            FuncionarioEscala.objects.filter(
-                funcionario=membro, data_inicio__lte=agora.date()
+@login_required
+def alertas_pausa_view(request):
+    """Membros da equipe que passaram do limite da pausa agora, em JSON."""
+    user = request.user
+    if not user.is_superuser and not user.has_perm("funcionarios.view_funcionario"):
+        return HttpResponse(status=403)
+    topico, _ = _escopo_da_equipe(request)
+    agora = timezone.now()
+    pausas = rastreador_pausas().excedidas(topico, agora)
+    nomes = dict(
+        Funcionario.objects.filter(pk__in=[pausa.funcionario_id for pausa in pausas])
+        .values_list("pk", "nome_completo")
+    )
+    alertas = [
+        {
+            "funcionario_id": pausa.funcionario_id,
+            "nome": nomes.get(pausa.funcionario_id),
+            "inicio": pausa.inicio.isoformat(),
+            "prazo": pausa.prazo.isoformat(),
+            "excedido_segundos": int((agora - pausa.prazo).total_seconds()),
+        }
+        for pausa in pausas
+    ]
+    return JsonResponse({"alertas": alertas})
+
+
+# Intervalo máximo sem escrever nada no stream, para que proxies não
+# derrubem a conexão e o servidor perceba clientes que já saíram.
+HEARTBEAT_SEGUNDOS = 20
+
+
+def _evento_sse(nome, dados):
+    return f"event: {nome}\ndata: {json.dumps(dados)}\n\n"
+
+
+def _linha_da_equipe(equipe, funcionario_id):
+    membros = carregar_equipe(equipe.filter(pk=funcionario_id))
+    if not membros:
+        return None, None
+    html = render_to_string("funcionarios/_linha_equipe.html", {"membro": membros[0]})
+    return membros[0], html
+
+
+async def _fluxo_equipe(request):
+    topico, equipe = await sync_to_async(_escopo_da_equipe)(request)
+    assinatura = assinar(topico)
+    try:
+        # Pausas em curso que ainda vão estourar o limite, por funcionário.
+        agora = timezone.now()
+        prazos = {}
+        for membro in await sync_to_async(carregar_equipe)(equipe, agora):
+            prazo = prazo_da_pausa(membro)
+            if prazo and prazo > agora:
+                prazos[membro.pk] = prazo
+
+        yield "retry: 5000\n\n"
+        while True:
+            agora = timezone.now()
+            for funcionario_id, prazo in list(prazos.items()):
+                if prazo <= agora:
+                    del prazos[funcionario_id]
+                    yield _evento_sse("pausa_excedida", {"funcionario_id": funcionario_id})
+
+            espera = HEARTBEAT_SEGUNDOS
+            if prazos:
+                espera = min(espera, (min(prazos.values()) - agora).total_seconds())
+            evento = await assinatura.proximo(max(espera, 0))
+            if evento is None:
+                # Acordou por um prazo de pausa: o aviso sai no início do laço.
+                if espera >= HEARTBEAT_SEGUNDOS:
+                    yield ": ping\n\n"
+                continue
+            if evento["tipo"] == "recarregar":
+                yield _evento_sse("recarregar", {})
+                continue
+
+            membro, html = await sync_to_async(_linha_da_equipe)(
+                equipe, evento["funcionario_id"]
             )
-            .filter(Q(data_fim__gte=agora.date()) | Q(data_fim__isnull=True))
-            .first()
-        )
+            if membro is None:
+                continue
+            prazos.pop(membro.pk, None)
+            prazo = prazo_da_pausa(membro)
+            if prazo and prazo > timezone.now():
+                prazos[membro.pk] = prazo
+            yield _evento_sse("status", {"funcionario_id": membro.pk, "html": html})
+    finally:
+        assinatura.cancelar()
+
 
-    return render(request, "funcionarios/_tabela_equipe.html", {"equipe": equipe})
+@login_required
+async def eventos_equipe_view(request):
+    """
+    Stream SSE com as mudanças de status da equipe: cada batida de ponto de um
+    membro manda a linha dele já renderizada, e o estouro do limite de uma
+    pausa é avisado na hora.
+    """
+    user = await request.auser()
+    if not user.is_superuser and not await user.ahas_perm("funcionarios.view_funcionario"):
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI a conexão prenderia um worker indefinidamente. O 204 faz o
+        # EventSource desistir, e o painel fica na consulta periódica.
+        return HttpResponse(status=204)
+
+    # Resolvida antes da resposta, para que a sessão ainda seja gravada.
+    await sync_to_async(autorizacao)(request)
+    response = StreamingHttpResponse(_fluxo_equipe(request), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 @login_required
 def relatorio_folha_ponto(request):
-    form = RelatorioFolhaPontoForm(user=request.user)
+    aut = autorizacao(request)
+    form = RelatorioFolhaPontoForm(autorizacao=aut)
     relatorio_data = None
 
-    def _calculate_paired_duration(registros, tipo_saida, tipo_volta):
-        saidas = list(r for r in registros if r.tipo == tipo_saida)
-        voltas = list(r for r in registros if r.tipo == tipo_volta)
-        total_duration = timedelta()
-
-        for s in saidas:
-            corresponding_volta = next((v for v in voltas if v.timestamp > s.timestamp), None)
-            if corresponding_volta:
-                total_duration += corresponding_volta.timestamp - s.timestamp
-                voltas.remove(corresponding_volta)
-        
-        return total_duration.total_seconds() / 60
-
     if request.method == "POST":
-        form = RelatorioFolhaPontoForm(request.POST, user=request.user)
+        form = RelatorioFolhaPontoForm(request.POST, autorizacao=aut)
         if form.is_valid():
             data_inicio = form.cleaned_data["data_inicio"]
             data_fim = form.cleaned_data["data_fim"]
             funcionario_selecionado = form.cleaned_data["funcionario"]
-            
-            user = request.user
-            is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-            is_supervisor = hasattr(user, 'funcionario') and user.funcionario.equipe.exists()
-            
-            pode_ver = False
-            if is_analista_rh:
-                pode_ver = True
-            elif is_supervisor:
-                if funcionario_selecionado == user.funcionario or user.funcionario.equipe.filter(id=funcionario_selecionado.id).exists():
-                    pode_ver = True
-            elif funcionario_selecionado == user.funcionario:
-                pode_ver = True
-
-            if not pode_ver:
+
+            if not funcionario_selecionado or not aut.pode_ver(funcionario_selecionado.pk):
                 messages.error(request, "Você não tem permissão para visualizar o relatório deste funcionário.")
                 return render(request, "funcionarios/relatorio_folha_ponto.html", {"form": form, "relatorio": None})
 
@@ -666,32 +862,31 @@ def relatorio_folha_ponto(request):
                 registros_por_dia[dia_local].append(registro)
 
             banco_por_dia = {bh.data: bh for bh in banco_horas}
+            # Dias já processados vêm prontos da JornadaDiaria; os demais
+            # (hoje, ou antes do primeiro processamento) são montados na hora.
+            jornadas = jornadas_do_periodo([funcionario], data_inicio, data_fim)
+            escalas = None
             relatorio_data = []
             dias_no_periodo = (data_fim - data_inicio).days + 1
             for dia_offset in range(dias_no_periodo):
                 data_atual = data_inicio + timedelta(days=dia_offset)
                 saldo_bh = banco_por_dia.get(data_atual)
                 registros_do_dia = registros_por_dia.get(data_atual, [])
-                
-                jornada_bruta_minutos = _calculate_paired_duration(registros_do_dia, 'ENTRADA', 'SAIDA')
-                minutos_pausa = _calculate_paired_duration(registros_do_dia, 'SAIDA_PAUSA', 'VOLTA_PAUSA')
-                minutos_almoco = _calculate_paired_duration(registros_do_dia, 'SAIDA_ALMOCO', 'VOLTA_ALMOCO')
-                minutos_pausa_pessoal = _calculate_paired_duration(registros_do_dia, 'SAIDA_PAUSA_PESSOAL', 'VOLTA_PAUSA_PESSOAL')
-                total_horas_trabalhadas_minutos = jornada_bruta_minutos - minutos_pausa - minutos_almoco - minutos_pausa_pessoal
 
-                status_dia = ""
-                escala_info = (
-                    FuncionarioEscala.objects.filter(
-                        funcionario=funcionario, data_inicio__lte=data_atual
+                jornada = jornadas.get((funcionario.id, data_atual))
+                if jornada is None:
+                    if escalas is None:
+                        escalas = resolve_range([funcionario], data_inicio, data_fim)
+                    jornada = montar_jornada(
+                        funcionario.id,
+                        data_atual,
+                        escalas.escala_em(funcionario, data_atual),
+                        registros_do_dia,
                     )
-                    .filter(Q(data_fim__gte=data_atual) | Q(data_fim__isnull=True))
-                    .first()
-                )
-                is_workday = False
-                if escala_info:
-                    dia_da_semana = data_atual.weekday()
-                    if str(dia_da_semana) in escala_info.escala.dias_semana.split(","):
-                        is_workday = True
+                total_horas_trabalhadas_minutos = jornada.minutos_trabalhados
+
+                status_dia = ""
+                is_workday = jornada.dia_de_trabalho
 
                 if is_workday and not registros_do_dia and not saldo_bh:
                     status_dia = "Falta Injustificada"
@@ -706,6 +901,7 @@ def relatorio_folha_ponto(request):
                         "saldo_bh": saldo_bh,
                         "status": status_dia,
                         "total_horas_trabalhadas": total_horas_trabalhadas_minutos,
+                        "jornada": jornada,
                     }
                 )
     context = {"form": form, "relatorio": relatorio_data}
@@ -714,7 +910,7 @@ def relatorio_folha_ponto(request):
 
 @login_required
 def relatorio_equipe_view(request):
-    if not request.user.is_superuser and not request.user.funcionario.equipe.exists():
+    if not request.user.is_superuser and not autorizacao(request).supervisor:
         messages.error(request, "Você não tem permissão para acessar esta página.")
         return redirect("funcionarios:home")
     form = RelatorioEquipeForm()
@@ -731,6 +927,19 @@ def relatorio_equipe_view(request):
             total_geral_extras = 0
             total_geral_devidas = 0
             total_geral_faltas = 0
+            escalas = resolve_range(equipe, data_inicio, data_fim)
+            jornadas = jornadas_do_periodo(equipe, data_inicio, data_fim)
+            current_timezone = timezone.get_current_timezone()
+            dias_com_abono = {
+                (funcionario_id, inicio_abono.astimezone(current_timezone).date())
+                for funcionario_id, inicio_abono in SolicitacaoAbono.objects.filter(
+                    funcionario__in=equipe,
+                    data_inicio__date__range=(data_inicio, data_fim),
+                    status='APROVADO',
+                ).values_list('funcionario_id', 'data_inicio')
+            }
+            # Marcações só são consultadas para os dias sem JornadaDiaria gravada.
+            dias_com_registro = None
             for funcionario in equipe:
                 banco_horas = BancoDeHoras.objects.filter(
                     funcionario=funcionario, data__range=(data_inicio, data_fim)
@@ -741,21 +950,26 @@ def relatorio_equipe_view(request):
                 dias_no_periodo = (data_fim - data_inicio).days + 1
                 for dia_offset in range(dias_no_periodo):
                     data_atual = data_inicio + timedelta(days=dia_offset)
-                    tem_registro = RegistroPonto.objects.filter(funcionario=funcionario, timestamp__date=data_atual).exists()
-                    tem_abono = SolicitacaoAbono.objects.filter(
-                        funcionario=funcionario,
-                        data_inicio__date=data_atual,
-                        status='APROVADO'
-                    ).exists()
-                    if tem_registro or tem_abono:
+                    if (funcionario.id, data_atual) in dias_com_abono:
                         continue
-                    escala_info = FuncionarioEscala.objects.filter(
-                        funcionario=funcionario, data_inicio__lte=data_atual
-                    ).filter(Q(data_fim__gte=data_atual) | Q(data_fim__isnull=True)).first()
-                    if escala_info:
-                        dia_da_semana = data_atual.weekday()
-                        if str(dia_da_semana) in escala_info.escala.dias_semana.split(","):
+                    jornada = jornadas.get((funcionario.id, data_atual))
+                    if jornada is not None:
+                        if jornada.dia_de_trabalho and not jornada.marcacoes:
                             faltas += 1
+                        continue
+                    if dias_com_registro is None:
+                        dias_com_registro = {
+                            (funcionario_id, momento.astimezone(current_timezone).date())
+                            for funcionario_id, momento in RegistroPonto.objects.filter(
+                                funcionario__in=equipe,
+                                timestamp__date__range=(data_inicio, data_fim),
+                            ).values_list('funcionario_id', 'timestamp')
+                        }
+                    if (funcionario.id, data_atual) in dias_com_registro:
+                        continue
+                    escala_info = escalas.vinculo_em(funcionario, data_atual)
+                    if escala_info and eh_dia_de_trabalho(escala_info.escala, data_atual):
+                        faltas += 1
                 relatorio_data.append({
                     'funcionario': funcionario,
                     'horas_extras_minutos': horas_extras_minutos,
@@ -781,20 +995,35 @@ def logout_view(request):
 
 @login_required
 def aprovar_solicitacao_horario(request, pk):
-    solicitacao = get_object_or_404(SolicitacaoHorario, pk=pk)
-    user = request.user
-    
-    is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-    is_supervisor_direto = hasattr(user, 'funcionario') and solicitacao.funcionario.supervisor == user.funcionario
-
-    if is_analista_rh or is_supervisor_direto:
-        solicitacao.status = "APROVADO"
-        solicitacao.analisado_por = user.funcionario
-        solicitacao.data_analise = timezone.now()
-        solicitacao.save()
-        messages.success(request, "A solicitação foi aprovada com sucesso.")
-    else:
-        messages.error(request, "Você não tem permissão para aprovar esta solicitação.")
+    with transaction.atomic():
+        # Travada: um segundo clique espera este terminar e já a encontra
+        # analisada.
+        solicitacao = get_object_or_404(SolicitacaoHorario.objects.select_for_update(), pk=pk)
+        aut = autorizacao(request)
+
+        if not aut.pode_gerir(solicitacao.funcionario_id):
+            messages.error(request, "Você não tem permissão para aprovar esta solicitação.")
+        elif solicitacao.status != "PENDENTE":
+            messages.warning(request, "Esta solicitação já foi analisada.")
+        else:
+            solicitacao.status = "APROVADO"
+            solicitacao.analisado_por_id = aut.funcionario_id
+            solicitacao.data_analise = timezone.now()
+            solicitacao.save()
+            if solicitacao.tipo_ponto:
+                # Batida feita sem conexão e reenviada tarde: aprovada, é
+                # gravada no horário original, com as regras das demais.
+                (resultado,) = registrar_lote(
+                    [(solicitacao.funcionario_id, solicitacao.tipo_ponto, solicitacao.data_hora_ponto)],
+                    origem="SOLICITACAO",
+                )
+                if resultado.situacao == "recusada":
+                    transaction.set_rollback(True)
+                    messages.error(
+                        request, f"A batida não pôde ser gravada: {resultado.mensagem}"
+                    )
+                    return redirect("funcionarios:supervisor_dashboard")
+            messages.success(request, "A solicitação foi aprovada com sucesso.")
 
     return redirect("funcionarios:supervisor_dashboard")
 
@@ -802,14 +1031,11 @@ def aprovar_solicitacao_horario(request, pk):
 @login_required
 def recusar_solicitacao_horario(request, pk):
     solicitacao = get_object_or_404(SolicitacaoHorario, pk=pk)
-    user = request.user
-
-    is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-    is_supervisor_direto = hasattr(user, 'funcionario') and solicitacao.funcionario.supervisor == user.funcionario
+    aut = autorizacao(request)
 
-    if is_analista_rh or is_supervisor_direto:
+    if aut.pode_gerir(solicitacao.funcionario_id):
         solicitacao.status = "RECUSADO"
-        solicitacao.analisado_por = user.funcionario
+        solicitacao.analisado_por_id = aut.funcionario_id
         solicitacao.data_analise = timezone.now()
         solicitacao.save()
         messages.success(request, "A solicitação foi recusada.")
@@ -822,14 +1048,11 @@ def recusar_solicitacao_horario(request, pk):
 @login_required
 def aprovar_solicitacao_abono(request, pk):
     solicitacao = get_object_or_404(SolicitacaoAbono, pk=pk)
-    user = request.user
-
-    is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-    is_supervisor_direto = hasattr(user, 'funcionario') and solicitacao.funcionario.supervisor == user.funcionario
+    aut = autorizacao(request)
 
-    if is_analista_rh or is_supervisor_direto:
+    if aut.pode_gerir(solicitacao.funcionario_id):
         solicitacao.status = "APROVADO"
-        solicitacao.analisado_por = user.funcionario
+        solicitacao.analisado_por_id = aut.funcionario_id
         solicitacao.data_analise = timezone.now()
         solicitacao.save()
 
@@ -843,14 +1066,11 @@ def aprovar_solicitacao_abono(request, pk):
 @login_required
 def recusar_solicitacao_abono(request, pk):
     solicitacao = get_object_or_404(SolicitacaoAbono, pk=pk)
-    user = request.user
-
-    is_analista_rh = user.groups.filter(name='Analista de RH').exists()
-    is_supervisor_direto = hasattr(user, 'funcionario') and solicitacao.funcionario.supervisor == user.funcionario
+    aut = autorizacao(request)
 
-    if is_analista_rh or is_supervisor_direto:
+    if aut.pode_gerir(solicitacao.funcionario_id):
         solicitacao.status = "RECUSADO"
-        solicitacao.analisado_por = user.funcionario
+        solicitacao.analisado_por_id = aut.funcionario_id
         solicitacao.data_analise = timezone.now()
         solicitacao.save()
         messages.success(request, "A solicitação de abono foi recusada.")
@@ -3,4 +3,4 @@
 # As variáveis de ambiente, o diretório de trabalho e o PATH do python
 # já são configurados diretamente no Dockerfile e no docker-compose.
 # O script agora apenas executa o comando de gerenciamento.
-python3 /app/manage.py processar_pontos
\ No newline at end of file
+python3 /app/manage.py processar_pontos --incremental
\ No newline at end of file